@@ -0,0 +1,17 @@
+"""
+	File name: backoff.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Exponential backoff with full jitter, used between reconnection attempts.
+"""
+import random
+
+
+def backoff_delay(attempt, base, cap, rnd=random.random):
+	"""
+	:param attempt: 0 for the first retry
+	:param base: delay of the first retry, in seconds
+	:param cap: max delay, in seconds
+	:return: random delay in [0, min(cap, base * 2^attempt)]
+	"""
+	return rnd() * min(cap, base * (2 ** attempt))
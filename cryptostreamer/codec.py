@@ -0,0 +1,123 @@
+"""
+	File name: codec.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	JSON codecs used to decode the received frames and encode the
+	published records. The fastest available backend is selected,
+	unless CRYPTO_STREAMER_JSON_CODEC is set (orjson, ujson, json).
+"""
+import json
+import re
+from os import getenv
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+try:
+	import ujson
+except ImportError:
+	ujson = None
+
+
+CODEC_ENV = 'CRYPTO_STREAMER_JSON_CODEC'
+CODEC_AUTO = 'auto'
+
+
+class UnknownCodecError(Exception): pass
+
+
+class Codec(object):
+	"""
+	loads accepts str or bytes, dumps always returns bytes.
+	"""
+	__slots__ = ('name', 'loads', 'dumps')
+
+	def __init__(self, name, loads, dumps):
+		self.name = name
+		self.loads = loads
+		self.dumps = dumps
+
+	def __repr__(self):
+		return "Codec(%s)" % self.name
+
+
+def _json_dumps(v): return json.dumps(v).encode('utf-8')
+def _ujson_dumps(v): return ujson.dumps(v).encode('utf-8')
+
+
+def _build_codecs():
+	codecs = {}
+	if orjson is not None: codecs['orjson'] = Codec('orjson', orjson.loads, orjson.dumps)
+	if ujson is not None: codecs['ujson'] = Codec('ujson', ujson.loads, _ujson_dumps)
+	codecs['json'] = Codec('json', json.loads, _json_dumps)
+	return codecs
+
+
+CODECS = _build_codecs()
+PREFERENCE = ('orjson', 'ujson', 'json')
+
+
+def available_codecs():
+	return [name for name in PREFERENCE if name in CODECS]
+
+
+def get_codec(name=None):
+	"""
+	:param name: codec name, 'auto' or None. If None the environment
+		variable CRYPTO_STREAMER_JSON_CODEC is used.
+	:return: Codec
+	"""
+	if name is None: name = getenv(CODEC_ENV, CODEC_AUTO)
+	name = name.strip().lower()
+	if name == CODEC_AUTO: return CODECS[available_codecs()[0]]
+	if name not in CODECS: raise UnknownCodecError(name)
+	return CODECS[name]
+
+
+
+_PEEK_PATTERNS = {}
+
+def _peek_patterns(field):
+	patterns = _PEEK_PATTERNS.get(field)
+	if patterns is None:
+		pattern = r'"%s"\s*:\s*"([^"]*)"' % re.escape(field)
+		patterns = (re.compile(pattern), re.compile(pattern.encode('utf-8')))
+		_PEEK_PATTERNS[field] = patterns
+	return patterns
+
+
+def peek_field(data, field):
+	"""
+	Reads the string value of a field without decoding the whole frame.
+	The first occurrence is returned, so it's meant for the top level
+	fields that GDAX puts at the beginning of the messages (type, product_id).
+
+	:param data: str or bytes frame
+	:return: str, None if not found
+	"""
+	str_pattern, bytes_pattern = _peek_patterns(field)
+	if data.__class__ is bytes:
+		m = bytes_pattern.search(data)
+		return m.group(1).decode('utf-8') if m else None
+	m = str_pattern.search(data)
+	return m.group(1) if m else None
+
+
+
+_PEEK_NUMBER_PATTERNS = {}
+
+def peek_int(data, field):
+	"""
+	Like peek_field, for the integer fields (sequence, trade_id).
+
+	:return: int, None if not found
+	"""
+	patterns = _PEEK_NUMBER_PATTERNS.get(field)
+	if patterns is None:
+		pattern = r'"%s"\s*:\s*(-?\d+)' % re.escape(field)
+		patterns = (re.compile(pattern), re.compile(pattern.encode('utf-8')))
+		_PEEK_NUMBER_PATTERNS[field] = patterns
+	m = (patterns[1] if data.__class__ is bytes else patterns[0]).search(data)
+	return int(m.group(1)) if m else None
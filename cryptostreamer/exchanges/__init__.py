@@ -0,0 +1,16 @@
+from cryptostreamer.exchanges.base import Trade, ExchangeAdapter, ExchangeClient, \
+	UnknownExchangeError, run_providers
+from cryptostreamer.exchanges.gdax import GdaxAdapter
+from cryptostreamer.exchanges.bitstamp import BitstampAdapter
+
+
+ADAPTERS = {
+	GdaxAdapter.name: GdaxAdapter,
+	BitstampAdapter.name: BitstampAdapter
+}
+
+
+def create_adapter(name):
+	adapter = ADAPTERS.get(name)
+	if adapter is None: raise UnknownExchangeError(name)
+	return adapter()
@@ -0,0 +1,152 @@
+"""
+	File name: exchanges/base.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Exchange adapters on top of the websocket transport core: an adapter
+	knows the url, the subscription format and how to normalize the
+	exchange messages into Trade records. ExchangeClient runs one adapter,
+	run_providers runs several clients concurrently.
+"""
+from threading import Thread
+
+from cryptostreamer.transport import WebsocketClient
+from cryptostreamer.gdax.messages import Record
+
+from cryptostreamer import get_logger
+LOGGER = get_logger('ExchangeClient')
+
+
+class UnknownExchangeError(Exception): pass
+
+
+class Trade(Record):
+	"""
+	Normalized trade of any exchange. side is the taker (aggressor)
+	side, 'buy' or 'sell', time_ns the exchange time in ns since epoch.
+	"""
+	__slots__ = ('exchange', 'product_id', 'trade_id', 'price', 'size', 'side', 'time_ns')
+
+	def __init__(self, exchange, product_id, trade_id, price, size, side, time_ns):
+		self.exchange = exchange
+		self.product_id = product_id
+		self.trade_id = trade_id
+		self.price = price
+		self.size = size
+		self.side = side
+		self.time_ns = time_ns
+
+
+
+class ExchangeAdapter(object):
+	name = None
+	url = None
+	default_channels = ()
+
+	def subscription_messages(self, products, channels):
+		"""
+		:param products: product ids in the BASE-QUOTE form, i.e. BTC-USD
+		:return: list of str sent once connected
+		"""
+		raise NotImplementedError()
+
+	def normalize(self, msg):
+		"""
+		:param msg: decoded exchange message
+		:return: Trade, None if msg is not a trade
+		"""
+		raise NotImplementedError()
+
+
+
+class ExchangeClient(WebsocketClient):
+
+	@classmethod
+	def create_with_environment(cls,exchange,**overrides):
+		"""
+		Reads CRYPTO_STREAMER_<EXCHANGE>_PRODUCTS, _CHANNELS, _TIMEOUT,
+		_BUFFER_SIZE, _RECONNECT, _PING_INTERVAL and _HEARTBEAT_TIMEOUT.
+		"""
+		from cryptostreamer.exchanges import create_adapter
+		prefix = 'CRYPTO_STREAMER_%s_' % exchange.upper()
+		kwargs = {
+			'products': cls.get_list_from_env(prefix + 'PRODUCTS'),
+			'channels': cls.get_list_from_env(prefix + 'CHANNELS'),
+			'timeout': cls.get_int_from_env(prefix + 'TIMEOUT'),
+			'buffer_size': cls.get_int_from_env(prefix + 'BUFFER_SIZE'),
+			'reconnect': cls.get_boolean_from_env(prefix + 'RECONNECT'),
+			'ping_interval': cls.get_float_from_env(prefix + 'PING_INTERVAL'),
+			'heartbeat_timeout': cls.get_float_from_env(prefix + 'HEARTBEAT_TIMEOUT')
+		}
+		kwargs = {k: v for k,v in kwargs.items() if v is not None}
+		kwargs.update(overrides)
+		return cls(create_adapter(exchange),**kwargs)
+
+
+	def __init__(self,adapter,products=[],channels=None,**transport_kwargs):
+		"""
+		:param adapter: ExchangeAdapter
+		:param channels: exchange channels, adapter.default_channels by default
+		:param transport_kwargs: see WebsocketClient
+		"""
+		WebsocketClient.__init__(self,adapter.url,**transport_kwargs)
+		self.adapter = adapter
+		self._products = products
+		self._channels = channels or list(adapter.default_channels)
+		self._trades_count = 0
+
+
+	def stats(self):
+		stats = WebsocketClient.stats(self)
+		stats['trades'] = self._trades_count
+		return stats
+
+
+	def on_trade(self,trade):
+		"""
+		Called with each normalized trade.
+		:param trade: Trade
+		"""
+		pass
+
+
+	def _subscription_messages(self):
+		return self.adapter.subscription_messages(self._products,self._channels)
+
+
+	def _handle_message(self,msg):
+		self.on_message(msg)
+		trade = self.adapter.normalize(msg)
+		if trade is None: return
+		self._trades_count += 1
+		self.on_trade(trade)
+
+
+
+def run_providers(clients):
+	"""
+	Runs the clients concurrently, each in its own thread, until all of
+	them end. The error of a client doesn't stop the others.
+
+	:param clients: list of ProviderClient
+	:return: dict client -> exception, for the clients ended by an error
+	"""
+	errors = {}
+
+	def run(client):
+		try:
+			client.start()
+		except Exception as e:
+			LOGGER.error("%s ended: %s", type(client).__name__, e)
+			errors[client] = e
+
+	threads = [Thread(target=run, args=(c,), name='Provider-%d' % i) for i, c in enumerate(clients)]
+	for t in threads:
+		t.daemon = True
+		t.start()
+	try:
+		for t in threads:
+			while t.is_alive(): t.join(0.5)
+	except KeyboardInterrupt:
+		for c in clients: c.stop()
+		raise
+	return errors
@@ -0,0 +1,47 @@
+"""
+	File name: exchanges/bitstamp.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Bitstamp websocket API v2, live_trades channels.
+"""
+import json
+
+from cryptostreamer.exchanges.base import ExchangeAdapter, Trade
+
+
+BITSTAMP_WSS_URL = 'wss://ws.bitstamp.net'
+TRADES_CHANNEL = 'live_trades'
+SIDES = ('buy', 'sell')
+
+
+def pair(product_id):
+	""" BTC-USD -> btcusd """
+	return product_id.replace('-', '').lower()
+
+
+class BitstampAdapter(ExchangeAdapter):
+	name = 'bitstamp'
+	url = BITSTAMP_WSS_URL
+	default_channels = (TRADES_CHANNEL,)
+
+	def __init__(self):
+		self._products = {}
+
+	def subscription_messages(self, products, channels):
+		messages = []
+		for product_id in products:
+			self._products[pair(product_id)] = product_id
+			for channel in channels:
+				messages.append(json.dumps({
+					'event': 'bts:subscribe',
+					'data': {'channel': '%s_%s' % (channel, pair(product_id))}
+				}))
+		return messages
+
+	def normalize(self, msg):
+		if msg.get('event') != 'trade': return None
+		data = msg['data']
+		p = msg['channel'][len(TRADES_CHANNEL) + 1:]
+		return Trade(self.name, self._products.get(p, p), data.get('id'), float(data['price']),
+					 float(data['amount']), SIDES[data.get('type', 0)],
+					 int(data['microtimestamp']) * 1000)
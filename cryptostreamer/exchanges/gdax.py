@@ -0,0 +1,29 @@
+"""
+	File name: exchanges/gdax.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+"""
+import json
+
+from cryptostreamer.exchanges.base import ExchangeAdapter, Trade
+from cryptostreamer.gdax.client import GDAX_WSS_URL
+from cryptostreamer.gdax.messages import parse_time_ns
+
+
+class GdaxAdapter(ExchangeAdapter):
+	name = 'gdax'
+	url = GDAX_WSS_URL
+	default_channels = ('matches',)
+
+	def subscription_messages(self, products, channels):
+		return [json.dumps({
+			'type': 'subscribe',
+			'product_ids': list(set(products)),
+			'channels': list(set(list(channels) + ['heartbeat']))
+		})]
+
+	def normalize(self, msg):
+		if msg.get('type') != 'match': return None
+		# the side of a GDAX match is the maker side
+		side = 'buy' if msg.get('side') == 'sell' else 'sell'
+		return Trade(self.name, msg['product_id'], msg.get('trade_id'), float(msg['price']),
+					 float(msg['size']), side, parse_time_ns(msg['time']))
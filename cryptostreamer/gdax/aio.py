@@ -0,0 +1,291 @@
+"""
+	File name: gdax/aio.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Asyncio implementation of the GDAX client.
+	Many feeds (and their Kafka sink) can run on a single event loop.
+"""
+
+import asyncio
+
+from .client import GdaxClient, GDAX_WSS_URL, DEFAULT_WS_TIMEOUT, DEFAULT_GAP_THRESHOLD
+from .filters import create_filter
+from cryptostreamer.kafka_config import aiokafka_config
+
+try:
+	import websockets
+except ImportError:
+	websockets = None
+
+try:
+	from aiokafka import AIOKafkaProducer
+except ImportError:
+	AIOKafkaProducer = None
+
+from cryptostreamer import get_logger
+LOGGER = get_logger('AsyncGdaxClient')
+
+
+PING_INTERVAL = 10
+
+
+class MissingDependencyError(Exception): pass
+
+
+async def websocket_connect(url,timeout=DEFAULT_WS_TIMEOUT):
+	if websockets is None: raise MissingDependencyError("websockets is not installed")
+	return await websockets.connect(
+		url, open_timeout=timeout,
+		ping_interval=PING_INTERVAL, ping_timeout=timeout)
+
+
+async def run_clients(clients):
+	"""
+	Runs all the clients concurrently on the running event loop.
+
+	:param clients: list of AsyncGdaxClient
+	:return: list of the start() results
+	"""
+	return await asyncio.gather(*[c.start() for c in clients])
+
+
+class AsyncGdaxClient(GdaxClient):
+	"""
+	Same interface of GdaxClient, but start/stop and all the callbacks
+	are coroutines.
+	The keepalive pings are sent by the websocket library.
+	"""
+
+	def __init__(self,products=[],channels=['matches'],timeout=30,url=GDAX_WSS_URL,
+				 codec=None,typed_messages=False,sequence_check=False,
+				 gap_threshold=DEFAULT_GAP_THRESHOLD,metrics=None):
+		"""
+		See GdaxClient for sequence_check, gap_threshold and metrics.
+		"""
+		GdaxClient.__init__(self,products,channels,timeout,codec=codec,typed_messages=typed_messages,
+							sequence_check=sequence_check,gap_threshold=gap_threshold,metrics=metrics)
+		self._create_connection = websocket_connect
+		self._url = url
+		self._ws = None
+
+
+	async def start(self):
+		self._stopping = False
+		await self.on_setup()
+		await self._connect()
+		await self._subscribe()
+		return await self._mainloop()
+
+
+	async def stop(self):
+		LOGGER.info("stop")
+		try:
+			self._stopping = True
+			self._mainloop_running = False
+			await self._disconnect()
+		except: pass
+
+
+	async def on_setup(self): pass
+
+	async def on_message(self, msg): pass
+
+	async def on_heartbeat(self,heartbeat_msg): pass
+
+	async def on_last_match(self,last_match): pass
+
+	async def on_subscriptions(self,subscriptions_msg): pass
+
+	async def on_match(self,match_msg): pass
+
+	async def on_snapshot(self,snapshot_msg): pass
+
+	async def on_l2update(self,l2update_msg): pass
+
+	async def on_sequence_gap(self,product_id,missing):
+		LOGGER.warning("%s: %d messages missing, resubscribing", product_id, missing)
+		await self._resubscribe(product_id)
+
+	async def on_connected(self): pass
+
+	async def on_disconnected(self): pass
+
+	async def on_connection_error(self,e):
+		LOGGER.error(e)
+		raise e
+
+
+
+	async def _connect(self):
+		self._ws = await self._create_connection(self._url, timeout=self._timeout)
+		await self.on_connected()
+
+
+	async def _disconnect(self):
+		LOGGER.info("_disconnect")
+		ws, self._ws = self._ws, None
+		await ws.close()
+		await self.on_disconnected()
+
+
+	async def _subscribe(self):
+		try:
+			subscription_msg = self._subscription_message()
+			LOGGER.info("send: %s", subscription_msg)
+			await self._ws.send(subscription_msg)
+		except Exception as e:
+			return await self.on_connection_error(e)
+
+
+	async def _resubscribe(self,product_id):
+		try:
+			for message in self._resubscription_messages(product_id): await self._ws.send(message)
+			self._on_resubscribed(product_id)
+		except Exception as e:
+			return await self.on_connection_error(e)
+
+
+	async def _handle_message(self,msg):
+		msg_type = msg.get('type')
+		self._count_message(msg_type,msg)
+		if self._sequences is not None and not await self._check_sequence(msg_type,msg): return
+		await self.on_message(msg)
+
+		callback_name = self.MESSAGE_HANDLERS.get(msg_type)
+		if callback_name is None: return
+		if self._typed_messages:
+			record_type = self.MESSAGE_RECORDS.get(msg_type)
+			if record_type is not None: msg = record_type.from_dict(msg)
+		await getattr(self,callback_name)(msg)
+
+
+	async def _check_sequence(self,msg_type,msg):
+		missing = self._missing_messages(msg_type,msg)
+		if missing > self._gap_threshold:
+			await self.on_sequence_gap(msg.get('product_id'), missing)
+		return missing >= 0
+
+
+	async def _mainloop(self):
+		self._mainloop_running = True
+		while self._mainloop_running:
+			await self._mainloop_recv_msg()
+
+
+	async def _mainloop_recv_msg(self):
+		try:
+			data = await asyncio.wait_for(self._ws.recv(), self._timeout)
+		except Exception as e:
+			if self._stopping: return
+			return await self.on_connection_error(e)
+
+		await self._process_frame(data)
+
+
+	async def _process_frame(self,data):
+		self._messages_count += 1
+		msg = self._codec.loads(data)
+		await self._handle_message(msg)
+
+
+
+class AsyncGdaxKafkaProducer(AsyncGdaxClient):
+	"""
+	Streams the GDAX messages into Kafka with aiokafka.
+	A started AIOKafkaProducer can be shared by many clients running
+	on the same loop, in this case it's not stopped by the client.
+	"""
+
+	def __init__(self,kafka_topic='gdax',gdax_kwargs={},kafka_kwargs={},
+				 matches_only=False,kafka_producer=None,filter_config=None):
+		"""
+		:param kafka_kwargs: AIOKafkaProducer kwargs, with the preset and tuning
+			settings of the KafkaProducer, see kafka_config
+		:param filter_config: published types, products, thresholds and fields,
+			see gdax.filters
+		"""
+		self._kafka_topic = kafka_topic
+		self._matches_only = matches_only
+		self._filter = create_filter(filter_config,matches_only)
+		self._kafka_kwargs = kafka_kwargs
+		self._kafka_producer = kafka_producer
+		self._owns_kafka_producer = kafka_producer is None
+		self._send_error = None
+		self._send_errors = 0
+		AsyncGdaxClient.__init__(self,**gdax_kwargs)
+
+
+	async def on_setup(self):
+		if self._kafka_producer is None:
+			self._kafka_producer = self._get_kafka_producer()
+			await self._kafka_producer.start()
+
+
+	async def on_disconnected(self):
+		if self._owns_kafka_producer and self._kafka_producer is not None:
+			await self._kafka_producer.stop()
+			self._kafka_producer = None
+
+
+	async def on_message(self, msg):
+		if not self._filter.accepts(msg): return
+		await self._send_to_kafka(msg)
+
+
+	def stats(self):
+		stats = AsyncGdaxClient.stats(self)
+		stats['kafka_send_errors'] = self._send_errors
+		return stats
+
+
+	async def _send_to_kafka(self,msg):
+		"""
+		send() only appends the record to the producer batch, the
+		acknowledgement is not awaited here. A failed delivery is
+		reported to on_error on the next send, or raised by the mainloop.
+		"""
+		msg = self._filter.project(msg)
+		try:
+			self._raise_send_error()
+			future = await self._kafka_producer.send(
+				self._kafka_topic,
+				key=msg['product_id'],value=msg)
+			future.add_done_callback(self._on_delivery)
+		except Exception as e:
+			await self.on_error(e)
+
+
+	def _on_delivery(self,future):
+		if future.cancelled(): return
+		e = future.exception()
+		if e is None: return
+		LOGGER.error("kafka send failed: %s", e)
+		self._send_errors += 1
+		if self._send_error is None: self._send_error = e
+
+
+	def _raise_send_error(self):
+		e = self._send_error
+		if e is None: return
+		self._send_error = None
+		raise e
+
+
+	async def _mainloop(self):
+		await AsyncGdaxClient._mainloop(self)
+		self._raise_send_error()
+
+
+	async def on_error(self,e):
+		await self.stop()
+		raise e
+
+
+	def _get_kafka_producer(self):
+		if AIOKafkaProducer is None: raise MissingDependencyError("aiokafka is not installed")
+		kwargs = aiokafka_config(self._kafka_kwargs)
+		if 'bootstrap_servers' in kwargs and isinstance(kwargs['bootstrap_servers'], list):
+			kwargs['bootstrap_servers'] = ','.join(kwargs['bootstrap_servers'])
+		kwargs['key_serializer'] = str.encode
+		kwargs['value_serializer'] = self._codec.dumps
+		return AIOKafkaProducer(**kwargs)
@@ -0,0 +1,137 @@
+"""
+	File name: gdax/candles.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Streaming OHLCV candles over the match messages.
+	Each trade updates the open candle of each interval in O(1); a
+	candle is closed and emitted when a trade (or a heartbeat, see
+	advance) of a later interval arrives for the same product.
+"""
+from cryptostreamer.gdax.messages import Record, parse_time_ns
+
+
+NS = 1000000000
+DEFAULT_INTERVALS = (1, 60, 300)
+
+
+class Candle(Record):
+	"""
+	start is the interval start in seconds since epoch, notional is
+	the sum of price * size, so that vwap = notional / volume.
+	"""
+	__slots__ = ('product_id', 'interval', 'start', 'open', 'high', 'low', 'close',
+				 'volume', 'notional', 'count')
+
+	def __init__(self, product_id, interval, start, price, size):
+		self.product_id = product_id
+		self.interval = interval
+		self.start = start
+		self.open = self.high = self.low = self.close = price
+		self.volume = size
+		self.notional = price * size
+		self.count = 1
+
+	@property
+	def vwap(self):
+		return self.notional / self.volume if self.volume else self.close
+
+	def add(self, price, size):
+		if price > self.high: self.high = price
+		elif price < self.low: self.low = price
+		self.close = price
+		self.volume += size
+		self.notional += price * size
+		self.count += 1
+
+	def to_dict(self):
+		d = Record.to_dict(self)
+		d['vwap'] = self.vwap
+		return d
+
+
+class CandleAggregator(object):
+
+	def __init__(self, intervals=DEFAULT_INTERVALS, on_candle=None):
+		"""
+		:param intervals: candle intervals in seconds
+		:param on_candle: callback called with each closed Candle
+		"""
+		self._intervals = tuple(sorted(set(intervals)))
+		self._intervals_ns = tuple(i * NS for i in self._intervals)
+		self._on_candle = on_candle or (lambda candle: None)
+		self._open = {}
+		self.emitted = 0
+		self.late_trades = 0
+
+
+	@property
+	def intervals(self):
+		return self._intervals
+
+
+	def add_match(self, match):
+		"""
+		:param match: match dict or messages.Match record
+		"""
+		if isinstance(match, dict):
+			self.add_trade(match['product_id'], parse_time_ns(match['time']),
+						   float(match['price']), float(match['size']))
+		else:
+			self.add_trade(match.product_id, parse_time_ns(match.time), match.price, match.size)
+
+
+	def add_trade(self, product_id, time_ns, price, size):
+		candles = self._open.get(product_id)
+		if candles is None:
+			candles = self._open[product_id] = [None] * len(self._intervals)
+
+		for i, interval_ns in enumerate(self._intervals_ns):
+			start = time_ns - time_ns % interval_ns
+			candle = candles[i]
+			if candle is not None:
+				candle_start = candle.start * NS
+				if start == candle_start:
+					candle.add(price, size)
+					continue
+				if start < candle_start:
+					if i == 0: self.late_trades += 1
+					continue
+				self._emit(candle)
+			candles[i] = Candle(product_id, self._intervals[i], start // NS, price, size)
+
+
+	def advance(self, product_id, time_ns):
+		"""
+		Closes the candles of the product ended before time_ns, i.e. with
+		the time of a heartbeat, so quiet products don't keep them open.
+		"""
+		candles = self._open.get(product_id)
+		if candles is None: return
+		for i, interval_ns in enumerate(self._intervals_ns):
+			candle = candles[i]
+			if candle is not None and (candle.start * NS) + interval_ns <= time_ns:
+				self._emit(candle)
+				candles[i] = None
+
+
+	def flush(self, time_ns=None):
+		"""
+		Closes the candles ended before time_ns for all the products,
+		all the open candles if time_ns is None.
+		"""
+		for product_id, candles in self._open.items():
+			if time_ns is not None:
+				self.advance(product_id, time_ns)
+				continue
+			for i, candle in enumerate(candles):
+				if candle is not None: self._emit(candle)
+				candles[i] = None
+
+
+	def _emit(self, candle):
+		self.emitted += 1
+		self._on_candle(candle)
+
+
+	def stats(self):
+		return {'candles_emitted': self.emitted, 'candles_late_trades': self.late_trades}
@@ -0,0 +1,208 @@
+"""
+	File name: gdax/capture.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Columnar capture of the matches to disk, for backtesting.
+	The matches of each product are accumulated in typed columns and
+	written to a file when the batch reaches max_rows or spans more than
+	max_seconds (of exchange time). Each file is listed in the index with
+	its time range, so a reader loads only the files it needs, each with
+	a few array.frombytes calls instead of parsing json lines. The files
+	are named <product_id>-<first time ns>-<sequence>.col, the sequence
+	of the product goes on from the index when the capture is restarted.
+
+	File layout (little-endian):
+		<magic 4s><version u8><rows u32><product_id length u16><product_id>
+		time int64 ns [rows] | price float64 [rows] | size float64 [rows]
+		side int8 [rows] (0 buy, 1 sell) | trade_id int64 [rows]
+"""
+import os
+import sys
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+
+from cryptostreamer.gdax.messages import parse_time_ns
+from cryptostreamer.gdax.candles import NS
+
+
+MAGIC = b'CSMC'
+VERSION = 1
+HEADER = struct.Struct('<4sBIH')
+INDEX_FILE = 'index.csv'
+SIDES = ('buy', 'sell')
+COLUMNS = (('time', 'q'), ('price', 'd'), ('size', 'd'), ('side', 'b'), ('trade_id', 'q'))
+
+DEFAULT_MAX_ROWS = 100000
+DEFAULT_MAX_SECONDS = 3600
+
+
+class InvalidCaptureFileError(Exception): pass
+
+
+def _columns():
+	return {name: array(typecode) for name, typecode in COLUMNS}
+
+
+class MatchCapture(object):
+
+	def __init__(self, directory, max_rows=DEFAULT_MAX_ROWS, max_seconds=DEFAULT_MAX_SECONDS):
+		"""
+		:param directory: where the column files and the index are written
+		:param max_rows: max matches per file
+		:param max_seconds: max time range of a file, in seconds
+		"""
+		self._dir = directory
+		self._max_rows = max_rows or DEFAULT_MAX_ROWS
+		self._max_ns = int((max_seconds or DEFAULT_MAX_SECONDS) * NS)
+		self._batches = {}
+		self.rows = 0
+		self.files = 0
+		if not os.path.isdir(directory): os.makedirs(directory)
+		self._sequences = {}
+		for entry in CaptureReader(directory).index():
+			self._sequences[entry[1]] = self._sequences.get(entry[1], 0) + 1
+
+
+	def add_match(self, match):
+		"""
+		:param match: match dict
+		"""
+		self.add_trade(match['product_id'], parse_time_ns(match['time']), float(match['price']),
+					   float(match['size']), match.get('side'), match.get('trade_id') or 0)
+
+
+	def add_trade(self, product_id, time_ns, price, size, side, trade_id):
+		columns = self._batches.get(product_id)
+		if columns is None:
+			columns = self._batches[product_id] = _columns()
+		elif time_ns - columns['time'][0] >= self._max_ns:
+			self._write(product_id, columns)
+			columns = self._batches[product_id] = _columns()
+
+		columns['time'].append(time_ns)
+		columns['price'].append(price)
+		columns['size'].append(size)
+		columns['side'].append(0 if side == 'buy' else 1)
+		columns['trade_id'].append(trade_id)
+		self.rows += 1
+		if len(columns['time']) >= self._max_rows:
+			self._write(product_id, columns)
+			del self._batches[product_id]
+
+
+	def advance(self, product_id, time_ns):
+		"""
+		Writes the batch of the product if older than max_seconds at
+		time_ns, i.e. the time of a heartbeat.
+		"""
+		columns = self._batches.get(product_id)
+		if columns is not None and time_ns - columns['time'][0] >= self._max_ns:
+			self._write(product_id, columns)
+			del self._batches[product_id]
+
+
+	def flush(self):
+		"""
+		Writes all the pending batches.
+		"""
+		for product_id, columns in self._batches.items(): self._write(product_id, columns)
+		self._batches = {}
+
+
+	def stats(self):
+		return {'capture_rows': self.rows, 'capture_files': self.files}
+
+
+	def _write(self, product_id, columns):
+		times = columns['time']
+		sequence = self._sequences.get(product_id, 0)
+		self._sequences[product_id] = sequence + 1
+		name = '%s-%d-%d.col' % (product_id, times[0], sequence)
+		write_columns(os.path.join(self._dir, name), product_id, columns)
+		with open(os.path.join(self._dir, INDEX_FILE), 'a') as f:
+			f.write('%s,%s,%d,%d,%d\n' % (name, product_id, len(times), min(times), max(times)))
+		self.files += 1
+
+
+
+def write_columns(path, product_id, columns):
+	product = product_id.encode('utf-8')
+	rows = len(columns['time'])
+	with open(path + '.tmp', 'wb') as f:
+		f.write(HEADER.pack(MAGIC, VERSION, rows, len(product)))
+		f.write(product)
+		for name, _ in COLUMNS:
+			column = columns[name]
+			if sys.byteorder == 'big':
+				column = array(column.typecode, column)
+				column.byteswap()
+			column.tofile(f)
+	os.replace(path + '.tmp', path)
+
+
+def read_columns(path):
+	"""
+	:return: (product_id, dict of column name -> array)
+	"""
+	with open(path, 'rb') as f:
+		magic, version, rows, product_len = HEADER.unpack(f.read(HEADER.size))
+		if magic != MAGIC or version != VERSION:
+			raise InvalidCaptureFileError(path)
+		product_id = f.read(product_len).decode('utf-8')
+		columns = {}
+		for name, typecode in COLUMNS:
+			column = array(typecode)
+			column.fromfile(f, rows)
+			if sys.byteorder == 'big': column.byteswap()
+			columns[name] = column
+	return product_id, columns
+
+
+
+class CaptureReader(object):
+	"""
+	Loads the captured matches of a product in a time range.
+	"""
+
+	def __init__(self, directory):
+		self._dir = directory
+
+
+	def index(self):
+		"""
+		:return: list of (file name, product_id, rows, start_ns, end_ns)
+		"""
+		path = os.path.join(self._dir, INDEX_FILE)
+		if not os.path.exists(path): return []
+		entries = []
+		with open(path) as f:
+			for line in f:
+				name, product_id, rows, start, end = line.rstrip('\n').split(',')
+				entries.append((name, product_id, int(rows), int(start), int(end)))
+		return entries
+
+
+	def files(self, product_id, start_ns=None, end_ns=None):
+		"""
+		:return: the files of the product overlapping [start_ns, end_ns], by start time
+		"""
+		entries = [e for e in self.index() if e[1] == product_id
+				   and (start_ns is None or e[4] >= start_ns)
+				   and (end_ns is None or e[3] <= end_ns)]
+		return [os.path.join(self._dir, e[0]) for e in sorted(entries, key=lambda e: e[3])]
+
+
+	def load(self, product_id, start_ns=None, end_ns=None):
+		"""
+		:return: dict of column name -> array, the side column is 0 for buy
+			and 1 for sell (see SIDES)
+		"""
+		result = _columns()
+		for path in self.files(product_id, start_ns, end_ns):
+			_, columns = read_columns(path)
+			times = columns['time']
+			lo = 0 if start_ns is None else bisect_left(times, start_ns)
+			hi = len(times) if end_ns is None else bisect_right(times, end_ns)
+			for name, _ in COLUMNS: result[name].extend(columns[name][lo:hi])
+		return result
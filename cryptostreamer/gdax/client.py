@@ -6,10 +6,16 @@
 """
 
 import json
-from datetime import datetime, timedelta
+from time import monotonic
 
-from websocket import create_connection
-from cryptostreamer.provider import ProviderClient
+from cryptostreamer.transport import WebsocketClient, DEFAULT_WS_TIMEOUT, DEFAULT_MAX_RETRIES, \
+	DEFAULT_BACKOFF_BASE, DEFAULT_BACKOFF_MAX, DEFAULT_PING_INTERVAL
+from cryptostreamer.ringbuffer import OVERFLOW_BLOCK
+from cryptostreamer.gdax.sequence import SequenceTracker
+from cryptostreamer.gdax.orderbook import OrderBooks
+from cryptostreamer.gdax.messages import RECORD_TYPES, parse_time_ns
+from cryptostreamer.gdax.capture import MatchCapture, DEFAULT_MAX_ROWS, DEFAULT_MAX_SECONDS
+from cryptostreamer.latency import LatencyTracker, EXCHANGE_RECV, RECV_DISPATCH
 
 
 class NoProductsError(Exception): pass
@@ -20,14 +26,47 @@ LOGGER = get_logger('GdaxClient')
 
 
 GDAX_WSS_URL = 'wss://ws-feed.gdax.com'
-DEFAULT_WS_TIMEOUT = 30
+DEFAULT_GAP_THRESHOLD = 0
 
 
-class GdaxClient(ProviderClient):
+class GdaxClient(WebsocketClient):
+
+	# message type -> name of the callback, see register_handler
+	MESSAGE_HANDLERS = {
+		'heartbeat': 'on_heartbeat',
+		'last_match': 'on_last_match',
+		'subscriptions': 'on_subscriptions',
+		'match': 'on_match',
+		'l2update': 'on_l2update',
+		'snapshot': 'on_snapshot'
+	}
+
+	# message type -> record class delivered when typed_messages is True
+	MESSAGE_RECORDS = RECORD_TYPES
+
+	# types checked by sequence_check, other channels (i.e. ticker) repeat the same ids
+	TRADE_ID_TYPES = ('match', 'last_match')
+	FULL_SEQUENCE_TYPES = ('received', 'open', 'done', 'match', 'change', 'activate')
+
+	@classmethod
+	def register_handler(cls,msg_type,callback_name,record_type=None):
+		"""
+		Dispatches the messages of msg_type to the callback_name method.
+		The registration is local to cls and its subclasses.
+
+		:param record_type: optional class with a from_dict classmethod,
+			used to build the callback argument when typed_messages is True
+		"""
+		if 'MESSAGE_HANDLERS' not in cls.__dict__:
+			cls.MESSAGE_HANDLERS = dict(cls.MESSAGE_HANDLERS)
+			cls.MESSAGE_RECORDS = dict(cls.MESSAGE_RECORDS)
+		cls.MESSAGE_HANDLERS[msg_type] = callback_name
+		if record_type is not None: cls.MESSAGE_RECORDS[msg_type] = record_type
 
 	@classmethod
-	def create_with_environment(cls):
+	def create_with_environment(cls,**overrides):
 		kwargs = cls.kwargs_from_environment()
+		kwargs.update(overrides)
 		return cls(**kwargs)
 
 	@classmethod
@@ -35,58 +74,111 @@ class GdaxClient(ProviderClient):
 		kwargs = {
 			'products': cls.get_list_from_env('CRYPTO_STREAMER_GDAX_PRODUCTS'),
 			'channels': cls.get_list_from_env('CRYPTO_STREAMER_GDAX_CHANNELS'),
-			'timeout': cls.get_int_from_env('CRYPTO_STREAMER_GDAX_TIMEOUT')
+			'timeout': cls.get_int_from_env('CRYPTO_STREAMER_GDAX_TIMEOUT'),
+			'buffer_size': cls.get_int_from_env('CRYPTO_STREAMER_GDAX_BUFFER_SIZE'),
+			'overflow_policy': cls.get_str_from_env('CRYPTO_STREAMER_GDAX_OVERFLOW_POLICY'),
+			'sequence_check': cls.get_boolean_from_env('CRYPTO_STREAMER_GDAX_SEQUENCE_CHECK'),
+			'gap_threshold': cls.get_int_from_env('CRYPTO_STREAMER_GDAX_GAP_THRESHOLD'),
+			'reconnect': cls.get_boolean_from_env('CRYPTO_STREAMER_GDAX_RECONNECT'),
+			'max_retries': cls.get_int_from_env('CRYPTO_STREAMER_GDAX_MAX_RETRIES'),
+			'backoff_base': cls.get_float_from_env('CRYPTO_STREAMER_GDAX_BACKOFF_BASE'),
+			'backoff_max': cls.get_float_from_env('CRYPTO_STREAMER_GDAX_BACKOFF_MAX'),
+			'orderbook': cls.get_boolean_from_env('CRYPTO_STREAMER_GDAX_ORDERBOOK'),
+			'typed_messages': cls.get_boolean_from_env('CRYPTO_STREAMER_GDAX_TYPED_MESSAGES'),
+			'capture_dir': cls.get_str_from_env('CRYPTO_STREAMER_GDAX_CAPTURE_DIR'),
+			'capture_max_rows': cls.get_int_from_env('CRYPTO_STREAMER_GDAX_CAPTURE_MAX_ROWS'),
+			'capture_max_seconds': cls.get_float_from_env('CRYPTO_STREAMER_GDAX_CAPTURE_MAX_SECONDS'),
+			'latency_tracking': cls.get_boolean_from_env('CRYPTO_STREAMER_GDAX_LATENCY_TRACKING'),
+			'ping_interval': cls.get_float_from_env('CRYPTO_STREAMER_GDAX_PING_INTERVAL'),
+			'heartbeat_timeout': cls.get_float_from_env('CRYPTO_STREAMER_GDAX_HEARTBEAT_TIMEOUT'),
+			'stats_interval': cls.get_float_from_env('CRYPTO_STREAMER_GDAX_STATS_INTERVAL')
 		}
 		return {k: v for k,v in kwargs.items() if v is not None}
 
 
-	def __init__(self,products=[],channels=['matches'],timeout=30):
-		self._create_connection = create_connection
+	def __init__(self,products=[],channels=['matches'],timeout=30,
+				 buffer_size=0,overflow_policy=OVERFLOW_BLOCK,codec=None,
+				 sequence_check=False,gap_threshold=DEFAULT_GAP_THRESHOLD,
+				 reconnect=False,max_retries=DEFAULT_MAX_RETRIES,
+				 backoff_base=DEFAULT_BACKOFF_BASE,backoff_max=DEFAULT_BACKOFF_MAX,
+				 orderbook=False,typed_messages=False,capture_dir=None,
+				 capture_max_rows=DEFAULT_MAX_ROWS,capture_max_seconds=DEFAULT_MAX_SECONDS,
+				 metrics=None,latency_tracking=False,ping_interval=DEFAULT_PING_INTERVAL,
+				 heartbeat_timeout=None,stats_interval=None):
+		"""
+		See WebsocketClient for buffer_size, overflow_policy, codec, reconnect,
+		max_retries, backoff_base, backoff_max, ping_interval, heartbeat_timeout
+		(subscribe the heartbeat channel, so that quiet products are not
+		considered dead) and stats_interval.
+
+		:param sequence_check: if True, gaps, duplicates and out of order
+			messages are detected per product. The trade_id is tracked on the
+			matches channel, the sequence on the full channel. Duplicates and
+			out of order messages are not dispatched.
+		:param gap_threshold: when more than gap_threshold messages are missing,
+			on_sequence_gap is called (by default it resubscribes the product)
+		:param orderbook: if True, the order books of the products are maintained
+			in self.orderbooks from the level2 channel (or the full channel, if
+			level2 is not subscribed) and on_orderbook is called on each update
+		:param typed_messages: if True, the callbacks of the types in
+			MESSAGE_RECORDS (match, last_match, heartbeat, l2update) get compact
+			records (gdax.messages) instead of dicts. on_message always gets dicts.
+		:param capture_dir: if set, the matches are captured in columnar files
+			in this directory (see gdax.capture), read with CaptureReader
+		:param capture_max_rows: max matches per capture file
+		:param capture_max_seconds: max time range of a capture file, in seconds
+		:param metrics: optional metrics.Metrics, counts the messages by type
+			and product and measures the ping round trip time
+		:param latency_tracking: if True, each frame is stamped with the
+			(monotonic) receive time and the exchange->recv and recv->dispatch
+			latencies are tracked per product in self.latency (rolling
+			percentiles, also in stats())
+		"""
+		WebsocketClient.__init__(self,GDAX_WSS_URL,timeout,buffer_size,overflow_policy,codec,
+								 reconnect,max_retries,backoff_base,backoff_max,
+								 metrics,latency_tracking,ping_interval,heartbeat_timeout,stats_interval)
 		self._products = products
 		self._channels = channels
 		if len(self._products) == 0: raise NoProductsError()
 		if len(self._channels) == 0: raise NoChannelsError()
-		self._timeout = timeout or DEFAULT_WS_TIMEOUT
-
-
-	def start(self):
-		"""
-		Websocket client connects to GDAX server to the realtime tick data.
-		Tick data is then streamed into Kafka GDAX topic.
-
-		:return: None or on_error callback return
-		"""
-		self.on_setup()
-		self._connect()
-		self._subscribe()
-		return self._mainloop()
-
+		self._resubscriptions = 0
+		self._typed_messages = typed_messages
+		self.orderbooks = None
+		if orderbook:
+			self.orderbooks = OrderBooks(full='full' in channels and 'level2' not in channels)
+		self._capture = None
+		if capture_dir is not None:
+			self._capture = MatchCapture(capture_dir, capture_max_rows, capture_max_seconds)
+		self.latency = LatencyTracker() if latency_tracking else None
+		self._dispatched_at = 0.0
+		self._gap_threshold = gap_threshold or 0
+		self._sequences = SequenceTracker() if sequence_check else None
+		if 'full' in self._channels:
+			self._sequence_field, self._heartbeat_field = 'sequence', 'sequence'
+			self._sequence_types = frozenset(self.FULL_SEQUENCE_TYPES)
+		else:
+			self._sequence_field, self._heartbeat_field = 'trade_id', 'last_trade_id'
+			self._sequence_types = frozenset(self.TRADE_ID_TYPES)
 
 
 	def stop(self):
-		LOGGER.info("stop")
-		try:
-			self._mainloop_running = False
-			self._disconnect()
-		except: pass
-
+		WebsocketClient.stop(self)
+		if self._capture is not None: self._capture.flush()
 
 
-	def on_setup(self):
+	def stats(self):
 		"""
-		Called before connecting to the provider
-		"""
-		pass
+		Counters of the client.
 
-
-
-
-	def on_message(self, msg):
-		"""
-		Callback for all the messages.
+		:return: dict
 		"""
-		LOGGER.debug("recv: %s" %msg)
-		pass
+		stats = WebsocketClient.stats(self)
+		if self._sequences is not None:
+			stats.update(self._sequences.stats())
+			stats['resubscriptions'] = self._resubscriptions
+		if self._capture is not None: stats.update(self._capture.stats())
+		if self.latency is not None: stats.update(self.latency.stats())
+		return stats
 
 
 	def on_heartbeat(self,heartbeat_msg):
@@ -119,59 +211,67 @@ class GdaxClient(ProviderClient):
 		"""
 		pass
 
-	def on_connected(self):
+	def on_sequence_gap(self,product_id,missing):
 		"""
-		Called when connected to websocket.
+		Called when more than gap_threshold messages of a product are missing.
+		By default the product is resubscribed, to get a new last_match or snapshot.
+
+		:param product_id: string
+		:param missing: number of missing messages
 		"""
-		pass
+		LOGGER.warning("%s: %d messages missing, resubscribing", product_id, missing)
+		self._resubscribe(product_id)
 
-	def on_disconnected(self):
+	def on_snapshot(self,snapshot_msg):
 		"""
-		Called when disconnected from gdax.
+		level2 channel: snapshot of the book, sent once subscribed.
+		:param snapshot_msg: dict
 		"""
 		pass
 
-
-	def on_connection_error(self,e):
+	def on_l2update(self,l2update_msg):
 		"""
-		Called when a connection error during subscription or mainloop is caught.
-		If not implemented, it raises the exception.
-
-		:param e: exception
-		:return: None, if True it reconnects automatically
+		level2 channel: changes of the book levels.
+		:param l2update_msg: dict
 		"""
-		LOGGER.error(e)
-		raise e
-
+		pass
 
+	def on_orderbook(self,orderbook):
+		"""
+		Called after the order book of a product is updated,
+		when the orderbook option is enabled.
+		:param orderbook: OrderBook
+		"""
+		pass
 
 
-	def _connect(self):
-		self._ws = self._create_connection(GDAX_WSS_URL, timeout=self._timeout)
-		self.on_connected()
+	def _resubscribe(self,product_id):
+		try:
+			for message in self._resubscription_messages(product_id): self._ws.send(message)
+			self._on_resubscribed(product_id)
+		except Exception as e:
+			return self.on_connection_error(e)
 
 
-	def _disconnect(self):
-		LOGGER.info("_disconnect")
-		self._ws.close()
-		self._ws = None
-		self.on_disconnected()
+	def _resubscription_messages(self,product_id):
+		channels = list(set(self._channels + ['heartbeat']))
+		return [json.dumps({'type': t, 'product_ids': [product_id], 'channels': channels})
+				for t in ('unsubscribe', 'subscribe')]
 
 
-	def _subscribe(self):
-		try:
-			subscription_msg = self._subscription_message()
-			heartbeat_msg = self._heartbeat_message()
+	def _on_resubscribed(self,product_id):
+		self._resubscriptions += 1
+		self._sequences.reset(product_id)
+		if self.orderbooks is not None: self.orderbooks.reset(product_id)
 
-			LOGGER.info("send: %s" % subscription_msg)
-			self._ws.send(subscription_msg)
 
-			# LOGGER.info("send: %s" % heartbeat_msg)
-			# self._ws.send(heartbeat_msg)
+	def _subscription_messages(self):
+		return [self._subscription_message()]
 
-		except Exception as e:
-			return self.on_connection_error(e)
 
+	def _on_reconnected(self):
+		if self._sequences is not None: self._sequences.reset()
+		if self.orderbooks is not None: self.orderbooks.reset()
 
 
 	def _subscription_message(self):
@@ -191,51 +291,69 @@ class GdaxClient(ProviderClient):
 		return json.dumps({"type": "heartbeat", "on": True})
 
 
-
-	def _needs_ping(self):
-		return self._pinged_at + timedelta(seconds=10) < datetime.now()
-
-
-	def _ping(self):
-		self._ws.ping('keepalive')
-		self._pinged_at = datetime.now()
-
-
-
-
 	def _handle_message(self,msg):
 		"""
 		Handles all the message and proxy them to callbacks.
 		:param msg: dict
 		"""
-		self.on_message(msg)
 		msg_type = msg.get('type')
+		self._count_message(msg_type,msg)
+		if self.latency is not None: self._track_latency(msg)
+		if self._sequences is not None and not self._check_sequence(msg_type,msg): return
+		if self.orderbooks is not None:
+			book = self.orderbooks.handle(msg_type,msg)
+			if book is not None: self.on_orderbook(book)
+		if self._capture is not None: self._capture_message(msg_type,msg)
+		self.on_message(msg)
 
-		if msg_type == 'heartbeat':         self.on_heartbeat(msg)
-		elif msg_type == 'last_match':      self.on_last_match(msg)
-		elif msg_type == 'subscriptions':   self.on_subscriptions(msg)
-		elif msg_type == 'match':           self.on_match(msg)
+		callback_name = self.MESSAGE_HANDLERS.get(msg_type)
+		if callback_name is None: return
+		if self._typed_messages:
+			record_type = self.MESSAGE_RECORDS.get(msg_type)
+			if record_type is not None: msg = record_type.from_dict(msg)
+		getattr(self,callback_name)(msg)
 
 
-	def _mainloop(self):
-		"""
-		The mainloop receives loops and gets and handles
-		the messages from GDAX.
-		It sends a ping every 30 seconds.
-		"""
-		self._mainloop_running = True
-		self._pinged_at = datetime.now()
+	def _count_message(self,msg_type,msg):
+		if self._metrics is not None: self._metrics.count_message(msg_type,msg.get('product_id'))
 
-		while self._mainloop_running:
-			self._mainloop_recv_msg()
 
+	def _track_latency(self,msg):
+		self._dispatched_at = now = monotonic()
+		product_id = msg.get('product_id')
+		if product_id is None: return
+		self.latency.observe(product_id, RECV_DISPATCH, now - self._received_at)
+		exchange_time = msg.get('time')
+		if exchange_time is not None:
+			received = self._received_at + self._wall_offset
+			self.latency.observe(product_id, EXCHANGE_RECV, received - parse_time_ns(exchange_time) / 1e9)
 
-	def _mainloop_recv_msg(self):
-		try:
-			if self._needs_ping(): self._ping()
-			data = self._ws.recv()
-		except Exception as e:
-			return self.on_connection_error(e)
 
-		msg = json.loads(data)
-		self._handle_message(msg)
+	def _capture_message(self,msg_type,msg):
+		if msg_type == 'match':
+			self._capture.add_match(msg)
+		elif msg_type == 'heartbeat' and 'time' in msg:
+			self._capture.advance(msg.get('product_id'), parse_time_ns(msg['time']))
+
+
+	def _check_sequence(self,msg_type,msg):
+		"""
+		:return: False if the message is a duplicate or out of order
+		"""
+		missing = self._missing_messages(msg_type,msg)
+		if missing > self._gap_threshold:
+			self.on_sequence_gap(msg.get('product_id'), missing)
+		return missing >= 0
+
+
+	def _missing_messages(self,msg_type,msg):
+		"""
+		:return: number of messages missing before msg, negative if msg
+			is a duplicate or out of order
+		"""
+		if msg_type == 'heartbeat':
+			return self._sequences.check(msg.get('product_id'), msg.get(self._heartbeat_field, 0))
+		if msg_type not in self._sequence_types: return 0
+		seq = msg.get(self._sequence_field)
+		if seq is None: return 0
+		return self._sequences.observe(msg.get('product_id'), seq)
@@ -0,0 +1,95 @@
+"""
+	File name: gdax/conflation.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Conflation of the messages per product and type: between two flushes
+	only the latest message of each (product_id, type) is kept, the
+	l2update changes are merged (latest size of each side and price).
+	At each flush the pending messages are emitted in order of first
+	arrival of their (product_id, type): a newer message of a pending
+	key takes the place of the older one. flush is called periodically,
+	i.e. by a timer in another thread, so each message can carry a
+	context (i.e. its receive time) that is emitted with it.
+"""
+from threading import Lock
+
+
+DEFAULT_INTERVAL = 1.0
+
+
+class Conflator(object):
+
+	def __init__(self, interval=DEFAULT_INTERVAL, on_emit=None, types=None):
+		"""
+		:param interval: seconds between two flushes
+		:param on_emit: callback called with each conflated message and its context
+		:param types: conflated message types, None for all. The other
+			types are emitted immediately.
+		"""
+		self._interval = interval
+		self._on_emit = on_emit or (lambda msg, context: None)
+		self._types = frozenset(types) if types else None
+		self._pending = {}
+		self._changes = {}
+		self._lock = Lock()
+		self.received = 0
+		self.conflated = 0
+		self.emitted = 0
+
+
+	@property
+	def interval(self):
+		return self._interval
+
+
+	def add(self, msg, context=None):
+		"""
+		:param msg: decoded message dict
+		:param context: emitted with msg, the one of the latest message of the key
+		"""
+		msg_type = msg.get('type')
+		if self._types is not None and msg_type not in self._types:
+			with self._lock:
+				self.received += 1
+				self.emitted += 1
+			return self._on_emit(msg, context)
+
+		key = (msg.get('product_id'), msg_type)
+		with self._lock:
+			self.received += 1
+			if key in self._pending: self.conflated += 1
+			if msg_type == 'l2update': self._merge_changes(key, msg)
+			self._pending[key] = (msg, context)
+
+
+	def _merge_changes(self, key, msg):
+		changes = self._changes.get(key)
+		if changes is None: changes = self._changes[key] = {}
+		for side, price, size in msg.get('changes', ()):
+			changes.pop((side, price), None)
+			changes[(side, price)] = size
+
+
+	def flush(self):
+		"""
+		Emits all the pending messages.
+		"""
+		with self._lock:
+			pending, self._pending = self._pending, {}
+			changes, self._changes = self._changes, {}
+			self.emitted += len(pending)
+		for key, (msg, context) in pending.items():
+			merged = changes.get(key)
+			if merged is not None:
+				msg = msg.copy()
+				msg['changes'] = [[side, price, size] for (side, price), size in merged.items()]
+			self._on_emit(msg, context)
+
+
+	def stats(self):
+		return {
+			'conflation_received': self.received,
+			'conflation_conflated': self.conflated,
+			'conflation_emitted': self.emitted,
+			'conflation_pending': len(self._pending)
+		}
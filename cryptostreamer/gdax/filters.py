@@ -0,0 +1,134 @@
+"""
+	File name: gdax/filters.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Declarative filter and projection of the published messages, i.e.
+
+		{"types": ["match", "ticker"], "products": ["BTC-USD"],
+		 "min_size": 0.01, "min_notional": 1000,
+		 "fields": ["type", "product_id", "time", "price", "size", "side"]}
+
+	types: published types, by default all but heartbeat and subscriptions
+	products: published products, by default all
+	min_size, min_notional: thresholds on size and price * size, checked
+		only on the messages with these fields (match, last_match)
+	fields: kept fields, by default all but drop_fields
+	drop_fields: removed fields, by default the order ids
+
+	The config is compiled once into the accepts(msg) predicate and the
+	project(msg) projector, made only of the configured checks.
+"""
+import json
+import os
+
+
+NOT_PUBLISHED_TYPES = ('heartbeat', 'subscriptions')
+DEFAULT_DROP_FIELDS = ('maker_order_id', 'taker_order_id')
+CONFIG_KEYS = ('types', 'products', 'min_size', 'min_notional', 'fields', 'drop_fields')
+
+
+class InvalidFilterError(Exception): pass
+
+
+class MessageFilter(object):
+
+	def __init__(self, types=None, products=None, min_size=None, min_notional=None,
+				 fields=None, drop_fields=DEFAULT_DROP_FIELDS):
+		"""
+		:param types: list of published types, None for all but heartbeat and subscriptions
+		:param products: list of published product ids, None for all
+		:param min_size: min size of the messages with a size
+		:param min_notional: min price * size of the messages with price and size
+		:param fields: list of kept fields, None for all
+		:param drop_fields: removed fields, when fields is None
+		"""
+		self.types = frozenset(types) if types is not None else None
+		self.products = frozenset(products) if products is not None else None
+		self.min_size = float(min_size) if min_size is not None else None
+		self.min_notional = float(min_notional) if min_notional is not None else None
+		self.fields = tuple(fields) if fields is not None else None
+		self.drop_fields = tuple(drop_fields or ())
+		self.accepts = self._compile_predicate()
+		self.project = self._compile_projector()
+
+
+	@property
+	def needs_decoding(self):
+		"""
+		True if the filter can't be evaluated on the type and product_id
+		only, or the messages are projected.
+		"""
+		return self.min_size is not None or self.min_notional is not None or self.fields is not None
+
+
+	def accepts_type(self, msg_type, product_id=None):
+		"""
+		The type and product checks only, i.e. on the fields peeked from a frame.
+		"""
+		if self.types is None:
+			if msg_type in NOT_PUBLISHED_TYPES: return False
+		elif msg_type not in self.types: return False
+		return self.products is None or product_id in self.products
+
+
+	def _compile_predicate(self):
+		types, products = self.types, self.products
+		min_size, min_notional = self.min_size, self.min_notional
+		checks = []
+		if types is None: checks.append(lambda msg: msg.get('type') not in NOT_PUBLISHED_TYPES)
+		else: checks.append(lambda msg: msg.get('type') in types)
+		if products is not None: checks.append(lambda msg: msg.get('product_id') in products)
+		if min_size is not None:
+			checks.append(lambda msg: 'size' not in msg or float(msg['size']) >= min_size)
+		if min_notional is not None:
+			checks.append(lambda msg: 'size' not in msg or 'price' not in msg
+								  or float(msg['price']) * float(msg['size']) >= min_notional)
+
+		if len(checks) == 1: return checks[0]
+		if len(checks) == 2:
+			first, second = checks
+			return lambda msg: first(msg) and second(msg)
+		checks = tuple(checks)
+		return lambda msg: all(check(msg) for check in checks)
+
+
+	def _compile_projector(self):
+		fields, drop_fields = self.fields, self.drop_fields
+		if fields is not None: return lambda msg: {k: msg[k] for k in fields if k in msg}
+		if not drop_fields: return lambda msg: msg
+
+		def project(msg):
+			msg = msg.copy()
+			for field in drop_fields: msg.pop(field, None)
+			return msg
+		return project
+
+
+
+def create_filter(config=None, matches_only=False):
+	"""
+	:param config: dict, see the module doc
+	:param matches_only: if True and config has no types, only the matches are published
+	:return: MessageFilter
+	"""
+	config = dict(config or {})
+	unknown = set(config) - set(CONFIG_KEYS)
+	if unknown: raise InvalidFilterError("unknown filter keys %s" % ', '.join(sorted(unknown)))
+	if matches_only and config.get('types') is None: config['types'] = ['match']
+	try:
+		return MessageFilter(**config)
+	except (TypeError, ValueError) as e:
+		raise InvalidFilterError(str(e))
+
+
+def load_filter_config(value):
+	"""
+	:param value: json object or path of a json file, i.e. from the environment
+	:return: dict, None if value is None
+	"""
+	if value is None: return None
+	try:
+		if value.lstrip().startswith('{'): return json.loads(value)
+		with open(os.path.expanduser(value)) as f: return json.load(f)
+	except (OSError, ValueError) as e:
+		raise InvalidFilterError("invalid filter config %s: %s" % (value, e))
@@ -0,0 +1,95 @@
+"""
+	File name: gdax/messages.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Compact __slots__ records of the GDAX messages, with prices and
+	sizes parsed once. Delivered to the callbacks when GdaxClient is
+	created with typed_messages=True.
+"""
+from datetime import datetime, timezone
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def parse_time_ns(s):
+	"""
+	:param s: GDAX ISO-8601 UTC time, i.e. 2018-02-16T01:25:40.647000Z
+	:return: int, nanoseconds since epoch
+	"""
+	if s.endswith('Z'): s = s[:-1] + '+00:00'
+	d = datetime.fromisoformat(s) - EPOCH
+	return (d.days * 86400 + d.seconds) * 1000000000 + d.microseconds * 1000
+
+
+class Record(object):
+	__slots__ = ()
+
+	def to_dict(self):
+		return {k: getattr(self, k) for k in self.__slots__}
+
+	def __eq__(self, other):
+		return type(self) is type(other) and all(
+			getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+	def __repr__(self):
+		return "%s(%s)" % (type(self).__name__, ', '.join(
+			"%s=%r" % (k, getattr(self, k)) for k in self.__slots__))
+
+
+class Match(Record):
+	__slots__ = ('type', 'trade_id', 'sequence', 'product_id', 'side', 'price', 'size', 'time')
+
+	def __init__(self, type, trade_id, sequence, product_id, side, price, size, time):
+		self.type = type
+		self.trade_id = trade_id
+		self.sequence = sequence
+		self.product_id = product_id
+		self.side = side
+		self.price = price
+		self.size = size
+		self.time = time
+
+	@classmethod
+	def from_dict(cls, msg):
+		return cls(msg['type'], msg.get('trade_id'), msg.get('sequence'), msg['product_id'],
+				   msg.get('side'), float(msg['price']), float(msg['size']), msg.get('time'))
+
+
+class Heartbeat(Record):
+	__slots__ = ('product_id', 'sequence', 'last_trade_id', 'time')
+
+	def __init__(self, product_id, sequence, last_trade_id, time):
+		self.product_id = product_id
+		self.sequence = sequence
+		self.last_trade_id = last_trade_id
+		self.time = time
+
+	@classmethod
+	def from_dict(cls, msg):
+		return cls(msg.get('product_id'), msg.get('sequence'), msg.get('last_trade_id'), msg.get('time'))
+
+
+class L2Update(Record):
+	"""
+	changes is a tuple of (side, price, size) tuples.
+	"""
+	__slots__ = ('product_id', 'time', 'changes')
+
+	def __init__(self, product_id, time, changes):
+		self.product_id = product_id
+		self.time = time
+		self.changes = changes
+
+	@classmethod
+	def from_dict(cls, msg):
+		return cls(msg['product_id'], msg.get('time'), tuple(
+			(side, float(price), float(size)) for side, price, size in msg.get('changes', ())))
+
+
+RECORD_TYPES = {
+	'match': Match,
+	'last_match': Match,
+	'heartbeat': Heartbeat,
+	'l2update': L2Update
+}
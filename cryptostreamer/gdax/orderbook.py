@@ -0,0 +1,238 @@
+"""
+	File name: gdax/orderbook.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Local order books maintained from the level2 channel (snapshot and
+	l2update) and, optionally, from the full channel (open, done, change,
+	match).
+
+	Each side keeps the price levels in two parallel arrays of doubles,
+	sorted so that the best level is always the last one: best bid/ask
+	is O(1), a level is found with a binary search and most updates,
+	close to the top of the book, only move the last few items.
+"""
+from array import array
+from bisect import bisect_left
+
+
+class BookSide(object):
+	"""
+	Price levels of one side of the book.
+	Bids are stored by price, asks by negated price, so in both cases
+	the keys are ascending and the best level is the last one.
+	"""
+	__slots__ = ('_keys', '_sizes', '_sign')
+
+	def __init__(self, is_bid):
+		self._keys = array('d')
+		self._sizes = array('d')
+		self._sign = 1.0 if is_bid else -1.0
+
+
+	def __len__(self):
+		return len(self._keys)
+
+
+	def clear(self):
+		del self._keys[:]
+		del self._sizes[:]
+
+
+	def set(self, price, size):
+		"""
+		Sets the size of a level, size 0 removes the level.
+		"""
+		keys = self._keys
+		key = price * self._sign
+		i = bisect_left(keys, key)
+		if i < len(keys) and keys[i] == key:
+			if size > 0: self._sizes[i] = size
+			else:
+				del keys[i]
+				del self._sizes[i]
+		elif size > 0:
+			keys.insert(i, key)
+			self._sizes.insert(i, size)
+
+
+	def add(self, price, delta):
+		"""
+		Adds delta to the size of a level, the level is removed when empty.
+		"""
+		keys = self._keys
+		key = price * self._sign
+		i = bisect_left(keys, key)
+		if i < len(keys) and keys[i] == key:
+			size = self._sizes[i] + delta
+			if size > 1e-12: self._sizes[i] = size
+			else:
+				del keys[i]
+				del self._sizes[i]
+		elif delta > 0:
+			keys.insert(i, key)
+			self._sizes.insert(i, delta)
+
+
+	def size_at(self, price):
+		keys = self._keys
+		key = price * self._sign
+		i = bisect_left(keys, key)
+		if i < len(keys) and keys[i] == key: return self._sizes[i]
+		return 0.0
+
+
+	def best(self):
+		"""
+		:return: (price, size) or None if empty
+		"""
+		if not self._keys: return None
+		return (self._keys[-1] * self._sign, self._sizes[-1])
+
+
+	def depth(self, n):
+		"""
+		:return: list of the best n (price, size), best first
+		"""
+		keys, sizes, sign = self._keys, self._sizes, self._sign
+		last = len(keys) - 1
+		return [(keys[last - i] * sign, sizes[last - i]) for i in range(min(n, len(keys)))]
+
+
+
+class OrderBook(object):
+
+	def __init__(self, product_id):
+		self.product_id = product_id
+		self.bids = BookSide(True)
+		self.asks = BookSide(False)
+		self.sequence = None
+		self._orders = {}
+
+
+	def _side(self, side):
+		return self.bids if side == 'buy' else self.asks
+
+
+	def apply_snapshot(self, msg):
+		self.bids.clear()
+		self.asks.clear()
+		for price, size in msg.get('bids', ()): self.bids.set(float(price), float(size))
+		for price, size in msg.get('asks', ()): self.asks.set(float(price), float(size))
+
+
+	def apply_l2update(self, msg):
+		for side, price, size in msg.get('changes', ()):
+			self._side(side).set(float(price), float(size))
+
+
+	def apply_full(self, msg):
+		"""
+		Applies a full channel message. Only the orders opened after the
+		subscription are known, the book is complete only if seeded with a
+		level3 snapshot through add_order.
+		"""
+		msg_type = msg.get('type')
+		self.sequence = msg.get('sequence', self.sequence)
+		if msg_type == 'open':
+			self.add_order(msg['order_id'], msg['side'], float(msg['price']), float(msg['remaining_size']))
+		elif msg_type == 'done':
+			order = self._orders.pop(msg.get('order_id'), None)
+			if order is not None: self._side(order[0]).add(order[1], -order[2])
+		elif msg_type == 'change':
+			order = self._orders.get(msg.get('order_id'))
+			if order is not None and 'new_size' in msg:
+				new_size = float(msg['new_size'])
+				self._side(order[0]).add(order[1], new_size - order[2])
+				order[2] = new_size
+		elif msg_type == 'match':
+			order = self._orders.get(msg.get('maker_order_id'))
+			if order is not None:
+				size = float(msg['size'])
+				self._side(order[0]).add(order[1], -size)
+				order[2] -= size
+
+
+	def add_order(self, order_id, side, price, size):
+		self._orders[order_id] = [side, price, size]
+		self._side(side).add(price, size)
+
+
+	def best_bid(self):
+		return self.bids.best()
+
+
+	def best_ask(self):
+		return self.asks.best()
+
+
+	def spread(self):
+		bid, ask = self.bids.best(), self.asks.best()
+		if bid is None or ask is None: return None
+		return ask[0] - bid[0]
+
+
+	def top(self):
+		return {'product_id': self.product_id, 'bid': self.bids.best(), 'ask': self.asks.best()}
+
+
+	def depth(self, n):
+		return {'product_id': self.product_id, 'bids': self.bids.depth(n), 'asks': self.asks.depth(n)}
+
+
+
+class OrderBooks(object):
+	"""
+	Order books of all the products.
+	"""
+	FULL_TYPES = ('open', 'done', 'change', 'match')
+
+	def __init__(self, full=False):
+		"""
+		:param full: if True the books are maintained from the full channel
+			messages, otherwise from the level2 channel ones.
+		"""
+		self._books = {}
+		self._full = full
+
+
+	def __getitem__(self, product_id):
+		return self._books[product_id]
+
+
+	def __contains__(self, product_id):
+		return product_id in self._books
+
+
+	def get(self, product_id):
+		book = self._books.get(product_id)
+		if book is None:
+			book = self._books[product_id] = OrderBook(product_id)
+		return book
+
+
+	def reset(self, product_id=None):
+		"""
+		Drops the book of the product (all the books if None), i.e. when its
+		updates are lost. It's rebuilt from the next snapshot.
+		"""
+		if product_id is None: self._books = {}
+		else: self._books.pop(product_id, None)
+
+
+	def handle(self, msg_type, msg):
+		"""
+		:return: the updated OrderBook, None if the message is not a book update
+		"""
+		if self._full:
+			if msg_type not in self.FULL_TYPES: return None
+			book = self.get(msg['product_id'])
+			book.apply_full(msg)
+		elif msg_type == 'l2update':
+			book = self.get(msg['product_id'])
+			book.apply_l2update(msg)
+		elif msg_type == 'snapshot':
+			book = self.get(msg['product_id'])
+			book.apply_snapshot(msg)
+		else:
+			return None
+		return book
@@ -1,41 +1,245 @@
-import json
+import os
+from threading import Condition, Lock
+from time import monotonic
 from .client import GdaxClient
+from cryptostreamer.codec import peek_field, peek_int
+from cryptostreamer.kafka_config import producer_config, parse_acks
+from cryptostreamer.gdax.candles import CandleAggregator
+from cryptostreamer.gdax.conflation import Conflator
+from cryptostreamer.gdax.filters import create_filter, load_filter_config
+from cryptostreamer.gdax.messages import parse_time_ns
+from cryptostreamer.gdax import wire
+from cryptostreamer.latency import DISPATCH_ACK
+from cryptostreamer.partitioning import create_partitioner, parse_partition_map, message_headers
+from cryptostreamer.spool import Spool, SpoolDrainer, pack_record, unpack_record, \
+	DEFAULT_MAX_BYTES as DEFAULT_SPOOL_MAX_BYTES
 from kafka import KafkaProducer
+from kafka.errors import KafkaTimeoutError
 
 from cryptostreamer import get_logger
 LOGGER = get_logger('GdaxKafkaProducer')
 
+WIRE_JSON = 'json'
+WIRE_BINARY = 'binary'
+
 KAFKA_RES_TIMEOUT = 30
+KAFKA_SEND_TIMEOUT = 5
+DEFAULT_MAX_IN_FLIGHT = 1000
+PASSTHROUGH_INCOMPATIBLE = ('sequence_check', 'orderbook', 'capture_dir', 'latency_tracking')
+
+
+class IncompatibleOptionsError(Exception): pass
 
 
 class GdaxKafkaProducer(GdaxClient):
 
 	@classmethod
-	def create_with_environment(cls):
+	def create_with_environment(cls,shard_id=None,**gdax_overrides):
+		"""
+		:param shard_id: set when the client runs a shard (see ShardSupervisor),
+			each shard spools in its own shard-<id> subdirectory of the spool dir
+		"""
 		kafka_topic = cls.get_str_from_env('CRYPTO_STREAMER_KAFKA_GDAX_TOPIC')
 		matches_only = cls.get_boolean_from_env('CRYPTO_STREAMER_KAFKA_GDAX_MATCHES_ONLY')
 		gdax_kwargs = GdaxClient.kwargs_from_environment()
+		gdax_kwargs.update(gdax_overrides)
 		kafka_kwargs = GdaxKafkaProducer.kwargs_from_environment()
-		return cls(kafka_topic,gdax_kwargs,kafka_kwargs,matches_only)
+		options = GdaxKafkaProducer.options_from_environment()
+		if shard_id is not None and 'spool_dir' in options:
+			options['spool_dir'] = os.path.join(options['spool_dir'], 'shard-%d' % shard_id)
+		return cls(kafka_topic,gdax_kwargs,kafka_kwargs,matches_only,**options)
 
 	@classmethod
 	def kwargs_from_environment(cls):
 		kwargs= {
-			'bootstrap_servers': cls.get_list_from_env('CRYPTO_STREAMER_KAFKA_BOOTSTRAP_SERVERS')
+			'bootstrap_servers': cls.get_list_from_env('CRYPTO_STREAMER_KAFKA_BOOTSTRAP_SERVERS'),
+			'preset': cls.get_str_from_env('CRYPTO_STREAMER_KAFKA_PRESET'),
+			'compression_type': cls.get_str_from_env('CRYPTO_STREAMER_KAFKA_COMPRESSION_TYPE'),
+			'linger_ms': cls.get_int_from_env('CRYPTO_STREAMER_KAFKA_LINGER_MS'),
+			'batch_size': cls.get_int_from_env('CRYPTO_STREAMER_KAFKA_BATCH_SIZE'),
+			'acks': parse_acks(cls.get_str_from_env('CRYPTO_STREAMER_KAFKA_ACKS')),
+			'max_in_flight_requests_per_connection':
+				cls.get_int_from_env('CRYPTO_STREAMER_KAFKA_MAX_IN_FLIGHT_REQUESTS_PER_CONNECTION'),
+			'buffer_memory': cls.get_int_from_env('CRYPTO_STREAMER_KAFKA_BUFFER_MEMORY')
 		}
 		return {k: v for k,v in kwargs.items() if v is not None}
 
+	@classmethod
+	def options_from_environment(cls):
+		options = {
+			'pipelined': cls.get_boolean_from_env('CRYPTO_STREAMER_KAFKA_GDAX_PIPELINED'),
+			'max_in_flight': cls.get_int_from_env('CRYPTO_STREAMER_KAFKA_GDAX_MAX_IN_FLIGHT'),
+			'passthrough': cls.get_boolean_from_env('CRYPTO_STREAMER_KAFKA_GDAX_PASSTHROUGH'),
+			'candle_intervals': cls.get_list_from_env('CRYPTO_STREAMER_KAFKA_GDAX_CANDLE_INTERVALS'),
+			'candles_topic': cls.get_str_from_env('CRYPTO_STREAMER_KAFKA_GDAX_CANDLES_TOPIC'),
+			'spool_dir': cls.get_str_from_env('CRYPTO_STREAMER_KAFKA_GDAX_SPOOL_DIR'),
+			'spool_max_bytes': cls.get_int_from_env('CRYPTO_STREAMER_KAFKA_GDAX_SPOOL_MAX_BYTES'),
+			'recv_ts_header': cls.get_boolean_from_env('CRYPTO_STREAMER_KAFKA_GDAX_RECV_TS_HEADER'),
+			'partitioner': cls.get_str_from_env('CRYPTO_STREAMER_KAFKA_GDAX_PARTITIONER'),
+			'partition_map': parse_partition_map(cls.get_list_from_env('CRYPTO_STREAMER_KAFKA_GDAX_PARTITION_MAP')),
+			'headers': cls.get_boolean_from_env('CRYPTO_STREAMER_KAFKA_GDAX_HEADERS'),
+			'wire_format': cls.get_str_from_env('CRYPTO_STREAMER_KAFKA_GDAX_WIRE_FORMAT'),
+			'conflate_interval': cls.get_float_from_env('CRYPTO_STREAMER_KAFKA_GDAX_CONFLATE_INTERVAL'),
+			'conflate_types': cls.get_list_from_env('CRYPTO_STREAMER_KAFKA_GDAX_CONFLATE_TYPES'),
+			'filter_config': load_filter_config(cls.get_str_from_env('CRYPTO_STREAMER_KAFKA_GDAX_FILTER'))
+		}
+		return {k: v for k,v in options.items() if v is not None}
 
-	def __init__(self,kafka_topic='gdax',gdax_kwargs={},kafka_kwargs={},matches_only=False):
+
+	def __init__(self,kafka_topic='gdax',gdax_kwargs={},kafka_kwargs={},matches_only=False,
+				 pipelined=False,max_in_flight=DEFAULT_MAX_IN_FLIGHT,passthrough=False,
+				 candle_intervals=None,candles_topic=None,
+				 spool_dir=None,spool_max_bytes=DEFAULT_SPOOL_MAX_BYTES,recv_ts_header=False,
+				 partitioner=None,partition_map=None,headers=False,wire_format=WIRE_JSON,
+				 conflate_interval=None,conflate_types=None,filter_config=None):
+		"""
+		:param kafka_kwargs: KafkaProducer kwargs, plus an optional 'preset'
+			(default, low-latency, high-throughput). See kafka_config.
+		:param pipelined: if True, records are sent asynchronously and the
+			broker acknowledgement is handled by callbacks instead of
+			blocking the mainloop with future.get()
+		:param max_in_flight: max number of not yet acknowledged records
+			in pipelined mode. When reached, the mainloop waits (backpressure)
+			up to KAFKA_SEND_TIMEOUT seconds for a slot.
+		:param passthrough: if True, the published frames are not decoded:
+			type and product_id are read with a lightweight scan and the
+			original bytes are sent as kafka value (order ids included).
+			Callbacks are called only for the frames that are not published.
+			Not compatible with the gdax_kwargs sequence_check, orderbook,
+			capture_dir and latency_tracking, that need the decoded messages.
+		:param candle_intervals: list of seconds, i.e. [1,60,300]. If set,
+			OHLCV candles are built from the matches and the closed ones are
+			published to candles_topic (default: <kafka_topic>-candles)
+		:param spool_dir: if set, the records that can't be sent (kafka down,
+			timeouts, backpressure) are written to a local spool in this directory
+			instead of stopping the producer. A background thread replays the
+			spool in order once kafka is back; meanwhile new records are spooled
+			too, to keep the order.
+		:param spool_max_bytes: max disk usage of the spool, at least two
+			segments (32MB)
+		:param recv_ts_header: if True, the receive time of the frame (ns since
+			epoch, ascii) is sent in the 'recv_ts' kafka header. With
+			latency_tracking (gdax_kwargs) the dispatch->ack latency is tracked too.
+		:param partitioner: 'product' (default, key product_id), 'map' (partition
+			from partition_map, dict product_id -> partition) or 'round-robin'
+			(key product_id:sequence). See partitioning.
+		:param headers: if True, type, product_id and sequence are sent as
+			kafka headers
+		:param wire_format: 'json' or 'binary'. With 'binary' the matches and
+			l2updates are sent in the compact gdax.wire encoding (decoded with
+			wire.decode), the other types as json. Not compatible with passthrough.
+		:param conflate_interval: if set, seconds. Only the latest message of
+			each product and type (l2update changes merged) is published every
+			conflate_interval seconds by a timer, see conflation. In passthrough
+			mode the conflated frames are decoded.
+		:param conflate_types: conflated message types, by default all
+		:param filter_config: dict of the published types, products, min_size,
+			min_notional and fields, see filters. With matches_only the default
+			types are ['match']. In passthrough mode, the frames are decoded if
+			the filter needs more than type and product_id.
+		"""
+		if wire_format not in (None, WIRE_JSON, WIRE_BINARY):
+			raise wire.UnsupportedWireFormatError(wire_format)
+		self._binary_wire = wire_format == WIRE_BINARY
+		if self._binary_wire and passthrough:
+			raise wire.UnsupportedWireFormatError("binary wire format needs the decoded messages, not passthrough")
+		if passthrough:
+			enabled = [k for k in PASSTHROUGH_INCOMPATIBLE if gdax_kwargs.get(k)]
+			if enabled: raise IncompatibleOptionsError("passthrough is not compatible with %s" % ', '.join(enabled))
 		self._kafka_topic = kafka_topic
 		self._matches_only = matches_only
+		self._filter = create_filter(filter_config,matches_only)
+		self._accepts = self._filter.accepts
+		self._project = self._filter.project
 		self._gdax_kwargs = gdax_kwargs
 		self._kafka_kwargs = kafka_kwargs
+		self._kafka_config = producer_config(kafka_kwargs)
+		self._pipelined = pipelined
+		self._passthrough = passthrough
+		self._max_in_flight = max(1, max_in_flight or DEFAULT_MAX_IN_FLIGHT)
+		self._in_flight = 0
+		self._in_flight_cond = Condition()
+		self._send_error = None
+		self._send_errors = 0
+		self._send_errors_lock = Lock()
+		self._kafka_producer = None
+		self._spool_dir = spool_dir
+		self._spool_max_bytes = spool_max_bytes or DEFAULT_SPOOL_MAX_BYTES
+		self._spool = None
+		self._spool_drainer = None
+		self._candles = None
+		self._candles_topic = candles_topic or '%s-candles' % kafka_topic
+		if candle_intervals:
+			intervals = [int(i) for i in candle_intervals]
+			self._candles = CandleAggregator(intervals, self._on_candle)
+		self._conflator = None
+		if conflate_interval:
+			self._conflator = Conflator(conflate_interval, self._publish, conflate_types)
 		GdaxClient.__init__(self,**self._gdax_kwargs)
+		self._recv_ts_header = recv_ts_header
+		self._partitioner = create_partitioner(partitioner,partition_map)
+		self._partitions = {}
+		self._headers = headers
+		self._needs_sequence = headers or self._partitioner is not None
+		self._stamp_frames = self._stamp_frames or recv_ts_header
+		self._ack_latency = None
+		if self._metrics is not None: self._ack_latency = self._metrics.histogram('recv_to_ack_seconds')
+		self._track_ack = self._ack_latency is not None or self.latency is not None
+
+
+	def _schedule_timers(self):
+		GdaxClient._schedule_timers(self)
+		if self._conflator is not None: self.add_timer(self._conflator.interval,self._flush_conflated)
+
+
+	def _flush_conflated(self):
+		"""
+		Timer callback. A send error stops the client (see on_error) in
+		the timers thread, it's re-raised by the mainloop.
+		"""
+		try:
+			self._conflator.flush()
+		except Exception as e:
+			self._timer_error = e
+			raise
 
 
 	def on_setup(self):
 		self._kafka_producer = self._get_kafka_producer()
+		if self._spool_dir is not None and self._spool is None: self._open_spool()
+
+
+	def stop(self):
+		if self._conflator is not None and self._kafka_producer is not None: self._conflator.flush()
+		self._flush_kafka()
+		self._close_spool()
+		GdaxClient.stop(self)
+
+
+	def stats(self):
+		stats = GdaxClient.stats(self)
+		stats['kafka_send_errors'] = self._send_errors
+		if self._pipelined: stats['kafka_in_flight'] = self._in_flight
+		if self._candles is not None: stats.update(self._candles.stats())
+		if self._conflator is not None: stats.update(self._conflator.stats())
+		if self._spool is not None:
+			stats.update(self._spool.stats())
+			stats.update(self._spool_drainer.stats())
+		return stats
+
+
+	def _open_spool(self):
+		self._spool = Spool(self._spool_dir, max_bytes=self._spool_max_bytes)
+		self._spool_drainer = SpoolDrainer(self._spool, self._send_spooled)
+		self._spool_drainer.start()
+		if len(self._spool): LOGGER.info("%d spooled records to drain", len(self._spool))
+
+
+	def _close_spool(self):
+		if self._spool is None: return
+		self._spool_drainer.stop()
+		self._spool.close()
+		self._spool = self._spool_drainer = None
 
 
 	def on_disconnected(self):
@@ -43,29 +247,229 @@ class GdaxKafkaProducer(GdaxClient):
 		self._kafka_producer = None
 
 
+	def _process_frame(self,data):
+		if not self._passthrough: return GdaxClient._process_frame(self,data)
+
+		msg_type = peek_field(data,'type')
+		product_id = peek_field(data,'product_id')
+		if not self._filter.accepts_type(msg_type,product_id) or self._conflator is not None \
+				or self._filter.needs_decoding:
+			return GdaxClient._process_frame(self,data)
+
+		self._messages_count += 1
+		if self._metrics is not None: self._metrics.count_message(msg_type,product_id)
+		if product_id is None: return self.on_error(KeyError('product_id'))
+		if self._candles is not None and msg_type == 'match':
+			self._candles.add_trade(
+				product_id, parse_time_ns(peek_field(data,'time')),
+				float(peek_field(data,'price')), float(peek_field(data,'size')))
+		if data.__class__ is str: data = data.encode('utf-8')
+		sequence = peek_int(data,'sequence') if self._needs_sequence else None
+		self._send_record(product_id,data,None,msg_type,sequence)
+
+
 	def on_message(self, msg):
-		if self._matches_only: self._matches_only_on_message(msg)
-		else: self._all_msg_on_message(msg)
+		if self._candles is not None: self._aggregate_candles(msg)
+		if self._accepts(msg): self._send_to_kafka(msg)
 
-	def _matches_only_on_message(self,msg):
-		if msg.get('type') != 'match': return
-		self._send_to_kafka(msg)
+	def _aggregate_candles(self,msg):
+		msg_type = msg.get('type')
+		if msg_type == 'match': self._candles.add_match(msg)
+		elif msg_type == 'heartbeat' and 'time' in msg:
+			self._candles.advance(msg.get('product_id'), parse_time_ns(msg['time']))
 
-	def _all_msg_on_message(self,msg):
-		if msg.get('type') in ['heartbeat','subscriptions']: return
-		self._send_to_kafka(msg)
+	def _on_candle(self,candle):
+		self._send_record(candle.product_id,candle.to_dict(),self._candles_topic)
 
 	def _send_to_kafka(self,msg):
-		msg = msg.copy()
-		msg.pop('maker_order_id', None)
-		msg.pop('taker_order_id',None)
+		if self._conflator is not None:
+			return self._conflator.add(msg,(self._received_at,self._dispatched_at))
+		self._publish(msg)
+
+	def _publish(self,msg,stamps=None):
+		"""
+		:param stamps: (received_at, dispatched_at) of msg, by default the
+			ones of the frame being handled
+		"""
+		try:
+			key = msg['product_id']
+			value = wire.encode(msg) if self._binary_wire else None
+		except KeyError as e:
+			return self.on_error(e)
+		if value is None: value = self._project(msg)
+		self._send_record(key,value,None,msg.get('type'),msg.get('sequence'),stamps)
+
+
+	def _send_record(self,key,value,topic=None,msg_type=None,sequence=None,stamps=None):
+		"""
+		:param key: product_id
+		:param msg_type: type of the exchange messages, None for the
+			other records (candles), that are not partitioned
+		:param stamps: (received_at, dispatched_at) monotonic times, by default
+			the ones of the frame being handled by the mainloop. Given for the
+			records sent by other threads (conflation timer).
+		"""
+		topic = topic or self._kafka_topic
+		product_id = key
+		received_at, dispatched_at = stamps or (self._received_at, self._dispatched_at)
+		key, kwargs = self._route(topic,key,msg_type,sequence,received_at)
+		if self._spool is not None:
+			if value.__class__ is not bytes: value = self._codec.dumps(value)
+			if len(self._spool) and self._spool.append_if_pending(self._spool_record(topic,key,value,kwargs)):
+				return self._spool_drainer.notify()
+
+		if self._pipelined:
+			return self._send_record_pipelined(product_id,topic,key,value,kwargs,received_at,dispatched_at)
+		try:
+			future = self._kafka_send(topic,key,value,kwargs)
+			future.get(timeout=KAFKA_SEND_TIMEOUT)
+		except Exception as e:
+			return self._on_record_failed(e,topic,key,value,kwargs)
+		if self._track_ack: self._observe_ack(product_id,received_at,dispatched_at,None)
+
+
+	def _send_record_pipelined(self,product_id,topic,key,value,kwargs,received_at,dispatched_at):
+		"""
+		Sends the record without waiting for the broker acknowledgement.
+		Errors raised by the callbacks (kafka I/O thread) are reported
+		to on_error on the next send, in the mainloop thread, or the
+		record is spooled.
+		"""
+		try:
+			self._raise_send_error()
+			self._acquire_in_flight()
+			try:
+				future = self._kafka_send(topic,key,value,kwargs)
+			except Exception:
+				self._release_in_flight()
+				raise
+			future.add_callback(self._on_send_success)
+			if self._track_ack: future.add_callback(self._observe_ack,product_id,received_at,dispatched_at)
+			if self._spool is None: future.add_errback(self._on_send_error)
+			else: future.add_errback(self._on_send_error_spooled,topic,key,value,kwargs)
+		except Exception as e:
+			self._on_record_failed(e,topic,key,value,kwargs)
+
+
+	def _on_record_failed(self,e,topic,key,value,kwargs):
+		self._count_send_error()
+		if self._spool is None: return self.on_error(e)
+		LOGGER.warning("kafka send failed (%s), spooling", e)
+		self._spool.append(self._spool_record(topic,key,value,kwargs))
+		self._spool_drainer.notify()
+
+
+	def _on_send_error_spooled(self,topic,key,value,kwargs,e):
 		try:
-			future = self._kafka_producer.send(
-				self._kafka_topic,
-				key=msg['product_id'],value=msg)
-			future.get(timeout=5)
+			self._on_record_failed(e,topic,key,value,kwargs)
+		finally:
+			self._release_in_flight()
+
+
+	def _spool_record(self,topic,key,value,kwargs):
+		"""
+		The routing (key, partition and headers) is spooled with the record.
+		"""
+		return pack_record(topic,key,value,kwargs.get('partition'),kwargs.get('headers'))
+
+
+	def _send_spooled(self,payload):
+		topic, key, value, partition, headers = unpack_record(payload)
+		kwargs = {}
+		if partition is not None: kwargs['partition'] = partition
+		if headers is not None: kwargs['headers'] = headers
+		self._kafka_send(topic,key,value,kwargs).get(timeout=KAFKA_SEND_TIMEOUT)
+
+
+	def _acquire_in_flight(self):
+		with self._in_flight_cond:
+			if self._in_flight >= self._max_in_flight:
+				full = lambda: self._in_flight < self._max_in_flight
+				if not self._in_flight_cond.wait_for(full, KAFKA_SEND_TIMEOUT):
+					raise KafkaTimeoutError(
+						"%d records waiting for kafka acknowledgement" % self._in_flight)
+			self._in_flight += 1
+
+
+	def _release_in_flight(self):
+		with self._in_flight_cond:
+			self._in_flight -= 1
+			self._in_flight_cond.notify()
+
+
+	def _on_send_success(self,record_metadata):
+		self._release_in_flight()
+
+
+	def _count_send_error(self):
+		with self._send_errors_lock:
+			self._send_errors += 1
+
+
+	def _route(self,topic,key,msg_type=None,sequence=None,received_at=None):
+		"""
+		:return: (key, send kwargs), the key and partition from the partitioner
+			and the headers
+		"""
+		kwargs = {}
+		if msg_type is not None:
+			product_id = key
+			if self._partitioner is not None:
+				key, partition = self._partitioner.route(product_id,sequence,self._partitions_for(topic))
+				if partition is not None: kwargs['partition'] = partition
+			if self._headers: kwargs['headers'] = message_headers(msg_type,product_id,sequence)
+		if self._recv_ts_header:
+			if received_at is None: received_at = self._received_at
+			recv_ts = b'%d' % int((received_at + self._wall_offset) * 1e9)
+			kwargs.setdefault('headers',[]).append(('recv_ts',recv_ts))
+		return key, kwargs
+
+
+	def _kafka_send(self,topic,key,value,kwargs):
+		if not kwargs: return self._kafka_producer.send(topic,key=key,value=value)
+		return self._kafka_producer.send(topic,key=key,value=value,**kwargs)
+
+
+	def _partitions_for(self,topic):
+		if not self._partitioner.needs_partitions: return None
+		partitions = self._partitions.get(topic)
+		if not partitions:
+			partitions = self._partitions[topic] = sorted(self._kafka_producer.partitions_for(topic) or ())
+		return partitions
+
+
+	def _observe_ack(self,key,received_at,dispatched_at,record_metadata):
+		now = monotonic()
+		if self._ack_latency is not None: self._ack_latency.observe(now - received_at)
+		if self.latency is not None: self.latency.observe(key, DISPATCH_ACK, now - dispatched_at)
+
+
+	def _on_send_error(self,e):
+		LOGGER.error("kafka send failed: %s", e)
+		self._count_send_error()
+		if self._send_error is None: self._send_error = e
+		self._release_in_flight()
+
+
+	def _raise_send_error(self):
+		e = self._send_error
+		if e is None: return
+		self._send_error = None
+		raise e
+
+
+	def _flush_kafka(self):
+		"""
+		Blocks until all the in flight records are acknowledged (or failed),
+		so that stopping the producer doesn't drop any received message.
+		"""
+		if self._kafka_producer is None: return
+		try:
+			self._kafka_producer.flush(timeout=KAFKA_RES_TIMEOUT)
 		except Exception as e:
-			self.on_error(e)
+			LOGGER.error("kafka flush failed: %s", e)
+		if self._send_error is not None:
+			LOGGER.error("kafka send failed before stop: %s", self._send_error)
 
 
 	def on_error(self,e):
@@ -73,8 +477,16 @@ class GdaxKafkaProducer(GdaxClient):
 		raise e
 
 	def _get_kafka_producer(self):
-		kwargs = self._kafka_kwargs.copy()
+		kwargs = self._kafka_config.copy()
 		kwargs['key_serializer'] = str.encode
-		kwargs['value_serializer'] = lambda v: json.dumps(v).encode('utf-8')
-		kwargs['compression_type'] = 'gzip'
-		return KafkaProducer(**kwargs)
\ No newline at end of file
+		kwargs['value_serializer'] = self._value_serializer()
+		return KafkaProducer(**kwargs)
+
+
+	def _value_serializer(self):
+		"""
+		In passthrough, spool and binary wire modes the values can be already encoded.
+		"""
+		dumps = self._codec.dumps
+		if not self._passthrough and self._spool_dir is None and not self._binary_wire: return dumps
+		return lambda v: v if v.__class__ is bytes else dumps(v)
@@ -0,0 +1,198 @@
+"""
+	File name: gdax/replay.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Recording of the raw websocket frames with their receive time, and a
+	replay transport that plugs into GdaxClient._create_connection, to
+	run the pipeline offline in real time, N times faster or as fast as
+	possible.
+
+	Recording layout: a sequence of
+		<receive time ns u64><opcode u8><length u32><frame>
+	with opcode 1 for text frames and 2 for binary frames (the websocket
+	opcodes).
+"""
+import struct
+from time import time_ns, monotonic, sleep
+
+from websocket import WebSocketConnectionClosedException
+
+
+FRAME_HEADER = struct.Struct('<QBI')
+OPCODE_TEXT = 1
+OPCODE_BINARY = 2
+
+
+class ReplayFinishedError(WebSocketConnectionClosedException):
+	"""
+	Raised by recv when all the recorded frames are replayed.
+	"""
+	pass
+
+
+
+class FrameRecorder(object):
+
+	def __init__(self, path):
+		self._file = open(path, 'ab')
+		self.frames = 0
+
+
+	def record(self, data, recv_ns=None, opcode=None):
+		"""
+		:param opcode: OPCODE_TEXT or OPCODE_BINARY, by default text for str
+			and binary for bytes
+		"""
+		if isinstance(data, str):
+			data, opcode = data.encode('utf-8'), opcode or OPCODE_TEXT
+		elif opcode is None:
+			opcode = OPCODE_BINARY
+		self._file.write(FRAME_HEADER.pack(time_ns() if recv_ns is None else recv_ns, opcode, len(data)))
+		self._file.write(data)
+		self.frames += 1
+
+
+	def wrap(self, create_connection):
+		"""
+		:param create_connection: i.e. websocket.create_connection
+		:return: a create_connection recording the frames of the connections
+
+			gdax._create_connection = FrameRecorder(path).wrap(gdax._create_connection)
+		"""
+		def create_recording_connection(url, **kwargs):
+			return RecordingConnection(create_connection(url, **kwargs), self)
+		return create_recording_connection
+
+
+	def close(self):
+		self._file.close()
+
+
+
+class RecordingConnection(object):
+	"""
+	Records the data frames read with recv, or with recv_data when the
+	client reads the control frames too (i.e. with metrics).
+	"""
+
+	def __init__(self, ws, recorder):
+		self._ws = ws
+		self._recorder = recorder
+
+	def recv(self):
+		data = self._ws.recv()
+		self._recorder.record(data)
+		return data
+
+	def recv_data(self, control_frame=False):
+		opcode, data = self._ws.recv_data(control_frame=control_frame)
+		if opcode == OPCODE_TEXT or opcode == OPCODE_BINARY: self._recorder.record(data, opcode=opcode)
+		return opcode, data
+
+	def __getattr__(self, name):
+		return getattr(self._ws, name)
+
+
+
+def read_frames(path):
+	"""
+	:return: generator of (receive time ns, frame)
+	"""
+	with open(path, 'rb') as f:
+		while True:
+			header = f.read(FRAME_HEADER.size)
+			if len(header) < FRAME_HEADER.size: return
+			recv_ns, opcode, length = FRAME_HEADER.unpack(header)
+			data = f.read(length)
+			if len(data) < length: return
+			yield recv_ns, data.decode('utf-8') if opcode == OPCODE_TEXT else data
+
+
+
+class ReplayTransport(object):
+	"""
+	Replaces GdaxClient._create_connection. The connections share the
+	position in the recording, so a reconnection continues the replay.
+
+		gdax._create_connection = ReplayTransport(path, speed=10)
+	"""
+
+	def __init__(self, path, speed=1.0):
+		"""
+		:param speed: 1.0 real time, N for N times faster, None or 0 as fast as possible
+		"""
+		self._frames = read_frames(path)
+		self._speed = speed or None
+		self._first_ns = None
+		self._started = None
+		self.frames = 0
+		self.finished = False
+		self.max_lag = 0.0
+
+
+	def __call__(self, url, **kwargs):
+		if self.finished: raise ReplayFinishedError("replay finished")
+		return ReplayConnection(self)
+
+
+	def next_frame(self):
+		try:
+			recv_ns, data = next(self._frames)
+		except StopIteration:
+			self.finished = True
+			raise ReplayFinishedError("replay finished")
+
+		if self._speed is not None:
+			if self._first_ns is None:
+				self._first_ns, self._started = recv_ns, monotonic()
+			delay = self._started + (recv_ns - self._first_ns) / 1e9 / self._speed - monotonic()
+			if delay > 0: sleep(delay)
+			elif -delay > self.max_lag: self.max_lag = -delay
+		self.frames += 1
+		return data
+
+
+	def stats(self):
+		return {'replay_frames': self.frames, 'replay_max_lag': self.max_lag}
+
+
+
+class ReplayConnection(object):
+	"""
+	Websocket connection replaying the frames, the sent messages
+	(subscriptions) and the pings are ignored.
+	"""
+
+	def __init__(self, transport):
+		self._transport = transport
+		self.connected = True
+
+	def recv(self):
+		if not self.connected: raise WebSocketConnectionClosedException("closed")
+		return self._transport.next_frame()
+
+	def send(self, data): pass
+
+	def ping(self, payload=''): pass
+
+	def close(self):
+		self.connected = False
+
+
+
+def replay(client, path, speed=None):
+	"""
+	Runs the client over a recording until all the frames are replayed.
+
+	:param client: GdaxClient, created with reconnect=False
+	:param speed: see ReplayTransport
+	:return: ReplayTransport, with the replay stats
+	"""
+	transport = ReplayTransport(path, speed)
+	client._create_connection = transport
+	try:
+		client.start()
+	except ReplayFinishedError:
+		pass
+	client.stop()
+	return transport
@@ -0,0 +1,76 @@
+"""
+	File name: gdax/sequence.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Per product tracking of a contiguous counter (trade_id on the matches
+	channel, sequence on the full channel) to detect gaps, duplicates
+	and out of order messages in O(1).
+"""
+
+DUPLICATE = -1
+OUT_OF_ORDER = -2
+
+
+class SequenceTracker(object):
+
+	def __init__(self):
+		self._last = {}
+		self.gaps = 0
+		self.missing = 0
+		self.duplicates = 0
+		self.out_of_order = 0
+
+
+	def observe(self, key, seq):
+		"""
+		Tracks a new value of the counter.
+
+		:return: number of missing values before seq (0 if contiguous),
+			DUPLICATE or OUT_OF_ORDER
+		"""
+		last = self._last.get(key)
+		if last is None or seq == last + 1:
+			self._last[key] = seq
+			return 0
+		if seq == last:
+			self.duplicates += 1
+			return DUPLICATE
+		if seq < last:
+			self.out_of_order += 1
+			return OUT_OF_ORDER
+
+		missing = seq - last - 1
+		self.gaps += 1
+		self.missing += missing
+		self._last[key] = seq
+		return missing
+
+
+	def check(self, key, last_seen):
+		"""
+		Validates the last value announced by the server (heartbeat),
+		without expecting it to be a new value.
+
+		:return: number of values announced but never observed
+		"""
+		last = self._last.get(key)
+		if last is None or last_seen <= last: return 0
+		missing = last_seen - last
+		self.gaps += 1
+		self.missing += missing
+		self._last[key] = last_seen
+		return missing
+
+
+	def reset(self, key=None):
+		if key is None: self._last.clear()
+		else: self._last.pop(key, None)
+
+
+	def stats(self):
+		return {
+			'sequence_gaps': self.gaps,
+			'sequence_missing': self.missing,
+			'sequence_duplicates': self.duplicates,
+			'sequence_out_of_order': self.out_of_order
+		}
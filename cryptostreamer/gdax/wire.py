@@ -0,0 +1,110 @@
+"""
+	File name: gdax/wire.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Compact binary encoding of the published matches and l2updates.
+	Fixed width little-endian fields, times in ns since epoch, prices and
+	sizes as integers scaled by SCALE (1e8, exact from the GDAX decimal
+	strings). Every record starts with the schema version and the kind:
+
+		match:    <version u8><kind u8><time i64><trade_id i64><sequence i64>
+		          <price i64><size i64><side u8><product_id length u8><product_id>
+		l2update: <version u8><kind u8><time i64><changes u16><product_id length u8>
+		          <product_id> then for each change <side u8><price i64><size i64>
+
+	A last_match has the match layout with its own kind, so that consumers
+	don't count the repeated trade twice.
+
+	JSON values start with '{', so a consumer can tell the formats apart
+	by the first byte.
+"""
+import struct
+
+from cryptostreamer.gdax.messages import parse_time_ns
+
+
+VERSION = 1
+KIND_MATCH = 1
+KIND_L2UPDATE = 2
+KIND_LAST_MATCH = 3
+SCALE = 100000000
+SCALE_DIGITS = 8
+SIDES = ('buy', 'sell')
+
+HEADER = struct.Struct('<BB')
+MATCH = struct.Struct('<BBqqqqqBB')
+L2UPDATE = struct.Struct('<BBqHB')
+CHANGE = struct.Struct('<Bqq')
+
+ENCODED_TYPES = ('match', 'last_match', 'l2update')
+MATCH_KINDS = {'match': KIND_MATCH, 'last_match': KIND_LAST_MATCH}
+MATCH_TYPES = {KIND_MATCH: 'match', KIND_LAST_MATCH: 'last_match'}
+
+
+class UnsupportedWireFormatError(Exception): pass
+
+
+def to_scaled(value):
+	"""
+	:param value: decimal string (exact) or number
+	:return: int, value * SCALE
+	"""
+	if value.__class__ is not str: return int(round(value * SCALE))
+	whole, _, frac = value.partition('.')
+	negative = whole.startswith('-')
+	scaled = abs(int(whole or '0')) * SCALE + int((frac + '00000000')[:SCALE_DIGITS])
+	return -scaled if negative else scaled
+
+
+def encode(msg):
+	"""
+	:param msg: match, last_match or l2update dict
+	:return: bytes, None if the type is not supported
+	"""
+	msg_type = msg.get('type')
+	product = msg['product_id'].encode('utf-8')
+	kind = MATCH_KINDS.get(msg_type)
+	if kind is not None:
+		return MATCH.pack(
+			VERSION, kind, parse_time_ns(msg['time']), msg.get('trade_id') or 0,
+			msg.get('sequence') or 0, to_scaled(msg['price']), to_scaled(msg['size']),
+			0 if msg.get('side') == 'buy' else 1, len(product)) + product
+	if msg_type == 'l2update':
+		changes = msg.get('changes', ())
+		parts = [L2UPDATE.pack(VERSION, KIND_L2UPDATE, parse_time_ns(msg['time']), len(changes), len(product)),
+				 product]
+		for side, price, size in changes:
+			parts.append(CHANGE.pack(0 if side == 'buy' else 1, to_scaled(price), to_scaled(size)))
+		return b''.join(parts)
+	return None
+
+
+def decode(data):
+	"""
+	:param data: bytes of an encoded record
+	:return: dict, prices and sizes as floats, time_ns as int. A match
+		(or last_match) has type, product_id, time_ns, trade_id, sequence, price, size and side;
+		an l2update type, product_id, time_ns and changes, list of
+		(side, price, size).
+	"""
+	version, kind = HEADER.unpack_from(data)
+	if version != VERSION: raise UnsupportedWireFormatError("unknown version %d" % version)
+	if kind in MATCH_TYPES:
+		_, _, time_ns, trade_id, sequence, price, size, side, product_len = MATCH.unpack_from(data)
+		start = MATCH.size
+		return {
+			'type': MATCH_TYPES[kind],
+			'product_id': data[start:start + product_len].decode('utf-8'),
+			'time_ns': time_ns, 'trade_id': trade_id, 'sequence': sequence,
+			'price': price / SCALE, 'size': size / SCALE, 'side': SIDES[side]
+		}
+	if kind == KIND_L2UPDATE:
+		_, _, time_ns, n, product_len = L2UPDATE.unpack_from(data)
+		start = L2UPDATE.size
+		product_id = data[start:start + product_len].decode('utf-8')
+		pos = start + product_len
+		changes = []
+		for side, price, size in CHANGE.iter_unpack(data[pos:pos + n * CHANGE.size]):
+			changes.append((SIDES[side], price / SCALE, size / SCALE))
+		return {'type': 'l2update', 'product_id': product_id, 'time_ns': time_ns, 'changes': changes}
+	raise UnsupportedWireFormatError("unknown kind %d" % kind)
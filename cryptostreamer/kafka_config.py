@@ -0,0 +1,146 @@
+"""
+	File name: kafka_config.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Validated tuning of the KafkaProducer: batching, linger, compression
+	and acks, with presets.
+
+	Presets:
+	- default: gzip compression, kafka-python defaults for the rest
+	- low-latency: no linger, small batches, no compression, leader ack
+	- high-throughput: 20ms linger, large batches, lz4 (falls back to gzip
+	  if lz4 is not installed), leader ack
+
+	Explicit settings always override the preset ones. aiokafka_config
+	maps the same settings to the AIOKafkaProducer options.
+"""
+from kafka import codec as kafka_codec
+
+
+PRESET_KEY = 'preset'
+DEFAULT_PRESET = 'default'
+
+KAFKA_PRESETS = {
+	'default': {
+		'compression_type': 'gzip'
+	},
+	'low-latency': {
+		'linger_ms': 0,
+		'batch_size': 16384,
+		'acks': 1,
+		'compression_type': None,
+		'max_in_flight_requests_per_connection': 5
+	},
+	'high-throughput': {
+		'linger_ms': 20,
+		'batch_size': 262144,
+		'acks': 1,
+		'compression_type': ('lz4', 'snappy', 'gzip'),
+		'max_in_flight_requests_per_connection': 5,
+		'buffer_memory': 67108864
+	}
+}
+
+COMPRESSION_CODECS = {
+	'gzip': kafka_codec.has_gzip,
+	'snappy': kafka_codec.has_snappy,
+	'lz4': kafka_codec.has_lz4,
+	'zstd': kafka_codec.has_zstd
+}
+
+ACKS = (0, 1, -1, 'all')
+
+INT_SETTINGS = {
+	'linger_ms': 0,
+	'batch_size': 1,
+	'buffer_memory': 1,
+	'max_in_flight_requests_per_connection': 1
+}
+
+
+AIOKAFKA_OPTIONS = {
+	'batch_size': 'max_batch_size'
+}
+
+AIOKAFKA_UNSUPPORTED = ('buffer_memory', 'max_in_flight_requests_per_connection')
+
+
+class InvalidKafkaConfigError(Exception): pass
+
+
+def parse_acks(v):
+	"""
+	:param v: str from the environment, '0', '1', '-1' or 'all'
+	"""
+	if v is None: return None
+	v = v.strip().lower()
+	if v == 'all': return v
+	try:
+		return int(v)
+	except ValueError:
+		raise InvalidKafkaConfigError("invalid acks %s" % v)
+
+
+def _compression(value):
+	"""
+	A tuple is a list of codecs in order of preference, the first
+	installed one is used.
+	"""
+	candidates = value if isinstance(value, tuple) else (value,)
+	for c in candidates:
+		if c is None or c == 'none': return None
+		if c not in COMPRESSION_CODECS:
+			raise InvalidKafkaConfigError("unknown compression_type %s" % c)
+		if COMPRESSION_CODECS[c](): return c
+	raise InvalidKafkaConfigError(
+		"compression_type %s is not installed" % '/'.join(candidates))
+
+
+def producer_config(kafka_kwargs):
+	"""
+	Applies the preset and validates the tuning settings.
+
+	:param kafka_kwargs: dict with KafkaProducer kwargs and an optional 'preset'
+	:return: dict of KafkaProducer kwargs
+	"""
+	kwargs = kafka_kwargs.copy()
+	preset = kwargs.pop(PRESET_KEY, None) or DEFAULT_PRESET
+	if preset not in KAFKA_PRESETS:
+		raise InvalidKafkaConfigError("unknown preset %s" % preset)
+
+	config = dict(KAFKA_PRESETS[preset])
+	config.update(kwargs)
+
+	if 'compression_type' in config:
+		config['compression_type'] = _compression(config['compression_type'])
+
+	if 'acks' in config and config['acks'] not in ACKS:
+		raise InvalidKafkaConfigError("invalid acks %s" % config['acks'])
+
+	for k, minimum in INT_SETTINGS.items():
+		if k not in config: continue
+		if not isinstance(config[k], int) or config[k] < minimum:
+			raise InvalidKafkaConfigError("%s must be an integer >= %d" % (k, minimum))
+
+	if 'buffer_memory' in config and config['buffer_memory'] < config.get('batch_size', 0):
+		raise InvalidKafkaConfigError("buffer_memory must be >= batch_size")
+
+	return config
+
+
+def aiokafka_config(kafka_kwargs):
+	"""
+	Applies the preset and validates the settings as producer_config,
+	then renames them to the AIOKafkaProducer options. The settings
+	aiokafka doesn't have (buffer_memory, max in flight requests) are
+	dropped.
+
+	:param kafka_kwargs: dict with KafkaProducer kwargs and an optional 'preset'
+	:return: dict of AIOKafkaProducer kwargs
+	"""
+	config = producer_config(kafka_kwargs)
+	for k in AIOKAFKA_UNSUPPORTED: config.pop(k, None)
+	for k, option in AIOKAFKA_OPTIONS.items():
+		if k in config: config[option] = config.pop(k)
+	if config.get('acks') == -1: config['acks'] = 'all'
+	return config
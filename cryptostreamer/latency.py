@@ -0,0 +1,95 @@
+"""
+	File name: latency.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Rolling latency percentiles per product and stage:
+		exchange_recv: exchange time field -> local receive (wall clock)
+		recv_dispatch: receive -> callbacks (buffering, decoding)
+		dispatch_ack: callbacks -> kafka acknowledgement
+"""
+from array import array
+
+
+EXCHANGE_RECV = 'exchange_recv'
+RECV_DISPATCH = 'recv_dispatch'
+DISPATCH_ACK = 'dispatch_ack'
+STAGES = (EXCHANGE_RECV, RECV_DISPATCH, DISPATCH_ACK)
+DEFAULT_WINDOW = 1024
+DEFAULT_PERCENTILES = (0.5, 0.99)
+
+
+class RollingWindow(object):
+	"""
+	Last size samples, in a preallocated array.
+	"""
+	__slots__ = ('_values', '_i', 'count')
+
+	def __init__(self, size=DEFAULT_WINDOW):
+		self._values = array('d', bytes(8 * size))
+		self._i = 0
+		self.count = 0
+
+	def add(self, value):
+		values = self._values
+		values[self._i] = value
+		self._i = (self._i + 1) % len(values)
+		self.count += 1
+
+	def samples(self):
+		return self._values[:min(self.count, len(self._values))]
+
+
+
+def percentiles(samples, ps=DEFAULT_PERCENTILES):
+	"""
+	:return: dict 'p50' -> value, ... None values if no samples
+	"""
+	samples = sorted(samples)
+	n = len(samples)
+	return {'p%g' % (p * 100): samples[min(n - 1, int(n * p))] if n else None for p in ps}
+
+
+
+class LatencyTracker(object):
+
+	def __init__(self, window=DEFAULT_WINDOW):
+		"""
+		:param window: number of samples per product and stage
+		"""
+		self._window = window
+		self._windows = {}
+
+
+	def observe(self, product_id, stage, seconds):
+		key = (product_id, stage)
+		w = self._windows.get(key)
+		if w is None: w = self._windows[key] = RollingWindow(self._window)
+		w.add(seconds)
+
+
+	def products(self):
+		return sorted(set(product_id for product_id, _ in list(self._windows)), key=str)
+
+
+	def percentiles(self, product_id=None, ps=DEFAULT_PERCENTILES):
+		"""
+		:param product_id: None for all the products
+		:return: dict stage -> {'p50': seconds, 'p99': seconds}
+		"""
+		result = {}
+		for stage in STAGES:
+			samples = []
+			for (p, s), w in list(self._windows.items()):
+				if s == stage and (product_id is None or p == product_id): samples.extend(w.samples())
+			if samples: result[stage] = percentiles(samples, ps)
+		return result
+
+
+	def stats(self):
+		"""
+		:return: flat dict of the percentiles of all the products, i.e. latency_dispatch_ack_p99
+		"""
+		stats = {}
+		for stage, values in self.percentiles().items():
+			for name, value in values.items(): stats['latency_%s_%s' % (stage, name)] = value
+		return stats
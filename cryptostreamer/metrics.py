@@ -0,0 +1,168 @@
+"""
+	File name: metrics.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Metrics in the Prometheus text format, served on /metrics.
+	The hot path only increments dict counters and histogram buckets;
+	the counters already kept by the clients (stats()) are read at
+	scrape time through collectors.
+"""
+from bisect import bisect_left
+from threading import Thread
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptostreamer import get_logger
+LOGGER = get_logger('Metrics')
+
+
+DEFAULT_PORT = 9108
+DEFAULT_PREFIX = 'cryptostreamer'
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+				   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram(object):
+	"""
+	Cumulative histogram with fixed upper bounds, in seconds.
+	"""
+	__slots__ = ('buckets', 'counts', 'sum', 'count')
+
+	def __init__(self, buckets=LATENCY_BUCKETS):
+		self.buckets = tuple(buckets)
+		self.counts = [0] * (len(self.buckets) + 1)
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value):
+		self.counts[bisect_left(self.buckets, value)] += 1
+		self.sum += value
+		self.count += 1
+
+
+
+class Metrics(object):
+
+	def __init__(self, prefix=DEFAULT_PREFIX):
+		self._prefix = prefix
+		self.messages = {}
+		self._counters = {}
+		self._histograms = {}
+		self._collectors = []
+
+
+	def count_message(self, msg_type, product_id):
+		"""
+		Counts a received message by type and product.
+		"""
+		key = (msg_type, product_id)
+		messages = self.messages
+		messages[key] = messages.get(key, 0) + 1
+
+
+	def inc(self, name, value=1):
+		self._counters[name] = self._counters.get(name, 0) + value
+
+
+	def histogram(self, name, buckets=LATENCY_BUCKETS):
+		"""
+		:return: the Histogram of name, created on the first call
+		"""
+		histogram = self._histograms.get(name)
+		if histogram is None:
+			histogram = self._histograms[name] = Histogram(buckets)
+		return histogram
+
+
+	def add_collector(self, collector):
+		"""
+		:param collector: callable returning a dict of name -> number
+			(i.e. client.stats), exported as gauges at each scrape
+		"""
+		self._collectors.append(collector)
+
+
+	def render(self):
+		"""
+		:return: str, Prometheus text exposition format
+		"""
+		p = self._prefix
+		lines = ['# TYPE %s_messages_total counter' % p]
+		for (msg_type, product_id), count in sorted(dict(self.messages).items(), key=str):
+			lines.append('%s_messages_total{type="%s",product_id="%s"} %d' % (p, msg_type, product_id, count))
+
+		for name, value in sorted(dict(self._counters).items()):
+			lines.append('# TYPE %s_%s counter' % (p, name))
+			lines.append('%s_%s %s' % (p, name, value))
+
+		for name, h in sorted(dict(self._histograms).items()):
+			lines.append('# TYPE %s_%s histogram' % (p, name))
+			cumulative = 0
+			for bound, count in zip(h.buckets, h.counts):
+				cumulative += count
+				lines.append('%s_%s_bucket{le="%s"} %d' % (p, name, bound, cumulative))
+			lines.append('%s_%s_bucket{le="+Inf"} %d' % (p, name, h.count))
+			lines.append('%s_%s_sum %s' % (p, name, h.sum))
+			lines.append('%s_%s_count %d' % (p, name, h.count))
+
+		for collector in self._collectors:
+			try:
+				values = collector()
+			except Exception as e:
+				LOGGER.error("metrics collector failed: %s", e)
+				continue
+			for name, value in sorted(values.items()):
+				if isinstance(value, (int, float)) and not isinstance(value, bool):
+					lines.append('# TYPE %s_%s gauge' % (p, name))
+					lines.append('%s_%s %s' % (p, name, value))
+		return '\n'.join(lines) + '\n'
+
+
+
+class MetricsServer(object):
+	"""
+	HTTP server exposing the metrics on /metrics, in a daemon thread.
+	"""
+
+	def __init__(self, metrics, port=DEFAULT_PORT, host='0.0.0.0'):
+		self._metrics = metrics
+		self._address = (host, port)
+		self._server = None
+		self._thread = None
+
+
+	@property
+	def port(self):
+		return self._server.server_address[1]
+
+
+	def start(self):
+		metrics = self._metrics
+
+		class Handler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path.split('?')[0] != '/metrics':
+					self.send_error(404)
+					return
+				body = metrics.render().encode('utf-8')
+				self.send_response(200)
+				self.send_header('Content-Type', 'text/plain; version=0.0.4')
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, format, *args): pass
+
+		self._server = ThreadingHTTPServer(self._address, Handler)
+		self._server.daemon_threads = True
+		self._thread = Thread(target=self._server.serve_forever, name='MetricsServer')
+		self._thread.daemon = True
+		self._thread.start()
+		LOGGER.info("metrics on port %d", self.port)
+
+
+	def stop(self):
+		if self._server is None: return
+		self._server.shutdown()
+		self._server.server_close()
+		self._thread.join()
+		self._server = None
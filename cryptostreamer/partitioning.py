@@ -0,0 +1,84 @@
+"""
+	File name: partitioning.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Kafka partitioning strategies of the exchange messages and the
+	headers that let the consumers route them without decoding the value.
+
+		product: key product_id, partition by the kafka hash of the key (default)
+		map: explicit product_id -> partition, the others by key hash
+		round-robin: partitions in turn, key product_id:sequence so that
+			the consumers can restore the order of a product
+"""
+
+PARTITIONER_PRODUCT = 'product'
+PARTITIONER_MAP = 'map'
+PARTITIONER_ROUND_ROBIN = 'round-robin'
+
+
+class InvalidPartitionerError(Exception): pass
+
+
+class MapPartitioner(object):
+	needs_partitions = False
+
+	def __init__(self, partition_map):
+		"""
+		:param partition_map: dict product_id -> partition
+		"""
+		self._map = {k: int(v) for k, v in partition_map.items()}
+
+	def route(self, product_id, sequence, partitions):
+		"""
+		:return: (key, partition), partition None for the kafka partitioner
+		"""
+		return product_id, self._map.get(product_id)
+
+
+
+class RoundRobinPartitioner(object):
+	needs_partitions = True
+
+	def __init__(self):
+		self._i = 0
+
+	def route(self, product_id, sequence, partitions):
+		key = product_id if sequence is None else '%s:%d' % (product_id, sequence)
+		if not partitions: return key, None
+		self._i += 1
+		return key, partitions[self._i % len(partitions)]
+
+
+
+def create_partitioner(name=None, partition_map=None):
+	"""
+	:return: partitioner with a route(product_id, sequence, partitions) method,
+		None for the default product strategy
+	"""
+	if name is None or name == PARTITIONER_PRODUCT: return None
+	if name == PARTITIONER_MAP:
+		if not partition_map: raise InvalidPartitionerError("map partitioner needs a partition_map")
+		return MapPartitioner(partition_map)
+	if name == PARTITIONER_ROUND_ROBIN: return RoundRobinPartitioner()
+	raise InvalidPartitionerError(name)
+
+
+def parse_partition_map(items):
+	"""
+	:param items: list of 'product_id:partition', i.e. from the environment
+	:return: dict, None if items is None
+	"""
+	if items is None: return None
+	try:
+		return {k.strip(): int(v) for k, v in (item.rsplit(':', 1) for item in items)}
+	except ValueError:
+		raise InvalidPartitionerError("invalid partition map %s" % items)
+
+
+def message_headers(msg_type, product_id, sequence):
+	"""
+	:return: kafka headers, list of (str, bytes)
+	"""
+	headers = [('type', msg_type.encode('utf-8')), ('product_id', product_id.encode('utf-8'))]
+	if sequence is not None: headers.append(('sequence', b'%d' % sequence))
+	return headers
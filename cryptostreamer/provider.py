@@ -25,6 +25,16 @@ class ProviderClient(object):
 
 
 
+	def stats(self):
+		"""
+		Counters of the client (buffers, errors, ...).
+
+		:return: dict
+		"""
+		return {}
+
+
+
 	def on_message(self, msg):
 		"""
 		Callback for all the messages.
@@ -52,6 +62,13 @@ class ProviderClient(object):
 		return int(s)
 
 
+	@classmethod
+	def get_float_from_env(cls,key):
+		if environ.get(key) is None: return
+		s = cls.get_str_from_env(key)
+		return float(s)
+
+
 	@classmethod
 	def get_list_from_env(cls,key):
 		if environ.get(key) is None: return
@@ -0,0 +1,129 @@
+"""
+	File name: ringbuffer.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Bounded, preallocated FIFO used to decouple the websocket receive
+	thread from the decoding and processing of the messages.
+"""
+from threading import Lock, Condition
+
+
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop-oldest'
+OVERFLOW_DISCONNECT = 'disconnect'
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DISCONNECT)
+
+
+class InvalidOverflowPolicyError(Exception): pass
+class RingBufferOverflowError(Exception): pass
+
+
+class RingBuffer(object):
+	"""
+	Single producer / single consumer ring buffer.
+	The slots are allocated once, put and get only move the indexes.
+
+	When the buffer is full, put behaves according to the overflow policy:
+	- block: waits for the consumer to free a slot
+	- drop-oldest: overwrites the oldest item and counts it as dropped
+	- disconnect: raises RingBufferOverflowError
+	"""
+
+	def __init__(self,capacity,overflow=OVERFLOW_BLOCK):
+		if overflow not in OVERFLOW_POLICIES: raise InvalidOverflowPolicyError(overflow)
+		if capacity < 1: raise ValueError("capacity must be positive")
+		self._slots = [None] * capacity
+		self._capacity = capacity
+		self._overflow = overflow
+		self._head = 0
+		self._size = 0
+		self._closed = False
+		lock = Lock()
+		self._not_empty = Condition(lock)
+		self._not_full = Condition(lock)
+
+		self.dropped = 0
+		self.high_watermark = 0
+
+
+	def __len__(self):
+		return self._size
+
+
+	@property
+	def capacity(self):
+		return self._capacity
+
+
+	@property
+	def closed(self):
+		return self._closed
+
+
+	def put(self,item):
+		"""
+		Appends the item at the tail of the buffer.
+
+		:return: False if the buffer is closed, True otherwise
+		"""
+		with self._not_full:
+			if self._size == self._capacity:
+				if self._overflow == OVERFLOW_BLOCK:
+					while self._size == self._capacity and not self._closed:
+						self._not_full.wait()
+				elif self._overflow == OVERFLOW_DROP_OLDEST:
+					self._slots[self._head] = None
+					self._head = (self._head + 1) % self._capacity
+					self._size -= 1
+					self.dropped += 1
+				else:
+					self.dropped += 1
+					raise RingBufferOverflowError(
+						"ring buffer full (%d frames)" % self._capacity)
+			if self._closed: return False
+
+			self._slots[(self._head + self._size) % self._capacity] = item
+			self._size += 1
+			if self._size > self.high_watermark: self.high_watermark = self._size
+			self._not_empty.notify()
+			return True
+
+
+	def get(self,timeout=None):
+		"""
+		Pops the item at the head of the buffer, waiting for one if empty.
+
+		:return: the item, None on timeout or when closed and drained
+		"""
+		with self._not_empty:
+			if self._size == 0:
+				if self._closed: return None
+				self._not_empty.wait(timeout)
+				if self._size == 0: return None
+
+			item = self._slots[self._head]
+			self._slots[self._head] = None
+			self._head = (self._head + 1) % self._capacity
+			self._size -= 1
+			self._not_full.notify()
+			return item
+
+
+	def close(self):
+		"""
+		No more items are accepted, the consumer can still drain the
+		remaining ones.
+		"""
+		with self._not_empty:
+			self._closed = True
+			self._not_empty.notify_all()
+			self._not_full.notify_all()
+
+
+	def stats(self):
+		return {
+			'buffer_depth': self._size,
+			'buffer_capacity': self._capacity,
+			'buffer_high_watermark': self.high_watermark,
+			'buffer_dropped': self.dropped
+		}
@@ -0,0 +1,300 @@
+"""
+	File name: sinks.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Sinks are destinations of the messages (kafka, files, stdout, udp).
+	SinkRouter attaches one or more sinks to any ProviderClient: each
+	message is encoded once and the batch is shared by all the sinks.
+"""
+import asyncio
+import os
+import sys
+import socket
+from threading import Lock
+from time import monotonic
+
+from cryptostreamer.codec import get_codec
+from cryptostreamer.kafka_config import producer_config
+
+from cryptostreamer import get_logger
+LOGGER = get_logger('Sinks')
+
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_DELAY = 1.0
+DEFAULT_FILE_MAX_BYTES = 128 * 1024 * 1024
+SKIPPED_TYPES = ('heartbeat', 'subscriptions')
+
+
+class Sink(object):
+	"""
+	Interface of a sink. Records are (key, value) tuples, with key a
+	string (the product id) and value the encoded message bytes.
+	"""
+
+	def write(self, key, value):
+		self.write_many([(key, value)])
+
+	def write_many(self, records):
+		raise NotImplementedError()
+
+	def flush(self):
+		pass
+
+	def close(self):
+		self.flush()
+
+
+
+class StdoutSink(Sink):
+	"""
+	Newline delimited values on stdout.
+	"""
+
+	def __init__(self, stream=None):
+		self._stream = stream or sys.stdout.buffer
+
+	def write_many(self, records):
+		self._stream.write(b''.join(value + b'\n' for _, value in records))
+
+	def flush(self):
+		self._stream.flush()
+
+
+
+class FileSink(Sink):
+	"""
+	Newline delimited values, rotated when the file reaches max_bytes:
+	<directory>/<prefix>-000001.ndjson, <prefix>-000002.ndjson ...
+	"""
+
+	def __init__(self, directory, prefix='gdax', max_bytes=DEFAULT_FILE_MAX_BYTES):
+		self._dir = directory
+		self._prefix = prefix
+		self._max_bytes = max_bytes
+		if not os.path.isdir(directory): os.makedirs(directory)
+		self._index = self._last_index()
+		self._file = None
+		self._size = 0
+		self._open_next()
+
+
+	@property
+	def path(self):
+		return self._path(self._index)
+
+
+	def write_many(self, records):
+		data = b''.join(value + b'\n' for _, value in records)
+		self._file.write(data)
+		self._size += len(data)
+		if self._size >= self._max_bytes: self._open_next()
+
+
+	def flush(self):
+		self._file.flush()
+
+
+	def close(self):
+		self._file.close()
+
+
+	def _open_next(self):
+		if self._file is not None: self._file.close()
+		self._index += 1
+		self._file = open(self.path, 'ab')
+		self._size = self._file.tell()
+
+
+	def _path(self, index):
+		return os.path.join(self._dir, '%s-%06d.ndjson' % (self._prefix, index))
+
+
+	def _last_index(self):
+		start = self._prefix + '-'
+		indexes = [int(f[len(start):-len('.ndjson')]) for f in os.listdir(self._dir)
+				   if f.startswith(start) and f.endswith('.ndjson')]
+		return max(indexes) if indexes else 0
+
+
+
+class UdpSink(Sink):
+	"""
+	One datagram per value, fire and forget.
+	"""
+
+	def __init__(self, host, port):
+		self._address = (host, port)
+		self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.errors = 0
+
+	def write_many(self, records):
+		sendto, address = self._socket.sendto, self._address
+		for _, value in records:
+			try:
+				sendto(value, address)
+			except OSError as e:
+				self.errors += 1
+				LOGGER.debug("udp send failed: %s", e)
+
+	def close(self):
+		self._socket.close()
+
+
+
+class KafkaSink(Sink):
+	"""
+	Sends the records to a topic without waiting for the acknowledgement;
+	flush waits for all of them.
+	"""
+
+	def __init__(self, topic, kafka_kwargs={}, kafka_producer=None):
+		self._topic = topic
+		if kafka_producer is None:
+			from kafka import KafkaProducer
+			kwargs = producer_config(kafka_kwargs)
+			kwargs['key_serializer'] = str.encode
+			kafka_producer = KafkaProducer(**kwargs)
+		self._producer = kafka_producer
+
+	def write_many(self, records):
+		send, topic = self._producer.send, self._topic
+		for key, value in records: send(topic, key=key, value=value)
+
+	def flush(self):
+		self._producer.flush()
+
+	def close(self):
+		self._producer.close()
+
+
+
+class SinkRouter(object):
+
+	def __init__(self, sinks, batch_size=DEFAULT_BATCH_SIZE, max_delay=DEFAULT_MAX_DELAY,
+				 codec=None, skipped_types=SKIPPED_TYPES):
+		"""
+		:param sinks: list of Sink
+		:param batch_size: records are written to the sinks in batches of this size
+		:param max_delay: or when the oldest record in the batch is older than max_delay seconds.
+			The sinks themselves are flushed (i.e. the kafka producer) only by flush,
+			on stop and by the client timer.
+		:param skipped_types: message types that are not written
+		"""
+		self._sinks = list(sinks)
+		self._batch_size = batch_size
+		self._max_delay = max_delay
+		self._dumps = get_codec(codec).dumps
+		self._skipped_types = skipped_types
+		self._batch = []
+		self._batch_started = 0.0
+		self._lock = Lock()
+		self._write_lock = Lock()
+		self._flush_lock = Lock()
+		self.written = 0
+		self.errors = 0
+
+
+	def attach(self, client):
+		"""
+		Wraps the on_message callback and the stop method of the client,
+		the batch is flushed when the client stops and by schedule_flush.
+		With an asyncio client (i.e. AsyncGdaxClient) the wrappers are
+		coroutines too.
+
+		:param client: ProviderClient
+		:return: client
+		"""
+		on_message, stop = client.on_message, client.stop
+
+		if asyncio.iscoroutinefunction(on_message):
+			async def on_message_with_sinks(msg):
+				await on_message(msg)
+				self.add(msg)
+		else:
+			def on_message_with_sinks(msg):
+				on_message(msg)
+				self.add(msg)
+
+		if asyncio.iscoroutinefunction(stop):
+			async def stop_with_sinks():
+				await stop()
+				self.close()
+		else:
+			def stop_with_sinks():
+				stop()
+				self.close()
+
+		client.on_message = on_message_with_sinks
+		client.stop = stop_with_sinks
+		self.schedule_flush(client)
+		return client
+
+
+	def schedule_flush(self, client):
+		"""
+		Flushes every max_delay seconds with a timer of the client (i.e. a
+		WebsocketClient), so that the records of a quiet feed are not held
+		until its next message. Clients without timers and asyncio clients,
+		that don't run them, are left as they are.
+
+		:param client: ProviderClient
+		:return: timers.Timer, None if the client has no timers
+		"""
+		if not hasattr(client, 'add_timer') or asyncio.iscoroutinefunction(client.start): return None
+		return client.add_timer(self._max_delay, self.flush)
+
+
+	def add(self, msg):
+		if msg.get('type') in self._skipped_types: return
+		record = (msg.get('product_id', ''), self._dumps(msg))
+		with self._lock:
+			if not self._batch: self._batch_started = monotonic()
+			self._batch.append(record)
+			full = len(self._batch) >= self._batch_size or monotonic() - self._batch_started >= self._max_delay
+		if full: self._write_batch()
+
+
+	def flush(self):
+		"""
+		Writes the batch and flushes the sinks. The batches filled during
+		the flush of the sinks (i.e. waiting for the kafka acks) are written
+		without waiting for it.
+		"""
+		self._write_batch()
+		with self._flush_lock:
+			for sink in self._sinks:
+				try:
+					sink.flush()
+				except Exception as e:
+					self._on_sink_error(sink, e)
+
+
+	def _write_batch(self):
+		"""
+		Writes the batch to each sink, a failing sink doesn't stop the others.
+		"""
+		with self._write_lock:
+			with self._lock:
+				batch, self._batch = self._batch, []
+			if not batch: return
+			for sink in self._sinks:
+				try:
+					sink.write_many(batch)
+				except Exception as e:
+					self._on_sink_error(sink, e)
+			self.written += len(batch)
+
+
+	def _on_sink_error(self, sink, e):
+		self.errors += 1
+		LOGGER.error("%s failed: %s", type(sink).__name__, e)
+
+
+	def close(self):
+		self.flush()
+		for sink in self._sinks: sink.close()
+
+
+	def stats(self):
+		return {'sink_written': self.written, 'sink_batch': len(self._batch), 'sink_errors': self.errors}
@@ -0,0 +1,439 @@
+"""
+	File name: spool.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Durable local write-ahead spool: an append-only log of records split
+	in fixed size, memory-mapped segment files, and a drainer thread that
+	replays it in order.
+
+	Record layout: <length u32><crc32 u32><payload>. A record is visible
+	once its header is written (after the payload), so a zero length
+	marks the end of the written data, and a bad crc a torn write.
+	The read position is persisted atomically (write + rename) in the
+	'offset' file on commit: after a crash the records read but not yet
+	committed are replayed again (at least once).
+"""
+import os
+import mmap
+import struct
+import zlib
+from threading import Lock, Thread, Event
+from time import monotonic, sleep
+
+from cryptostreamer import get_logger
+LOGGER = get_logger('Spool')
+
+
+HEADER = struct.Struct('<II')
+RECORD_KEYS = struct.Struct('<HH')
+RECORD_ROUTING = struct.Struct('<iH')
+RECORD_HEADER = struct.Struct('<HH')
+ROUTED = 0x8000
+OFFSET = struct.Struct('<QQ')
+SEGMENT_SUFFIX = '.seg'
+OFFSET_FILE = 'offset'
+
+DEFAULT_SEGMENT_SIZE = 16 * 1024 * 1024
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+class RecordTooLargeError(Exception): pass
+class InvalidSpoolSizeError(Exception): pass
+
+
+def pack_record(topic, key, value, partition=None, headers=None):
+	"""
+	:param topic: str
+	:param key: str
+	:param value: bytes
+	:param partition: int, None for the kafka partitioner
+	:param headers: kafka headers, list of (str, bytes)
+	:return: bytes payload for Spool.append
+
+	<topic length u16><key length u16><topic><key>, then if the ROUTED bit
+	of the topic length is set <partition i32, -1 for None><headers u16> and
+	for each header <name length u16><value length u16><name><value>,
+	then the value.
+	"""
+	topic, key = topic.encode('utf-8'), key.encode('utf-8')
+	if partition is None and not headers:
+		return RECORD_KEYS.pack(len(topic), len(key)) + topic + key + value
+	parts = [RECORD_KEYS.pack(len(topic) | ROUTED, len(key)), topic, key,
+			 RECORD_ROUTING.pack(-1 if partition is None else partition, len(headers or ()))]
+	for name, header_value in headers or ():
+		name = name.encode('utf-8')
+		parts.append(RECORD_HEADER.pack(len(name), len(header_value)))
+		parts.append(name)
+		parts.append(header_value)
+	parts.append(value)
+	return b''.join(parts)
+
+
+def unpack_record(payload):
+	"""
+	:return: (topic, key, value, partition, headers), partition and headers
+		None if not set
+	"""
+	topic_len, key_len = RECORD_KEYS.unpack_from(payload)
+	routed = topic_len & ROUTED
+	topic_len &= ~ROUTED
+	start = RECORD_KEYS.size
+	topic = payload[start:start + topic_len].decode('utf-8')
+	key = payload[start + topic_len:start + topic_len + key_len].decode('utf-8')
+	pos = start + topic_len + key_len
+	if not routed: return topic, key, payload[pos:], None, None
+
+	partition, n = RECORD_ROUTING.unpack_from(payload, pos)
+	pos += RECORD_ROUTING.size
+	headers = []
+	for _ in range(n):
+		name_len, value_len = RECORD_HEADER.unpack_from(payload, pos)
+		pos += RECORD_HEADER.size
+		headers.append((payload[pos:pos + name_len].decode('utf-8'), payload[pos + name_len:pos + name_len + value_len]))
+		pos += name_len + value_len
+	return topic, key, payload[pos:], None if partition < 0 else partition, headers or None
+
+
+class Segment(object):
+
+	def __init__(self, path, size):
+		self.path = path
+		new = not os.path.exists(path)
+		self._file = open(path, 'r+b' if not new else 'w+b')
+		if new: self._file.truncate(size)
+		self.size = os.path.getsize(path)
+		self.mm = mmap.mmap(self._file.fileno(), self.size)
+
+
+	def record_at(self, pos):
+		"""
+		:return: (payload, next position) or (None, pos) if no valid record
+		"""
+		if pos + HEADER.size > self.size: return None, pos
+		length, crc = HEADER.unpack_from(self.mm, pos)
+		end = pos + HEADER.size + length
+		if length == 0 or end > self.size: return None, pos
+		payload = self.mm[pos + HEADER.size:end]
+		if zlib.crc32(payload) & 0xffffffff != crc: return None, pos
+		return payload, end
+
+
+	def write_at(self, pos, payload):
+		"""
+		:return: next position, None if the record doesn't fit
+		"""
+		end = pos + HEADER.size + len(payload)
+		if end > self.size: return None
+		self.mm[pos + HEADER.size:end] = payload
+		HEADER.pack_into(self.mm, pos, len(payload), zlib.crc32(payload) & 0xffffffff)
+		return end
+
+
+	def close(self):
+		self.mm.flush()
+		self.mm.close()
+		self._file.close()
+
+
+
+class Spool(object):
+
+	def __init__(self, directory, segment_size=DEFAULT_SEGMENT_SIZE, max_bytes=DEFAULT_MAX_BYTES):
+		"""
+		:param segment_size: size of each segment file, max size of a record
+		:param max_bytes: max disk usage, at least two segments. When a new
+			segment would exceed it, the oldest segment is deleted and its
+			records are lost (counted in dropped_segments).
+		"""
+		if max_bytes < 2 * segment_size:
+			raise InvalidSpoolSizeError("max_bytes %d is less than two segments of %d bytes"
+										% (max_bytes, segment_size))
+		self._dir = directory
+		self._segment_size = segment_size
+		self._max_segments = max_bytes // segment_size
+		self._lock = Lock()
+		self._segments = {}
+		self.appended = 0
+		self.read_count = 0
+		self.dropped_segments = 0
+		self._pending = 0
+		self._peeked = None
+
+		if not os.path.isdir(directory): os.makedirs(directory)
+		ids = self._segment_ids()
+		self._write_id = ids[-1] if ids else 1
+		self._read_id, self._read_pos = self._load_offset(ids)
+		self._write_pos = self._recover()
+
+
+	def __len__(self):
+		return self._pending
+
+
+	def append(self, payload):
+		with self._lock:
+			self._append(payload)
+
+
+	def append_if_pending(self, payload):
+		"""
+		Appends the record only if the spool is not empty, atomically,
+		so that the new records are not sent before the spooled ones.
+
+		:return: True if appended
+		"""
+		with self._lock:
+			if self._pending == 0: return False
+			self._append(payload)
+			return True
+
+
+	def peek(self):
+		"""
+		:return: the next record to read, None if empty
+		"""
+		with self._lock:
+			payload, segment_id, pos = self._next()
+			self._peeked = None
+			if payload is not None: self._peeked = (self._read_id, self._read_pos, segment_id, pos)
+			return payload
+
+
+	def advance(self):
+		"""
+		Moves the read position after the record returned by peek. If the
+		read position has moved meanwhile (its segment was dropped by a
+		rotation) the position is kept: the next peek returns the first
+		record not dropped.
+		"""
+		with self._lock:
+			peeked, self._peeked = self._peeked, None
+			if peeked is None: return
+			read_id, read_pos, segment_id, pos = peeked
+			if read_id != self._read_id or read_pos != self._read_pos: return
+			if segment_id != self._read_id: self._remove_segments_before(segment_id)
+			self._read_id, self._read_pos = segment_id, pos
+			self._pending -= 1
+			self.read_count += 1
+
+
+	def commit(self):
+		"""
+		Persists the read position.
+		"""
+		with self._lock:
+			self._segment(self._write_id).mm.flush()
+			path = os.path.join(self._dir, OFFSET_FILE)
+			with open(path + '.tmp', 'wb') as f:
+				f.write(OFFSET.pack(self._read_id, self._read_pos))
+				f.flush()
+				os.fsync(f.fileno())
+			os.replace(path + '.tmp', path)
+
+
+	def size_bytes(self):
+		"""
+		Bytes not yet read.
+		"""
+		segments = self._write_id - self._read_id
+		return segments * self._segment_size + self._write_pos - self._read_pos
+
+
+	def close(self):
+		self.commit()
+		with self._lock:
+			for s in self._segments.values(): s.close()
+			self._segments = {}
+
+
+	def stats(self):
+		return {
+			'spool_records': self._pending,
+			'spool_bytes': self.size_bytes(),
+			'spool_appended': self.appended,
+			'spool_drained': self.read_count,
+			'spool_dropped_segments': self.dropped_segments
+		}
+
+
+
+	def _append(self, payload):
+		if len(payload) + HEADER.size > self._segment_size:
+			raise RecordTooLargeError(len(payload))
+		pos = self._segment(self._write_id).write_at(self._write_pos, payload)
+		if pos is None:
+			self._rotate()
+			pos = self._segment(self._write_id).write_at(0, payload)
+		self._write_pos = pos
+		self._pending += 1
+		self.appended += 1
+
+
+	def _rotate(self):
+		self._segment(self._write_id).mm.flush()
+		self._write_id += 1
+		self._write_pos = 0
+		if self._write_id - self._read_id + 1 > self._max_segments:
+			dropped = self._read_id
+			LOGGER.error("spool full, dropping segment %d", dropped)
+			self._pending -= self._count_records(dropped, self._read_pos)
+			self.dropped_segments += 1
+			self._read_id, self._read_pos = dropped + 1, 0
+			self._remove_segments_before(self._read_id)
+
+
+	def _next(self):
+		"""
+		:return: (payload, segment_id, next position) from the read position
+		"""
+		segment_id, pos = self._read_id, self._read_pos
+		while True:
+			payload, end = self._segment(segment_id).record_at(pos)
+			if payload is not None: return payload, segment_id, end
+			if segment_id >= self._write_id: return None, segment_id, pos
+			segment_id, pos = segment_id + 1, 0
+
+
+	def _count_records(self, segment_id, pos):
+		segment = self._segment(segment_id)
+		count = 0
+		while True:
+			payload, pos = segment.record_at(pos)
+			if payload is None: return count
+			count += 1
+
+
+	def _recover(self):
+		"""
+		Finds the end of the written data and counts the pending records.
+		"""
+		self._pending = 0
+		pos = 0
+		for segment_id in range(self._read_id, self._write_id + 1):
+			start = self._read_pos if segment_id == self._read_id else 0
+			segment = self._segment(segment_id)
+			pos = start
+			while True:
+				payload, end = segment.record_at(pos)
+				if payload is None: break
+				self._pending += 1
+				pos = end
+		return pos
+
+
+	def _segment(self, segment_id):
+		segment = self._segments.get(segment_id)
+		if segment is None:
+			segment = Segment(self._segment_path(segment_id), self._segment_size)
+			self._segments[segment_id] = segment
+		return segment
+
+
+	def _remove_segments_before(self, segment_id):
+		for old_id in [i for i in self._segments if i < segment_id]:
+			self._segments.pop(old_id).close()
+		for old_id in self._segment_ids():
+			if old_id < segment_id: os.remove(self._segment_path(old_id))
+
+
+	def _segment_path(self, segment_id):
+		return os.path.join(self._dir, '%020d%s' % (segment_id, SEGMENT_SUFFIX))
+
+
+	def _segment_ids(self):
+		return sorted(int(f[:-len(SEGMENT_SUFFIX)]) for f in os.listdir(self._dir)
+					  if f.endswith(SEGMENT_SUFFIX))
+
+
+	def _load_offset(self, ids):
+		path = os.path.join(self._dir, OFFSET_FILE)
+		first, last = (ids[0], ids[-1]) if ids else (1, 1)
+		if not os.path.exists(path): return first, 0
+		with open(path, 'rb') as f:
+			segment_id, pos = OFFSET.unpack(f.read(OFFSET.size))
+		if segment_id < first or segment_id > last:
+			if segment_id > last: LOGGER.warning("spool offset %d past the last segment %d", segment_id, last)
+			return first, 0
+		return segment_id, pos
+
+
+
+class SpoolDrainer(object):
+	"""
+	Background thread that replays the spool in order through send.
+	send(payload) must block until the record is acknowledged and raise
+	on failure: the record is then retried after retry_interval seconds.
+	"""
+
+	def __init__(self, spool, send, retry_interval=1.0, commit_every=100):
+		self._spool = spool
+		self._send = send
+		self._retry_interval = retry_interval
+		self._commit_every = commit_every
+		self._wakeup = Event()
+		self._running = False
+		self._thread = None
+		self.failures = 0
+		self._rate = 0.0
+		self._rate_count = 0
+		self._rate_since = monotonic()
+
+
+	def start(self):
+		self._running = True
+		self._thread = Thread(target=self._run, name='SpoolDrainer')
+		self._thread.daemon = True
+		self._thread.start()
+
+
+	def stop(self):
+		self._running = False
+		self._wakeup.set()
+		if self._thread is not None: self._thread.join()
+
+
+	def notify(self):
+		"""
+		Wakes up the drainer, i.e. when a record is appended.
+		"""
+		self._wakeup.set()
+
+
+	def stats(self):
+		return {'spool_drain_rate': self._rate, 'spool_drain_failures': self.failures}
+
+
+	def _run(self):
+		uncommitted = 0
+		while self._running:
+			payload = self._spool.peek()
+			if payload is None:
+				if uncommitted:
+					self._spool.commit()
+					uncommitted = 0
+				self._wakeup.wait(self._retry_interval)
+				self._wakeup.clear()
+				continue
+			try:
+				self._send(payload)
+			except Exception as e:
+				self.failures += 1
+				LOGGER.warning("spool drain failed: %s", e)
+				sleep(self._retry_interval)
+				continue
+			self._spool.advance()
+			uncommitted += 1
+			self._update_rate()
+			if uncommitted >= self._commit_every:
+				self._spool.commit()
+				uncommitted = 0
+		if uncommitted: self._spool.commit()
+
+
+	def _update_rate(self):
+		self._rate_count += 1
+		elapsed = monotonic() - self._rate_since
+		if elapsed >= 1.0:
+			self._rate = self._rate_count / elapsed
+			self._rate_count = 0
+			self._rate_since = monotonic()
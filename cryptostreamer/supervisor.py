@@ -0,0 +1,189 @@
+"""
+	File name: supervisor.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	ShardSupervisor partitions the products into N shards and runs each
+	shard in its own process, with its own connection and producer.
+	Dead shards are restarted and their counters aggregated.
+"""
+
+import multiprocessing
+from threading import Thread
+from time import time, sleep
+from queue import Empty
+
+from cryptostreamer import get_logger
+LOGGER = get_logger('ShardSupervisor')
+
+
+DEFAULT_REPORT_INTERVAL = 5
+DEFAULT_RESTART_DELAY = 1
+
+
+class NoShardsError(Exception): pass
+
+
+def partition_products(products, shards):
+	"""
+	Round robin partitioning of the products, empty shards are removed.
+
+	:param products: list of product ids
+	:param shards: number of shards
+	:return: list of lists of products
+	"""
+	if shards < 1: raise NoShardsError()
+	products = sorted(set(products))
+	partitions = [products[i::shards] for i in range(shards)]
+	return [p for p in partitions if p]
+
+
+def _run_shard(client_factory, products, shard_id, reports, report_interval, shard_id_arg=None):
+	"""
+	Process target: creates the client for the shard products and sends
+	its stats() to the supervisor every report_interval seconds.
+	"""
+	kwargs = {'products': products}
+	if shard_id_arg is not None: kwargs[shard_id_arg] = shard_id
+	client = client_factory(**kwargs)
+
+	def report():
+		while True:
+			try:
+				reports.put((shard_id, client.stats()))
+			except Exception as e:
+				LOGGER.error("shard %d report failed: %s", shard_id, e)
+			sleep(report_interval)
+
+	reporter = Thread(target=report, name='ShardReporter')
+	reporter.daemon = True
+	reporter.start()
+	client.start()
+
+
+class ShardSupervisor(object):
+
+	def __init__(self, client_factory, products, shards,
+				 report_interval=DEFAULT_REPORT_INTERVAL, restart_delay=DEFAULT_RESTART_DELAY,
+				 shard_id_arg=None):
+		"""
+		:param client_factory: callable, client_factory(products=[...]) returns
+			a ProviderClient. It must be picklable (module level function or classmethod).
+		:param products: all the products to stream
+		:param shards: number of processes
+		:param shard_id_arg: if set, the shard id is passed to client_factory
+			with this keyword, i.e. to give each shard its own directories
+		"""
+		self._client_factory = client_factory
+		self._shard_id_arg = shard_id_arg
+		self._partitions = partition_products(products, shards)
+		self._report_interval = report_interval
+		self._restart_delay = restart_delay
+		self._ctx = multiprocessing.get_context()
+		self._reports = self._ctx.Queue()
+		self._processes = [None] * len(self._partitions)
+		self._shard_stats = [{} for _ in self._partitions]
+		self._reported_at = [None] * len(self._partitions)
+		self._restarts = [0] * len(self._partitions)
+		self._running = False
+
+
+	@property
+	def partitions(self):
+		return self._partitions
+
+
+	def start(self):
+		"""
+		Starts the shards and supervises them until stop() is called.
+		"""
+		self._running = True
+		for shard_id in range(len(self._partitions)): self._start_shard(shard_id)
+		while self._running:
+			self._collect_reports(self._report_interval)
+			self._restart_dead_shards()
+
+
+	def stop(self):
+		LOGGER.info("stop")
+		self._running = False
+		for p in self._processes:
+			if p is not None and p.is_alive(): p.terminate()
+		for p in self._processes:
+			if p is not None: p.join()
+
+
+	def stats(self):
+		"""
+		Aggregated counters of all the shards: numeric counters are summed
+		up in 'totals', 'shards' has the health and stats of each shard.
+		"""
+		now = time()
+		totals = {}
+		shards = []
+		for shard_id, products in enumerate(self._partitions):
+			stats = self._shard_stats[shard_id]
+			for k, v in stats.items():
+				if isinstance(v, (int, float)) and not isinstance(v, bool):
+					totals[k] = totals.get(k, 0) + v
+			shards.append({
+				'products': products,
+				'alive': self._is_alive(shard_id),
+				'healthy': self._is_healthy(shard_id, now),
+				'restarts': self._restarts[shard_id],
+				'stats': stats
+			})
+		return {
+			'shards': shards,
+			'alive': sum(1 for s in shards if s['alive']),
+			'healthy': sum(1 for s in shards if s['healthy']),
+			'restarts': sum(self._restarts),
+			'totals': totals
+		}
+
+
+
+	def _start_shard(self, shard_id):
+		products = self._partitions[shard_id]
+		LOGGER.info("starting shard %d: %s", shard_id, products)
+		p = self._ctx.Process(
+			target=_run_shard, name='shard-%d' % shard_id,
+			args=(self._client_factory, products, shard_id,
+				  self._reports, self._report_interval, self._shard_id_arg))
+		p.daemon = True
+		p.start()
+		self._processes[shard_id] = p
+
+
+	def _restart_dead_shards(self):
+		for shard_id, p in enumerate(self._processes):
+			if not self._running: return
+			if p is None or p.is_alive(): continue
+			LOGGER.error("shard %d exited with code %s, restarting", shard_id, p.exitcode)
+			p.join()
+			self._restarts[shard_id] += 1
+			sleep(self._restart_delay)
+			self._start_shard(shard_id)
+
+
+	def _collect_reports(self, timeout):
+		deadline = time() + timeout
+		while True:
+			remaining = deadline - time()
+			if remaining <= 0: return
+			try:
+				shard_id, stats = self._reports.get(timeout=remaining)
+			except Empty:
+				return
+			self._shard_stats[shard_id] = stats
+			self._reported_at[shard_id] = time()
+
+
+	def _is_alive(self, shard_id):
+		p = self._processes[shard_id]
+		return p is not None and p.is_alive()
+
+
+	def _is_healthy(self, shard_id, now):
+		reported_at = self._reported_at[shard_id]
+		if reported_at is None or not self._is_alive(shard_id): return False
+		return now - reported_at < 3 * self._report_interval
@@ -0,0 +1,152 @@
+"""
+	File name: timers.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Periodic timers on the monotonic clock, run by one daemon thread
+	independently of the message arrival (pings, watchdogs, flushes,
+	stats snapshots). The timers are kept in a heap by deadline, the
+	thread sleeps until the next one is due.
+"""
+from heapq import heappush, heappop
+from threading import Condition, Thread, current_thread
+from time import monotonic
+
+from cryptostreamer import get_logger
+LOGGER = get_logger('TimerScheduler')
+
+
+class Timer(object):
+	__slots__ = ('interval', 'callback', 'name', 'deadline', 'cancelled')
+
+	def __init__(self, interval, callback, name, deadline):
+		self.interval = interval
+		self.callback = callback
+		self.name = name
+		self.deadline = deadline
+		self.cancelled = False
+
+	def cancel(self):
+		self.cancelled = True
+
+
+
+class TimerScheduler(object):
+
+	def __init__(self, name='Timers', clock=monotonic):
+		"""
+		:param name: name of the thread
+		:param clock: function returning the time in seconds, monotonic by default
+		"""
+		self._name = name
+		self._clock = clock
+		self._heap = []
+		self._seq = 0
+		self._cond = Condition()
+		self._thread = None
+		self._stopped_thread = None
+		self._running = False
+		self.runs = 0
+		self.errors = 0
+
+
+	def schedule(self, interval, callback, name=None, delay=None):
+		"""
+		Calls callback() every interval seconds. A callback taking longer
+		than the interval doesn't pile up runs, the missed ones are skipped.
+
+		:param delay: seconds before the first run, interval by default
+		:return: Timer, that can be cancelled
+		"""
+		if interval <= 0: raise ValueError("timer interval must be positive")
+		delay = interval if delay is None else delay
+		timer = Timer(interval, callback, name or getattr(callback, '__name__', 'timer'), self._clock() + delay)
+		with self._cond:
+			self._push(timer)
+			self._cond.notify()
+		return timer
+
+
+	def run_pending(self, now=None):
+		"""
+		Runs the due timers.
+
+		:param now: clock time, by default clock()
+		:return: seconds until the next deadline, None if there are no timers
+		"""
+		if now is None: now = self._clock()
+		due = []
+		with self._cond:
+			heap = self._heap
+			while heap and heap[0][0] <= now:
+				_, _, timer = heappop(heap)
+				if timer.cancelled: continue
+				due.append(timer)
+				timer.deadline += timer.interval
+				if timer.deadline <= now: timer.deadline = now + timer.interval
+				self._push(timer)
+
+		for timer in due:
+			if timer.cancelled: continue
+			self.runs += 1
+			try:
+				timer.callback()
+			except Exception as e:
+				self.errors += 1
+				LOGGER.error("timer %s failed: %s", timer.name, e)
+
+		with self._cond:
+			if not self._heap: return None
+			return max(0.0, self._heap[0][0] - self._clock())
+
+
+	def start(self):
+		if self._thread is not None: return
+		self._running = True
+		self._thread = Thread(target=self._run, name=self._name)
+		self._thread.daemon = True
+		self._thread.start()
+
+
+	def stop(self):
+		"""
+		Stops the thread, the timers are kept. It can be called by a timer.
+		"""
+		thread = self._thread
+		if thread is None: return
+		with self._cond:
+			self._running = False
+			self._cond.notify()
+		self._thread = None
+		self._stopped_thread = thread
+		if thread is not current_thread(): thread.join()
+
+
+	def join(self):
+		"""
+		Waits for the stopped thread to return, i.e. after a timer called stop.
+		"""
+		thread = self._stopped_thread
+		if thread is not None and thread is not current_thread(): thread.join()
+
+
+	@property
+	def running(self):
+		return self._thread is not None
+
+
+	def stats(self):
+		return {'timer_runs': self.runs, 'timer_errors': self.errors}
+
+
+	def _push(self, timer):
+		self._seq += 1
+		heappush(self._heap, (timer.deadline, self._seq, timer))
+
+
+	def _run(self):
+		while self._running:
+			self.run_pending()
+			with self._cond:
+				if not self._running: return
+				wait = self._heap[0][0] - self._clock() if self._heap else None
+				if wait is None or wait > 0: self._cond.wait(wait)
@@ -0,0 +1,465 @@
+"""
+	File name: transport.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	WebsocketClient is the transport core shared by the exchange clients:
+	connection, subscription, keepalive pings, reconnection with backoff,
+	the mainloop (optionally buffered, with a worker thread) and the frame
+	decoding. The pings, the staleness watchdog and the other periodic
+	tasks run on a TimerScheduler thread, nothing is checked per message.
+	Subclasses define the subscription messages and how the decoded
+	messages are handled.
+"""
+
+import socket
+from threading import Thread
+from time import monotonic, sleep, time
+
+from websocket import create_connection, ABNF, WebSocketConnectionClosedException
+from cryptostreamer.provider import ProviderClient
+from cryptostreamer.ringbuffer import RingBuffer, RingBufferOverflowError, OVERFLOW_BLOCK
+from cryptostreamer.codec import get_codec
+from cryptostreamer.backoff import backoff_delay
+from cryptostreamer.timers import TimerScheduler
+
+from cryptostreamer import get_logger
+LOGGER = get_logger('WebsocketClient')
+
+
+DEFAULT_WS_TIMEOUT = 30
+DEFAULT_MAX_RETRIES = 10
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 30
+DEFAULT_PING_INTERVAL = 10
+WATCHDOG_CHECKS = 4
+
+
+class WebsocketClient(ProviderClient):
+
+	def __init__(self,url,timeout=DEFAULT_WS_TIMEOUT,
+				 buffer_size=0,overflow_policy=OVERFLOW_BLOCK,codec=None,
+				 reconnect=False,max_retries=DEFAULT_MAX_RETRIES,
+				 backoff_base=DEFAULT_BACKOFF_BASE,backoff_max=DEFAULT_BACKOFF_MAX,
+				 metrics=None,stamp_frames=False,ping_interval=DEFAULT_PING_INTERVAL,
+				 heartbeat_timeout=None,stats_interval=None):
+		"""
+		:param url: websocket url of the exchange
+		:param buffer_size: if greater than 0, the received frames are put into
+			a ring buffer of this size and decoded and dispatched by a separate
+			worker thread, so that slow callbacks don't slow down the socket reads
+		:param overflow_policy: what to do when the ring buffer is full,
+			'block', 'drop-oldest' or 'disconnect'
+		:param codec: json codec name (orjson, ujson, json), by default the
+			fastest available or CRYPTO_STREAMER_JSON_CODEC
+		:param reconnect: if True, on a connection error the client reconnects
+			and resubscribes, waiting an exponential backoff with jitter between
+			the attempts. on_connection_error is called only after max_retries
+			failed attempts. on_disconnected is not called while reconnecting.
+		:param backoff_base: delay of the first attempt, in seconds
+		:param backoff_max: max delay between two attempts, in seconds
+		:param metrics: optional metrics.Metrics, the ping round trip time is measured
+		:param stamp_frames: if True, self._received_at is the monotonic receive
+			time of the frame being handled
+		:param ping_interval: seconds between the keepalive pings
+		:param heartbeat_timeout: if set, seconds. When no message is received for
+			heartbeat_timeout seconds the connection is considered dead and closed,
+			which is handled as a connection error (reconnect). It's detected
+			within 1.25 * heartbeat_timeout.
+		:param stats_interval: if set, stats() is logged every stats_interval seconds
+		"""
+		self._create_connection = create_connection
+		self._url = url
+		self._ws = None
+		self._timeout = timeout or DEFAULT_WS_TIMEOUT
+		self._buffer_size = buffer_size or 0
+		self._overflow_policy = overflow_policy or OVERFLOW_BLOCK
+		self._codec = get_codec(codec)
+		self._buffer = None
+		self._worker = None
+		self._worker_error = None
+		self._timer_error = None
+		self._stopping = False
+		self._messages_count = 0
+		self._reconnect = reconnect
+		self._max_retries = DEFAULT_MAX_RETRIES if max_retries is None else max_retries
+		self._backoff_base = DEFAULT_BACKOFF_BASE if backoff_base is None else backoff_base
+		self._backoff_max = DEFAULT_BACKOFF_MAX if backoff_max is None else backoff_max
+		self._reconnects = 0
+		self._disconnected_seconds = 0.0
+		self._metrics = metrics
+		self._ping_rtt = metrics.histogram('ping_rtt_seconds') if metrics is not None else None
+		self._ping_sent_at = None
+		self._stamp_frames = stamp_frames or metrics is not None
+		self._wall_offset = time() - monotonic()
+		self._received_at = 0.0
+		self._ping_interval = ping_interval or DEFAULT_PING_INTERVAL
+		self._heartbeat_timeout = heartbeat_timeout
+		self._stats_interval = stats_interval
+		self._timers = TimerScheduler('%sTimers' % type(self).__name__)
+		self._timers_scheduled = False
+		self._watchdog_count = 0
+		self._watchdog_at = 0.0
+		self._stale_disconnects = 0
+
+
+	def start(self):
+		"""
+		Connects to the exchange, subscribes and runs the mainloop.
+
+		:return: None or on_error callback return
+		"""
+		self._stopping = False
+		self._timer_error = None
+		self.on_setup()
+		self._connect()
+		self._subscribe()
+		self._start_timers()
+		return self._mainloop()
+
+
+
+	def stop(self):
+		LOGGER.info("stop")
+		try:
+			self._stopping = True
+			self._mainloop_running = False
+			self._timers.stop()
+			self._disconnect()
+		except: pass
+
+
+
+	def on_setup(self):
+		"""
+		Called before connecting to the provider
+		"""
+		pass
+
+
+	def stats(self):
+		"""
+		Counters of the client.
+
+		:return: dict
+		"""
+		stats = {
+			'messages': self._messages_count,
+			'reconnects': self._reconnects,
+			'disconnected_seconds': self._disconnected_seconds,
+			'stale_disconnects': self._stale_disconnects
+		}
+		if self._buffer is not None: stats.update(self._buffer.stats())
+		return stats
+
+
+
+	def on_message(self, msg):
+		"""
+		Callback for all the messages.
+		"""
+		LOGGER.debug("recv: %s", msg)
+
+
+	def on_connected(self):
+		"""
+		Called when connected to websocket.
+		"""
+		pass
+
+	def on_disconnected(self):
+		"""
+		Called when disconnected.
+		"""
+		pass
+
+
+	def on_connection_error(self,e):
+		"""
+		Called when a connection error during subscription or mainloop is caught.
+		If not implemented, it raises the exception.
+
+		:param e: exception
+		:return: None, if True it reconnects automatically (with backoff)
+		"""
+		LOGGER.error(e)
+		raise e
+
+
+
+	def _subscription_messages(self):
+		"""
+		:return: list of str, messages sent once connected
+		"""
+		raise NotImplementedError()
+
+
+	def _handle_message(self,msg):
+		"""
+		Handles a decoded message.
+		:param msg: dict
+		"""
+		self.on_message(msg)
+
+
+	def _on_reconnected(self):
+		"""
+		Called after a successful reconnection, before on_connected.
+		"""
+		pass
+
+
+	def add_timer(self,interval,callback,name=None):
+		"""
+		Calls callback() every interval seconds, in the timers thread,
+		while the client runs. The timers are kept across restarts.
+
+		:return: timers.Timer
+		"""
+		return self._timers.schedule(interval,callback,name)
+
+
+	def _schedule_timers(self):
+		"""
+		Schedules the periodic tasks, called at the first start. Subclasses
+		can schedule their own with add_timer.
+		"""
+		self.add_timer(self._ping_interval,self._keepalive)
+		if self._heartbeat_timeout:
+			self.add_timer(self._heartbeat_timeout / WATCHDOG_CHECKS,self._check_stale)
+		if self._stats_interval: self.add_timer(self._stats_interval,self._log_stats)
+
+
+	def _start_timers(self):
+		if not self._timers_scheduled:
+			self._schedule_timers()
+			self._timers_scheduled = True
+		self._watchdog_count, self._watchdog_at = self._messages_count, monotonic()
+		self._timers.start()
+
+
+
+	def _connect(self):
+		self._ws = self._create_connection(self._url, timeout=self._timeout)
+		self.on_connected()
+
+
+	def _reconnect_with_backoff(self,e):
+		"""
+		Closes the socket and tries to connect and subscribe again to the
+		same products and channels, up to max_retries times.
+		The other resources (i.e. the kafka producer) are kept open.
+
+		:param e: the connection error
+		"""
+		disconnected_at = monotonic()
+		self._close_ws()
+		for attempt in range(self._max_retries):
+			delay = backoff_delay(attempt, self._backoff_base, self._backoff_max)
+			LOGGER.warning("connection error: %s, reconnecting in %.2fs", e, delay)
+			sleep(delay)
+			if self._stopping: return
+			try:
+				self._ws = self._create_connection(self._url, timeout=self._timeout)
+				for msg in self._subscription_messages(): self._ws.send(msg)
+			except Exception as err:
+				e = err
+				self._close_ws()
+				continue
+
+			self._reconnects += 1
+			self._disconnected_seconds += monotonic() - disconnected_at
+			self._watchdog_at = monotonic()
+			self._on_reconnected()
+			self.on_connected()
+			return
+
+		self._disconnected_seconds += monotonic() - disconnected_at
+		LOGGER.error("reconnection failed after %d attempts", self._max_retries)
+		return self.on_connection_error(e)
+
+
+	def _close_ws(self):
+		ws, self._ws = getattr(self, '_ws', None), None
+		if ws is None: return
+		try:
+			ws.close()
+		except Exception: pass
+
+
+	def _handle_connection_error(self,e):
+		if self._reconnect: return self._reconnect_with_backoff(e)
+		if self.on_connection_error(e) is True: return self._reconnect_with_backoff(e)
+
+
+	def _disconnect(self):
+		LOGGER.info("_disconnect")
+		self._close_ws()
+		self.on_disconnected()
+
+
+	def _subscribe(self):
+		try:
+			for msg in self._subscription_messages():
+				LOGGER.info("send: %s", msg)
+				self._ws.send(msg)
+		except Exception as e:
+			return self.on_connection_error(e)
+
+
+
+	def _ping(self):
+		self._ws.ping('keepalive')
+		self._ping_sent_at = monotonic()
+
+
+	def _keepalive(self):
+		"""
+		Ping timer. A failed ping is only logged, the mainloop gets the
+		connection error on recv.
+		"""
+		if self._ws is None: return
+		try:
+			self._ping()
+		except Exception as e:
+			LOGGER.warning("ping failed: %s", e)
+
+
+	def _check_stale(self):
+		"""
+		Watchdog timer: the number of handled messages must change
+		at least every heartbeat_timeout seconds.
+		"""
+		count, now = self._messages_count, monotonic()
+		if count != self._watchdog_count or self._ws is None:
+			self._watchdog_count, self._watchdog_at = count, now
+			return
+		if now - self._watchdog_at < self._heartbeat_timeout: return
+		LOGGER.warning("no messages for %.1fs, closing the connection", now - self._watchdog_at)
+		self._stale_disconnects += 1
+		self._watchdog_at = now
+		self._abort_connection()
+
+
+	def _abort_connection(self):
+		"""
+		Shuts down the socket, so that the recv blocked in the mainloop
+		thread returns with a connection error.
+		"""
+		sock = getattr(self._ws, 'sock', None)
+		if sock is None: return
+		try:
+			sock.shutdown(socket.SHUT_RDWR)
+		except Exception as e:
+			LOGGER.warning("socket shutdown failed: %s", e)
+
+
+	def _log_stats(self):
+		LOGGER.info("stats: %s", self.stats())
+
+
+
+	def _mainloop(self):
+		"""
+		The mainloop receives loops and gets and handles the messages.
+		The pings are sent by the timers (see _schedule_timers). An error
+		stored in _timer_error by a timer that stopped the client is
+		re-raised once the loop ends.
+		"""
+		self._mainloop_running = True
+
+		if self._buffer_size > 0: self._mainloop_buffered()
+		else:
+			while self._mainloop_running:
+				self._mainloop_recv_msg()
+
+		if not self._timers.running: self._timers.join()
+		if self._timer_error is not None: raise self._timer_error
+
+
+	def _mainloop_buffered(self):
+		"""
+		Two stages mainloop: this thread only receives the frames and puts
+		them into the ring buffer, the worker thread decodes and dispatches them.
+		"""
+		self._buffer = RingBuffer(self._buffer_size, self._overflow_policy)
+		self._worker_error = None
+		self._worker = Thread(target=self._worker_loop, name='%sWorker' % type(self).__name__)
+		self._worker.daemon = True
+		self._worker.start()
+		try:
+			while self._mainloop_running:
+				self._mainloop_recv_msg()
+		finally:
+			self._buffer.close()
+			self._worker.join()
+
+		if self._worker_error is not None: raise self._worker_error
+
+
+	def _worker_loop(self):
+		"""
+		Consumes the ring buffer until it's closed and drained.
+		The items are (received_at, frame) tuples when the frames are stamped.
+		An exception raised by a callback stops the client and is
+		re-raised by the mainloop.
+		"""
+		buffer = self._buffer
+		while True:
+			data = buffer.get()
+			if data is None:
+				if buffer.closed: return
+				continue
+			try:
+				if self._stamp_frames: self._received_at, data = data
+				self._process_frame(data)
+			except Exception as e:
+				LOGGER.error(e)
+				self._worker_error = e
+				buffer.close()
+				self.stop()
+				return
+
+
+	def _mainloop_recv_msg(self):
+		try:
+			data = self._ws.recv() if self._ping_rtt is None else self._recv_with_pongs()
+		except Exception as e:
+			if self._stopping: return
+			return self._handle_connection_error(e)
+
+		if self._buffer is not None:
+			return self._enqueue_frame((monotonic(), data) if self._stamp_frames else data)
+		if self._stamp_frames: self._received_at = monotonic()
+		self._process_frame(data)
+
+
+	def _recv_with_pongs(self):
+		"""
+		Like ws.recv, but the pong frames are returned by the socket
+		to measure the ping round trip time. Text frames are returned
+		as bytes, the codecs decode them without copies.
+		"""
+		if not hasattr(self._ws,'recv_data'): return self._ws.recv()
+		while True:
+			opcode, data = self._ws.recv_data(control_frame=True)
+			if opcode == ABNF.OPCODE_TEXT or opcode == ABNF.OPCODE_BINARY: return data
+			if opcode == ABNF.OPCODE_PONG:
+				if self._ping_sent_at is not None:
+					self._ping_rtt.observe(monotonic() - self._ping_sent_at)
+					self._ping_sent_at = None
+			elif opcode == ABNF.OPCODE_CLOSE:
+				raise WebSocketConnectionClosedException("connection closed")
+
+
+	def _enqueue_frame(self,data):
+		try:
+			self._buffer.put(data)
+		except RingBufferOverflowError as e:
+			LOGGER.error(e)
+			return self._handle_connection_error(e)
+
+
+	def _process_frame(self,data):
+		self._messages_count += 1
+		msg = self._codec.loads(data)
+		self._handle_message(msg)
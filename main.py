@@ -1,12 +1,74 @@
 
 
+def start_metrics_server():
+	from cryptostreamer.provider import ProviderClient
+	from cryptostreamer.metrics import Metrics, MetricsServer
+	port = ProviderClient.get_int_from_env('CRYPTO_STREAMER_METRICS_PORT')
+	if not port: return None
+	metrics = Metrics()
+	MetricsServer(metrics, port).start()
+	return metrics
+
+
 def run_gdax():
 	from cryptostreamer.gdax import GdaxKafkaProducer
-	gdax = GdaxKafkaProducer.create_with_environment()
+	shards = GdaxKafkaProducer.get_int_from_env('CRYPTO_STREAMER_GDAX_SHARDS')
+	if shards and shards > 1: return run_gdax_sharded(shards)
+	metrics = start_metrics_server()
+	if metrics is None:
+		gdax = GdaxKafkaProducer.create_with_environment()
+	else:
+		gdax = GdaxKafkaProducer.create_with_environment(metrics=metrics)
+		metrics.add_collector(gdax.stats)
 	gdax.start()
 
 
+def run_gdax_sharded(shards):
+	from cryptostreamer.gdax import GdaxKafkaProducer
+	from cryptostreamer.supervisor import ShardSupervisor
+	products = GdaxKafkaProducer.get_list_from_env('CRYPTO_STREAMER_GDAX_PRODUCTS') or []
+	supervisor = ShardSupervisor(GdaxKafkaProducer.create_with_environment, products, shards,
+								 shard_id_arg='shard_id')
+	metrics = start_metrics_server()
+	if metrics is not None: metrics.add_collector(lambda: supervisor.stats()['totals'])
+	try:
+		supervisor.start()
+	finally:
+		supervisor.stop()
+
+
+def run_exchanges(exchanges):
+	"""
+	Runs a client per exchange, publishing the normalized trades
+	to CRYPTO_STREAMER_KAFKA_TRADES_TOPIC (default 'trades').
+	"""
+	from kafka import KafkaProducer
+	from cryptostreamer.exchanges import ExchangeClient, run_providers
+	from cryptostreamer.gdax import GdaxKafkaProducer
+	from cryptostreamer.kafka_config import producer_config
+	from cryptostreamer.sinks import KafkaSink, SinkRouter
+	topic = ExchangeClient.get_str_from_env('CRYPTO_STREAMER_KAFKA_TRADES_TOPIC') or 'trades'
+	kwargs = producer_config(GdaxKafkaProducer.kwargs_from_environment())
+	kwargs['key_serializer'] = str.encode
+	kafka_producer = KafkaProducer(**kwargs)
+
+	clients, routers = [], []
+	for exchange in exchanges:
+		client = ExchangeClient.create_with_environment(exchange)
+		router = SinkRouter([KafkaSink(topic, kafka_producer=kafka_producer)], skipped_types=())
+		client.on_trade = lambda trade, router=router: router.add(trade.to_dict())
+		router.schedule_flush(client)
+		clients.append(client)
+		routers.append(router)
+	try:
+		run_providers(clients)
+	finally:
+		for router in routers: router.flush()
+		kafka_producer.close()
+
+
 from os import getenv
 
-provider = getenv('CRYPTO_STREAMER_PROVIDER',None)
-if provider == 'gdax': run_gdax()
\ No newline at end of file
+providers = [p.strip() for p in getenv('CRYPTO_STREAMER_PROVIDER','').split(',') if p.strip()]
+if providers == ['gdax']: run_gdax()
+elif providers: run_exchanges(providers)
@@ -0,0 +1,47 @@
+"""
+	File name: bench_codec.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Per-message cost of decoding a GDAX match frame and encoding the
+	published record, for each available codec.
+
+	python -m tests.benchmark.bench_codec [iterations]
+"""
+import sys
+import json
+from timeit import timeit
+
+from cryptostreamer.codec import CODECS, available_codecs
+
+
+MATCH_FRAME = json.dumps({
+	"type": "match", "trade_id": 12174997,
+	"maker_order_id": "ac928c66-ca53-498f-9c13-a110027a60e8",
+	"taker_order_id": "132fb6ae-456b-4654-b4e0-d681ac05cea1",
+	"side": "sell", "size": "3.53526947", "price": "183.80000000",
+	"product_id": "LTC-EUR", "sequence": 3376717970,
+	"time": "2018-02-16T01:25:40.647000Z"
+})
+
+
+def bench(codec, iterations):
+	msg = codec.loads(MATCH_FRAME)
+	loads_s = timeit(lambda: codec.loads(MATCH_FRAME), number=iterations)
+	dumps_s = timeit(lambda: codec.dumps(msg), number=iterations)
+	return {
+		'codec': codec.name,
+		'loads_us': loads_s / iterations * 1e6,
+		'dumps_us': dumps_s / iterations * 1e6
+	}
+
+
+def main(iterations=100000):
+	print("%-8s %10s %10s %10s" % ('codec', 'loads us', 'dumps us', 'total us'))
+	for name in available_codecs():
+		r = bench(CODECS[name], iterations)
+		print("%-8s %10.3f %10.3f %10.3f" % (
+			r['codec'], r['loads_us'], r['dumps_us'], r['loads_us'] + r['dumps_us']))
+
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
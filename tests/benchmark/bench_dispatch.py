@@ -0,0 +1,87 @@
+"""
+	File name: bench_dispatch.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Cost of the dispatch step alone (the MESSAGE_HANDLERS registry with
+	dicts and typed records, compared to the former if/elif chain), of
+	the whole GdaxClient._handle_message, and memory per match message
+	(dict vs Match record).
+
+	python -m tests.benchmark.bench_dispatch [iterations]
+"""
+import sys
+import json
+import tracemalloc
+from timeit import timeit
+
+from cryptostreamer.gdax.client import GdaxClient
+from cryptostreamer.gdax.messages import Match
+
+
+MATCH = {
+	"type": "match", "trade_id": 12174997, "side": "sell", "size": "3.53526947",
+	"price": "183.80000000", "product_id": "LTC-EUR", "sequence": 3376717970,
+	"time": "2018-02-16T01:25:40.647000Z"
+}
+MATCH_FRAME = json.dumps(MATCH)
+
+
+def dispatch_if_chain(client, msg):
+	""" The dispatch as it was before the MESSAGE_HANDLERS registry. """
+	msg_type = msg.get('type')
+
+	if msg_type == 'heartbeat':         client.on_heartbeat(msg)
+	elif msg_type == 'last_match':      client.on_last_match(msg)
+	elif msg_type == 'subscriptions':   client.on_subscriptions(msg)
+	elif msg_type == 'match':           client.on_match(msg)
+
+
+def dispatch_registry(client, msg):
+	""" The last step of GdaxClient._handle_message. """
+	msg_type = msg.get('type')
+
+	callback_name = client.MESSAGE_HANDLERS.get(msg_type)
+	if callback_name is None: return
+	if client._typed_messages:
+		record_type = client.MESSAGE_RECORDS.get(msg_type)
+		if record_type is not None: msg = record_type.from_dict(msg)
+	getattr(client, callback_name)(msg)
+
+
+def memory_per_message(factory, n=10000):
+	tracemalloc.start()
+	before = tracemalloc.take_snapshot()
+	objects = [factory(json.loads(MATCH_FRAME)) for _ in range(n)]
+	after = tracemalloc.take_snapshot()
+	tracemalloc.stop()
+	size = sum(s.size_diff for s in after.compare_to(before, 'filename'))
+	del objects
+	return size / float(n)
+
+
+def main(iterations=200000):
+	client, typed_client = GdaxClient(['LTC-EUR']), GdaxClient(['LTC-EUR'], typed_messages=True)
+	dispatches = [
+		('if/elif chain, dict', dispatch_if_chain, client),
+		('registry, dict', dispatch_registry, client),
+		('registry, typed', dispatch_registry, typed_client)
+	]
+	print("%-22s %12s" % ('dispatch', 'ns/msg'))
+	for name, dispatch, c in dispatches:
+		t = timeit(lambda: dispatch(c, MATCH), number=iterations)
+		print("%-22s %12.1f" % (name, t / iterations * 1e9))
+
+	print("")
+	print("%-22s %12s" % ('_handle_message', 'ns/msg'))
+	for name, c in [('dict', client), ('typed', typed_client)]:
+		t = timeit(lambda: c._handle_message(MATCH), number=iterations)
+		print("%-22s %12.1f" % (name, t / iterations * 1e9))
+
+	print("")
+	print("%-22s %12s" % ('memory', 'bytes/msg'))
+	print("%-22s %12.1f" % ('dict', memory_per_message(lambda m: m)))
+	print("%-22s %12.1f" % ('Match record', memory_per_message(Match.from_dict)))
+
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,204 @@
+"""
+	File name: bench_ingest.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Ingest hot path of GdaxKafkaProducer: synthetic match and l2update
+	frames are read from a fake socket by _mainloop_recv_msg, decoded,
+	dispatched by _handle_message and sent by _send_to_kafka to a fake
+	KafkaProducer (values and keys are serialized, acks are immediate).
+
+	Reports messages/sec, p50/p99 latency per message and the peak bytes
+	allocated per message (tracemalloc, separate run). Results can be
+	written as json and compared with a previous run:
+
+	python -m tests.benchmark.bench_ingest [--messages N] [--output results.json]
+		[--baseline baseline.json] [--tolerance 0.15]
+
+	The exit status is 1 if a scenario regressed more than tolerance.
+"""
+import sys
+import json
+import platform
+import argparse
+import tracemalloc
+from time import perf_counter_ns
+
+from cryptostreamer.gdax.producer import GdaxKafkaProducer
+
+
+PRODUCTS = ['BTC-USD', 'ETH-USD', 'LTC-USD', 'BTC-EUR']
+
+
+def match_frames(n):
+	return [json.dumps({
+		"type": "match", "trade_id": 10000000 + i, "maker_order_id": "ac928c66-ca53-498f-9c13-a110027a60e8",
+		"taker_order_id": "132fb6ae-456b-4654-b4e0-d681ac05cea1", "side": "sell" if i % 2 else "buy",
+		"size": "%.8f" % (0.01 + (i % 100) / 100.0), "price": "%.2f" % (10000 + (i % 500) / 10.0),
+		"product_id": PRODUCTS[i % len(PRODUCTS)], "sequence": 5000000000 + i,
+		"time": "2018-02-16T01:25:%02d.%06dZ" % (i // 1000 % 60, i % 1000 * 1000)
+	}) for i in range(n)]
+
+
+def l2update_frames(n):
+	return [json.dumps({
+		"type": "l2update", "product_id": PRODUCTS[i % len(PRODUCTS)],
+		"time": "2018-02-16T01:25:40.%06dZ" % (i % 1000000),
+		"changes": [["buy" if i % 2 else "sell", "%.2f" % (10000 + (i % 500) / 10.0), "%.8f" % ((i % 7) / 3.0)]]
+	}) for i in range(n)]
+
+
+# name -> (frames factory, GdaxKafkaProducer options)
+SCENARIOS = {
+	'match-sync': (match_frames, {}),
+	'match-pipelined': (match_frames, {'pipelined': True}),
+	'match-passthrough': (match_frames, {'pipelined': True, 'passthrough': True}),
+	'l2update-pipelined': (l2update_frames, {'pipelined': True}),
+}
+
+
+
+class FakeSocket(object):
+
+	def __init__(self, frames):
+		self._frames = frames
+		self._i = -1
+
+	def recv(self):
+		self._i += 1
+		return self._frames[self._i % len(self._frames)]
+
+	def ping(self, payload=''): pass
+
+	def close(self): pass
+
+
+
+class FakeFuture(object):
+
+	def get(self, timeout=None): return None
+
+	def add_callback(self, f, *args): f(*(args + (None,)))
+
+	def add_errback(self, f, *args): pass
+
+
+
+class FakeKafkaProducer(object):
+
+	def __init__(self, key_serializer, value_serializer):
+		self._key_serializer = key_serializer
+		self._value_serializer = value_serializer
+		self._future = FakeFuture()
+		self.sent = 0
+
+	def send(self, topic, key=None, value=None):
+		self._key_serializer(key)
+		self._value_serializer(value)
+		self.sent += 1
+		return self._future
+
+	def flush(self, timeout=None): pass
+
+	def close(self): pass
+
+
+
+def create_producer(frames, options):
+	producer = GdaxKafkaProducer('gdax', {'products': PRODUCTS}, {}, **options)
+	producer._kafka_producer = FakeKafkaProducer(str.encode, producer._value_serializer())
+	producer._ws = FakeSocket(frames)
+	return producer
+
+
+def percentile(sorted_values, p):
+	return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def run_scenario(name, messages):
+	frames_factory, options = SCENARIOS[name]
+	frames = frames_factory(min(messages, 10000))
+
+	producer = create_producer(frames, options)
+	recv = producer._mainloop_recv_msg
+	for _ in range(min(messages, 1000)): recv()
+
+	latencies = [0] * messages
+	started = perf_counter_ns()
+	for i in range(messages):
+		t = perf_counter_ns()
+		recv()
+		latencies[i] = perf_counter_ns() - t
+	elapsed = perf_counter_ns() - started
+	latencies.sort()
+
+	return {
+		'msgs_per_sec': messages / (elapsed / 1e9),
+		'p50_us': percentile(latencies, 0.50) / 1e3,
+		'p99_us': percentile(latencies, 0.99) / 1e3,
+		'alloc_bytes_per_msg': allocations_per_message(frames, options, min(messages, 2000))
+	}
+
+
+def allocations_per_message(frames, options, messages):
+	producer = create_producer(frames, options)
+	recv = producer._mainloop_recv_msg
+	recv()
+	total = 0
+	tracemalloc.start()
+	for _ in range(messages):
+		tracemalloc.reset_peak()
+		current = tracemalloc.get_traced_memory()[0]
+		recv()
+		total += tracemalloc.get_traced_memory()[1] - current
+	tracemalloc.stop()
+	return total / float(messages)
+
+
+def compare(results, baseline, tolerance):
+	"""
+	:return: list of (scenario, metric, baseline value, value) regressed more than tolerance
+	"""
+	regressions = []
+	for name, metrics in results.items():
+		base = baseline.get(name)
+		if base is None: continue
+		if metrics['msgs_per_sec'] < base['msgs_per_sec'] * (1 - tolerance):
+			regressions.append((name, 'msgs_per_sec', base['msgs_per_sec'], metrics['msgs_per_sec']))
+		for metric in ('p99_us', 'alloc_bytes_per_msg'):
+			if metrics[metric] > base[metric] * (1 + tolerance):
+				regressions.append((name, metric, base[metric], metrics[metric]))
+	return regressions
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='GdaxKafkaProducer ingest benchmark')
+	parser.add_argument('--messages', type=int, default=100000)
+	parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+	parser.add_argument('--output', help='json results file')
+	parser.add_argument('--baseline', help='json results of a previous run')
+	parser.add_argument('--tolerance', type=float, default=0.15)
+	args = parser.parse_args(argv)
+
+	results = {}
+	print("%-22s %12s %10s %10s %14s" % ('scenario', 'msgs/sec', 'p50 us', 'p99 us', 'alloc B/msg'))
+	for name in args.scenarios.split(','):
+		r = results[name] = run_scenario(name, args.messages)
+		print("%-22s %12.0f %10.2f %10.2f %14.1f" % (
+			name, r['msgs_per_sec'], r['p50_us'], r['p99_us'], r['alloc_bytes_per_msg']))
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump({'python': platform.python_version(), 'messages': args.messages,
+					   'results': results}, f, indent=2)
+
+	if args.baseline:
+		with open(args.baseline) as f: baseline = json.load(f)['results']
+		regressions = compare(results, baseline, args.tolerance)
+		for name, metric, before, after in regressions:
+			print("REGRESSION %s %s: %.2f -> %.2f" % (name, metric, before, after))
+		if regressions: return 1
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
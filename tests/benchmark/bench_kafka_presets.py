@@ -0,0 +1,88 @@
+"""
+	File name: bench_kafka_presets.py
+	Author: Alvise Susmel <alvise@poeticoding.com>
+
+	Compares the KafkaProducer presets without a broker: the records
+	are serialized and appended to kafka-python record batches (the same
+	builder used by the producer), batches are closed when full, as the
+	sender would do. Reports CPU cost per message and bytes on the wire.
+
+	python -m tests.benchmark.bench_kafka_presets [messages]
+"""
+import sys
+import random
+from time import process_time
+
+from kafka.record.memory_records import MemoryRecordsBuilder
+from kafka.record.default_records import DefaultRecordBatch
+
+from cryptostreamer.codec import get_codec
+from cryptostreamer.kafka_config import KAFKA_PRESETS, producer_config
+
+
+CODEC_IDS = {
+	None: DefaultRecordBatch.CODEC_NONE,
+	'gzip': DefaultRecordBatch.CODEC_GZIP,
+	'snappy': DefaultRecordBatch.CODEC_SNAPPY,
+	'lz4': DefaultRecordBatch.CODEC_LZ4,
+	'zstd': DefaultRecordBatch.CODEC_ZSTD
+}
+
+DEFAULT_BATCH_SIZE = 16384
+PRODUCTS = ['BTC-USD','BTC-EUR','ETH-USD','LTC-EUR']
+
+
+def synthetic_matches(n):
+	rnd = random.Random(42)
+	return [{
+		"type": "match", "trade_id": 1000000 + i, "side": rnd.choice(['buy','sell']),
+		"size": "%.8f" % rnd.uniform(0.001, 5), "price": "%.2f" % rnd.uniform(100, 10000),
+		"product_id": rnd.choice(PRODUCTS), "sequence": 3000000000 + i,
+		"time": "2018-02-16T01:25:40.%06dZ" % (i % 1000000)
+	} for i in range(n)]
+
+
+def bench(preset, matches, dumps):
+	config = producer_config({'preset': preset})
+	codec_id = CODEC_IDS[config.get('compression_type')]
+	batch_size = config.get('batch_size', DEFAULT_BATCH_SIZE)
+
+	wire_bytes = 0
+	batches = 0
+	builder = MemoryRecordsBuilder(2, codec_id, batch_size)
+	started = process_time()
+	for msg in matches:
+		key = msg['product_id'].encode('utf-8')
+		if builder.append(0, key, dumps(msg)) is None:
+			builder.close()
+			wire_bytes += builder.size_in_bytes()
+			batches += 1
+			builder = MemoryRecordsBuilder(2, codec_id, batch_size)
+			builder.append(0, key, dumps(msg))
+	builder.close()
+	wire_bytes += builder.size_in_bytes()
+	batches += 1
+	elapsed = process_time() - started
+
+	return {
+		'preset': preset,
+		'compression': config.get('compression_type'),
+		'us_per_msg': elapsed / len(matches) * 1e6,
+		'bytes_per_msg': wire_bytes / float(len(matches)),
+		'batches': batches
+	}
+
+
+def main(n=50000):
+	matches = synthetic_matches(n)
+	dumps = get_codec().dumps
+	results = [bench(p, matches, dumps) for p in sorted(KAFKA_PRESETS)]
+	print("%-16s %-8s %10s %10s %8s" % ('preset', 'codec', 'us/msg', 'bytes/msg', 'batches'))
+	for r in results:
+		print("%-16s %-8s %10.2f %10.1f %8d" % (
+			r['preset'], r['compression'], r['us_per_msg'], r['bytes_per_msg'], r['batches']))
+	return results
+
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
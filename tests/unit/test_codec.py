@@ -0,0 +1,57 @@
+import os
+import pytest
+
+from cryptostreamer.codec import get_codec, available_codecs, UnknownCodecError, CODEC_ENV
+
+
+class TestCodec:
+
+	def teardown_method(self, method):
+		os.environ.pop(CODEC_ENV, None)
+
+
+	@pytest.mark.parametrize('name', available_codecs())
+	def test_roundtrip(self, name):
+		codec = get_codec(name)
+		msg = {'type': 'match', 'product_id': 'BTC-USD', 'price': '100.1', 'trade_id': 1}
+		data = codec.dumps(msg)
+		assert isinstance(data, bytes)
+		assert codec.loads(data) == msg
+		assert codec.loads(data.decode('utf-8')) == msg
+
+
+	def test_auto_selects_the_fastest_available(self):
+		assert get_codec('auto').name == available_codecs()[0]
+		assert get_codec().name == available_codecs()[0]
+
+
+	def test_stdlib_is_always_available(self):
+		assert 'json' in available_codecs()
+
+
+	def test_environment_variable(self):
+		os.environ[CODEC_ENV] = 'json'
+		assert get_codec().name == 'json'
+
+
+	def test_unknown_codec(self):
+		with pytest.raises(UnknownCodecError):
+			get_codec('yaml')
+
+
+	def test_peek_field_reads_top_level_string_fields(self):
+		from cryptostreamer.codec import peek_field
+		frame = '{"type":"match","trade_id":1,"product_id":"BTC-USD","price":"1.0"}'
+		assert peek_field(frame, 'type') == 'match'
+		assert peek_field(frame, 'product_id') == 'BTC-USD'
+		assert peek_field(frame.encode('utf-8'), 'product_id') == 'BTC-USD'
+		assert peek_field('{"type": "heartbeat"}', 'type') == 'heartbeat'
+		assert peek_field(frame, 'sequence') is None
+
+
+	def test_peek_int_reads_top_level_integer_fields(self):
+		from cryptostreamer.codec import peek_int
+		frame = '{"type":"match","trade_id":12,"sequence": 3376717970}'
+		assert peek_int(frame, 'trade_id') == 12
+		assert peek_int(frame.encode('utf-8'), 'sequence') == 3376717970
+		assert peek_int(frame, 'type') is None
@@ -0,0 +1,65 @@
+import json
+import pytest
+from mock import MagicMock
+
+from cryptostreamer.exchanges import ExchangeClient, Trade, GdaxAdapter, BitstampAdapter, \
+	create_adapter, run_providers, UnknownExchangeError
+
+
+BITSTAMP_TRADE = {
+	'event': 'trade', 'channel': 'live_trades_btcusd',
+	'data': {'id': 117152394, 'amount': 0.02, 'price': 9160.5, 'type': 1,
+			 'microtimestamp': '1590000000123456'}
+}
+
+GDAX_MATCH = {
+	'type': 'match', 'trade_id': 10, 'side': 'sell', 'size': '0.5', 'price': '100.0',
+	'product_id': 'BTC-USD', 'time': '2018-02-16T01:25:40.647000Z'
+}
+
+
+class TestExchanges:
+
+	def test_gdax_adapter_normalizes_matches_with_the_taker_side(self):
+		trade = GdaxAdapter().normalize(GDAX_MATCH)
+		assert trade == Trade('gdax', 'BTC-USD', 10, 100.0, 0.5, 'buy', 1518744340647000000)
+		assert GdaxAdapter().normalize({'type': 'heartbeat'}) is None
+
+
+	def test_bitstamp_adapter_subscribes_and_normalizes_trades(self):
+		adapter = BitstampAdapter()
+		messages = adapter.subscription_messages(['BTC-USD'], adapter.default_channels)
+		assert [json.loads(m) for m in messages] == [
+			{'event': 'bts:subscribe', 'data': {'channel': 'live_trades_btcusd'}}]
+
+		trade = adapter.normalize(BITSTAMP_TRADE)
+		assert trade == Trade('bitstamp', 'BTC-USD', 117152394, 9160.5, 0.02, 'sell', 1590000000123456000)
+		assert adapter.normalize({'event': 'bts:subscription_succeeded'}) is None
+
+
+	def test_create_adapter(self):
+		assert isinstance(create_adapter('bitstamp'), BitstampAdapter)
+		with pytest.raises(UnknownExchangeError):
+			create_adapter('mtgox')
+
+
+	def test_client_subscribes_and_dispatches_trades(self):
+		client = ExchangeClient(BitstampAdapter(), ['BTC-USD'])
+		client._create_connection = MagicMock()
+		client.on_trade = MagicMock()
+		client._connect()
+		client._subscribe()
+		client._create_connection.assert_called_once_with('wss://ws.bitstamp.net', timeout=30)
+		client._ws.send.assert_called_once()
+
+		client._process_frame(json.dumps(BITSTAMP_TRADE))
+		assert client.on_trade.call_args[0][0].product_id == 'BTC-USD'
+		assert client.stats()['trades'] == 1
+
+
+	def test_run_providers_runs_the_clients_concurrently(self):
+		ok, failing = MagicMock(), MagicMock()
+		failing.start.side_effect = ValueError('boom')
+		errors = run_providers([ok, failing])
+		ok.start.assert_called_once()
+		assert list(errors.values())[0].args == ('boom',)
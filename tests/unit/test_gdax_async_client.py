@@ -0,0 +1,163 @@
+import asyncio
+import json
+import pytest
+from mock import patch
+
+websockets = pytest.importorskip('websockets')
+
+from cryptostreamer.gdax.aio import AsyncGdaxClient, AsyncGdaxKafkaProducer, run_clients
+from cryptostreamer.metrics import Metrics
+
+
+MATCH = {
+	"type": "match", "trade_id": 1, "maker_order_id": "a", "taker_order_id": "b",
+	"side": "sell", "size": "1.0", "price": "100.0", "product_id": "LTC-EUR",
+	"sequence": 10, "time": "2018-02-16T01:25:40.647000Z"
+}
+
+
+async def gdax_server_handler(ws):
+	subscription = json.loads(await ws.recv())
+	for product_id in subscription['product_ids']:
+		await ws.send(json.dumps(dict(MATCH, type='last_match', product_id=product_id)))
+	await ws.send(json.dumps({'type': 'subscriptions', 'channels': []}))
+	await ws.send(json.dumps({'type': 'heartbeat', 'product_id': 'LTC-EUR', 'sequence': 10}))
+	for product_id in subscription['product_ids']:
+		await ws.send(json.dumps(dict(MATCH, product_id=product_id)))
+	await ws.wait_closed()
+
+
+class MatchCounterClient(AsyncGdaxClient):
+	def __init__(self,*args,**kwargs):
+		AsyncGdaxClient.__init__(self,*args,**kwargs)
+		self.received = []
+
+	async def on_match(self,match_msg):
+		self.received.append(match_msg)
+		await self.stop()
+
+
+def run_with_server(coro_factory):
+	async def main():
+		async with websockets.serve(gdax_server_handler, 'localhost', 0) as server:
+			port = server.sockets[0].getsockname()[1]
+			return await asyncio.wait_for(coro_factory('ws://localhost:%d' % port), 10)
+	return asyncio.run(main())
+
+
+class TestAsyncGdaxClient:
+
+	def test_callbacks_are_awaited(self):
+		async def run(url):
+			client = MatchCounterClient(['LTC-EUR'],url=url)
+			calls = []
+			async def on_last_match(msg): calls.append('last_match')
+			async def on_subscriptions(msg): calls.append('subscriptions')
+			async def on_heartbeat(msg): calls.append('heartbeat')
+			client.on_last_match = on_last_match
+			client.on_subscriptions = on_subscriptions
+			client.on_heartbeat = on_heartbeat
+			await client.start()
+			return client, calls
+
+		client, calls = run_with_server(run)
+		assert calls == ['last_match', 'subscriptions', 'heartbeat']
+		assert client.received[0]['product_id'] == 'LTC-EUR'
+		assert not client._mainloop_running
+
+
+	def test_many_clients_run_on_one_event_loop(self):
+		products = ['BTC-USD','ETH-USD','LTC-EUR','BCH-USD']
+		async def run(url):
+			clients = [MatchCounterClient([p],url=url) for p in products*5]
+			await run_clients(clients)
+			return clients
+
+		clients = run_with_server(run)
+		assert len(clients) == 20
+		assert [c.received[0]['product_id'] for c in clients] == products*5
+
+
+	def test_messages_are_counted_and_sequence_checked(self):
+		sent = []
+		class FakeWebsocket(object):
+			async def send(self,data): sent.append(json.loads(data))
+
+		matches = []
+		class Client(AsyncGdaxClient):
+			async def on_match(self,msg): matches.append(msg['trade_id'])
+
+		metrics = Metrics()
+		client = Client(['LTC-EUR'],sequence_check=True,metrics=metrics)
+		client._ws = FakeWebsocket()
+		frames = [dict(MATCH, type='last_match'), MATCH, dict(MATCH, trade_id=2), dict(MATCH, trade_id=5)]
+		async def run():
+			for frame in frames: await client._process_frame(json.dumps(frame))
+		asyncio.run(run())
+
+		assert matches == [2, 5]
+		assert client.stats()['messages'] == 4
+		assert metrics.messages == {('last_match', 'LTC-EUR'): 1, ('match', 'LTC-EUR'): 3}
+		assert [m['type'] for m in sent] == ['unsubscribe', 'subscribe']
+		assert client._resubscriptions == 1
+
+
+	def test_kafka_producer_sends_matches_to_the_shared_producer(self):
+		class StoppingProducer(AsyncGdaxKafkaProducer):
+			async def on_match(self,msg): await self.stop()
+
+		sent = []
+		class FakeKafkaProducer(object):
+			async def send(self,topic,key=None,value=None):
+				sent.append((topic,key,value))
+				future = asyncio.get_running_loop().create_future()
+				future.set_result(None)
+				return future
+
+		async def run(url):
+			kafka_producer = FakeKafkaProducer()
+			client = StoppingProducer('gdax',{'products': ['LTC-EUR'], 'url': url},
+									  matches_only=True,kafka_producer=kafka_producer)
+			await client.start()
+			return client
+
+		client = run_with_server(run)
+		assert len(sent) == 1
+		topic, key, value = sent[0]
+		assert (topic, key) == ('gdax', 'LTC-EUR')
+		assert 'maker_order_id' not in value
+		assert client._kafka_producer is not None
+
+
+	def test_kafka_producer_is_created_with_the_tuning_settings(self):
+		client = AsyncGdaxKafkaProducer('gdax',{'products': ['LTC-EUR']},
+										{'bootstrap_servers': ['a:9092', 'b:9092'], 'preset': 'low-latency'})
+		with patch('cryptostreamer.gdax.aio.AIOKafkaProducer') as producer_class:
+			client._get_kafka_producer()
+		kwargs = producer_class.call_args[1]
+		assert kwargs['bootstrap_servers'] == 'a:9092,b:9092'
+		assert kwargs['compression_type'] is None
+		assert kwargs['max_batch_size'] == 16384
+		assert kwargs['linger_ms'] == 0
+		assert 'preset' not in kwargs
+
+
+	def test_a_failed_delivery_stops_the_kafka_producer(self):
+		class DeliveryError(Exception): pass
+
+		class FailingKafkaProducer(object):
+			async def send(self,topic,key=None,value=None):
+				future = asyncio.get_running_loop().create_future()
+				future.set_exception(DeliveryError())
+				return future
+
+		async def run(url):
+			client = AsyncGdaxKafkaProducer('gdax',{'products': ['LTC-EUR'], 'url': url},
+											kafka_producer=FailingKafkaProducer())
+			with pytest.raises(DeliveryError):
+				await client.start()
+			return client
+
+		client = run_with_server(run)
+		assert client.stats()['kafka_send_errors'] == 1
+		assert not client._mainloop_running
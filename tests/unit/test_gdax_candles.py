@@ -0,0 +1,65 @@
+from cryptostreamer.gdax.candles import CandleAggregator, NS
+from cryptostreamer.gdax.messages import Match
+
+
+def match(price, size, time, product_id='BTC-USD'):
+	return {'type': 'match', 'product_id': product_id, 'price': str(price),
+			'size': str(size), 'time': time, 'side': 'buy'}
+
+
+class TestCandleAggregator:
+
+	def test_ohlcv_vwap_and_count(self):
+		closed = []
+		agg = CandleAggregator([1], closed.append)
+		agg.add_trade('BTC-USD', 10 * NS, 100.0, 1.0)
+		agg.add_trade('BTC-USD', 10 * NS + 1, 102.0, 1.0)
+		agg.add_trade('BTC-USD', 10 * NS + 2, 99.0, 2.0)
+		agg.add_trade('BTC-USD', 10 * NS + 3, 101.0, 0.0)
+		assert closed == []
+
+		agg.add_trade('BTC-USD', 11 * NS, 105.0, 1.0)
+		assert len(closed) == 1
+		c = closed[0]
+		assert (c.start, c.open, c.high, c.low, c.close) == (10, 100.0, 102.0, 99.0, 101.0)
+		assert c.volume == 4.0
+		assert c.vwap == 100.0
+		assert c.count == 4
+		assert c.to_dict()['vwap'] == 100.0
+
+
+	def test_intervals_are_closed_independently(self):
+		closed = []
+		agg = CandleAggregator([1, 60], closed.append)
+		agg.add_trade('BTC-USD', 0, 1.0, 1.0)
+		agg.add_trade('BTC-USD', 2 * NS, 2.0, 1.0)
+		agg.add_trade('BTC-USD', 61 * NS, 3.0, 1.0)
+		assert [(c.interval, c.start) for c in closed] == [(1, 0), (1, 2), (60, 0)]
+		assert closed[2].count == 2
+
+
+	def test_products_are_independent_and_matches_accepted(self):
+		closed = []
+		agg = CandleAggregator([60], closed.append)
+		agg.add_match(match(100, 1, '2018-02-16T01:25:40.647000Z'))
+		agg.add_match(Match('match', 1, 1, 'ETH-USD', 'buy', 10.0, 1.0, '2018-02-16T01:26:40.647000Z'))
+		assert closed == []
+		agg.add_match(match(101, 1, '2018-02-16T01:26:00.000000Z'))
+		assert closed[0].product_id == 'BTC-USD'
+
+
+	def test_late_trades_are_ignored(self):
+		agg = CandleAggregator([1])
+		agg.add_trade('BTC-USD', 10 * NS, 100.0, 1.0)
+		agg.add_trade('BTC-USD', 9 * NS, 1.0, 1.0)
+		assert agg.stats()['candles_late_trades'] == 1
+
+
+	def test_advance_and_flush(self):
+		closed = []
+		agg = CandleAggregator([1, 60], closed.append)
+		agg.add_trade('BTC-USD', 10 * NS, 100.0, 1.0)
+		agg.advance('BTC-USD', 11 * NS)
+		assert [c.interval for c in closed] == [1]
+		agg.flush()
+		assert [c.interval for c in closed] == [1, 60]
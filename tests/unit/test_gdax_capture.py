@@ -0,0 +1,88 @@
+import os
+import pytest
+
+from cryptostreamer.gdax.capture import MatchCapture, CaptureReader, read_columns, \
+	InvalidCaptureFileError, NS
+
+
+def match(time, price='100.0', size='1.0', side='buy', trade_id=1, product_id='BTC-USD'):
+	return {'type': 'match', 'product_id': product_id, 'time': time, 'price': price,
+			'size': size, 'side': side, 'trade_id': trade_id}
+
+
+class TestMatchCapture:
+
+	def test_columns_are_typed(self, tmpdir):
+		capture = MatchCapture(str(tmpdir))
+		capture.add_match(match('2018-02-16T01:25:40.647000Z', '183.8', '0.5', 'sell', 42))
+		capture.flush()
+
+		path = CaptureReader(str(tmpdir)).files('BTC-USD')[0]
+		product_id, columns = read_columns(path)
+		assert product_id == 'BTC-USD'
+		assert list(columns['time']) == [1518744340647000000]
+		assert list(columns['price']) == [183.8]
+		assert list(columns['size']) == [0.5]
+		assert list(columns['side']) == [1]
+		assert list(columns['trade_id']) == [42]
+		assert columns['time'].typecode == 'q'
+
+
+	def test_files_are_bounded_by_rows(self, tmpdir):
+		capture = MatchCapture(str(tmpdir), max_rows=2)
+		for i in range(5): capture.add_trade('BTC-USD', i * NS, 100.0, 1.0, 'buy', i)
+		assert capture.files == 2
+		capture.flush()
+		assert capture.stats() == {'capture_rows': 5, 'capture_files': 3}
+		assert [e[2] for e in CaptureReader(str(tmpdir)).index()] == [2, 2, 1]
+
+
+	def test_files_are_bounded_by_time(self, tmpdir):
+		capture = MatchCapture(str(tmpdir), max_seconds=10)
+		capture.add_trade('BTC-USD', 0, 100.0, 1.0, 'buy', 1)
+		capture.add_trade('BTC-USD', 5 * NS, 100.0, 1.0, 'buy', 2)
+		capture.add_trade('BTC-USD', 10 * NS, 100.0, 1.0, 'buy', 3)
+		assert capture.files == 1
+		capture.advance('BTC-USD', 15 * NS)
+		assert capture.files == 1
+		capture.advance('BTC-USD', 20 * NS)
+		assert capture.files == 2
+
+
+	def test_batches_with_the_same_first_time_dont_collide(self, tmpdir):
+		capture = MatchCapture(str(tmpdir), max_rows=2)
+		for i in range(4): capture.add_trade('BTC-USD', NS, 100.0, 1.0, 'buy', i)
+		capture = MatchCapture(str(tmpdir), max_rows=2)
+		capture.add_trade('BTC-USD', NS, 100.0, 1.0, 'buy', 4)
+		capture.flush()
+
+		names = [e[0] for e in CaptureReader(str(tmpdir)).index()]
+		assert len(set(names)) == 3
+		assert list(CaptureReader(str(tmpdir)).load('BTC-USD')['trade_id']) == [0, 1, 2, 3, 4]
+
+
+	def test_products_are_in_separate_files(self, tmpdir):
+		capture = MatchCapture(str(tmpdir))
+		capture.add_trade('BTC-USD', 1, 100.0, 1.0, 'buy', 1)
+		capture.add_trade('ETH-USD', 2, 10.0, 1.0, 'buy', 1)
+		capture.flush()
+		reader = CaptureReader(str(tmpdir))
+		assert len(reader.files('BTC-USD')) == 1
+		assert list(reader.load('ETH-USD')['price']) == [10.0]
+
+
+	def test_reader_loads_a_time_range(self, tmpdir):
+		capture = MatchCapture(str(tmpdir), max_rows=3)
+		for i in range(10): capture.add_trade('BTC-USD', i * NS, float(i), 1.0, 'buy', i)
+		capture.flush()
+		reader = CaptureReader(str(tmpdir))
+		assert len(reader.files('BTC-USD', 4 * NS, 6 * NS)) == 2
+		columns = reader.load('BTC-USD', 4 * NS, 6 * NS)
+		assert list(columns['trade_id']) == [4, 5, 6]
+
+
+	def test_invalid_file_raises(self, tmpdir):
+		path = os.path.join(str(tmpdir), 'bad.col')
+		with open(path, 'wb') as f: f.write(b'\0' * 32)
+		with pytest.raises(InvalidCaptureFileError):
+			read_columns(path)
@@ -9,11 +9,10 @@ import binascii
 import json
 import os
 import random
-import datetime
+from time import monotonic
 
 import pytest
 from mock import MagicMock
-from freezegun import freeze_time
 
 from websocket import WebSocketTimeoutException, \
     WebSocketConnectionClosedException, WebSocketAddressException
@@ -258,20 +257,41 @@ class TestGdaxStreamer:
         gdax_matches.on_connection_error.assert_called_once()
 
 
-    def test__mainloop__sends_keepalive_ping_at_least_10s_between_the_pings(self,gdax_matches):
+    def test__keepalive_ping_is_sent_by_the_timers_every_10s_not_by_the_mainloop(self,gdax_matches):
         gdax_matches._ws = MagicMock()
         gdax_matches._ws.recv.return_value = "{}"
         ping_mock = gdax_matches._ws.ping
-        with freeze_time("2018-02-18 12:00:00"):
-            gdax_matches._pinged_at = datetime.datetime.now()
-            gdax_matches._mainloop_recv_msg()
+        gdax_matches._schedule_timers()
+        gdax_matches._mainloop_recv_msg()
+        gdax_matches._timers.run_pending(monotonic() + 9)
         ping_mock.assert_not_called()
 
-        with freeze_time("2018-02-18 12:00:11"):
-            gdax_matches._mainloop_recv_msg()
+        gdax_matches._timers.run_pending(monotonic() + 10)
         ping_mock.assert_called_once_with('keepalive')
 
 
+    def test__watchdog_shuts_down_the_socket_when_no_message_is_received(self):
+        gdax = GdaxClient(['BTC-USD'], heartbeat_timeout=4)
+        gdax._ws = MagicMock()
+        gdax._watchdog_count, gdax._watchdog_at = gdax._messages_count, monotonic() - 3
+        gdax._check_stale()
+        gdax._ws.sock.shutdown.assert_not_called()
+
+        gdax._watchdog_at = monotonic() - 5
+        gdax._check_stale()
+        gdax._ws.sock.shutdown.assert_called_once()
+        assert gdax.stats()['stale_disconnects'] == 1
+
+
+    def test__watchdog_is_reset_by_the_received_messages(self):
+        gdax = GdaxClient(['BTC-USD'], heartbeat_timeout=4)
+        gdax._ws = MagicMock()
+        gdax._watchdog_count, gdax._watchdog_at = gdax._messages_count, monotonic() - 5
+        gdax._messages_count += 1
+        gdax._check_stale()
+        gdax._ws.sock.shutdown.assert_not_called()
+
+
     def test__create_with_environment(self):
         os.environ['CRYPTO_GDAX_PRODUCTS'] = "BTC-USD,LTC-USD"
         os.environ['CRYPTO_GDAX_CHANNELS'] = "matches,ticker"
@@ -281,4 +301,217 @@ class TestGdaxStreamer:
 
         assert client._products == ['BTC-USD','LTC-USD']
         assert client._channels == ['matches','ticker']
-        assert client._timeout == 10
\ No newline at end of file
+        assert client._timeout == 10
+
+    def test__buffered_mainloop__frames_are_dispatched_by_the_worker_thread(self,match_msg):
+        gdax = GdaxClient(['LTC-EUR'],buffer_size=4)
+        frames = [json.dumps(match_msg), json.dumps(match_msg)]
+        gdax._ws = MagicMock()
+        def recv():
+            if frames: return frames.pop()
+            gdax.stop()
+            raise WebSocketConnectionClosedException()
+        gdax._ws.recv.side_effect = recv
+        gdax.on_match = MagicMock()
+
+        gdax._mainloop()
+
+        assert gdax.on_match.call_count == 2
+        assert gdax.stats()['buffer_depth'] == 0
+
+
+    def test__buffered_mainloop__callback_error_is_raised_by_the_mainloop(self,match_msg):
+        gdax = GdaxClient(['LTC-EUR'],buffer_size=4)
+        gdax._ws = MagicMock()
+        gdax._ws.recv.return_value = json.dumps(match_msg)
+        gdax.on_match = MagicMock(side_effect=ValueError)
+
+        with pytest.raises(ValueError):
+            gdax._mainloop()
+
+
+    def test__buffered_mainloop__overflow_with_disconnect_policy_triggers_on_connection_error(self):
+        gdax = GdaxClient(['LTC-EUR'],buffer_size=1,overflow_policy='disconnect')
+        gdax._buffer = MagicMock()
+        from cryptostreamer.ringbuffer import RingBufferOverflowError
+        gdax._buffer.put.side_effect = RingBufferOverflowError
+        gdax.on_connection_error = MagicMock()
+
+        gdax._enqueue_frame("{}")
+
+        gdax.on_connection_error.assert_called_once()
+
+
+    def test__sequence_check__duplicates_are_not_dispatched(self,match_msg):
+        gdax = GdaxClient(['LTC-EUR'],sequence_check=True)
+        gdax.on_match = MagicMock()
+        gdax._handle_message(match_msg)
+        gdax._handle_message(match_msg)
+
+        gdax.on_match.assert_called_once_with(match_msg)
+        assert gdax.stats()['sequence_duplicates'] == 1
+
+
+    def test__sequence_check__trade_id_gap_triggers_resubscription(self,match_msg):
+        gdax = GdaxClient(['LTC-EUR'],sequence_check=True)
+        gdax._ws = MagicMock()
+        gdax._handle_message(dict(match_msg, trade_id=10))
+        gdax._handle_message(dict(match_msg, trade_id=13))
+
+        sent = [json.loads(c[0][0]) for c in gdax._ws.send.call_args_list]
+        assert [m['type'] for m in sent] == ['unsubscribe', 'subscribe']
+        assert sent[1]['product_ids'] == ['LTC-EUR']
+        assert gdax.stats()['sequence_missing'] == 2
+        assert gdax.stats()['resubscriptions'] == 1
+
+
+    def test__sequence_check__heartbeat_last_trade_id_ahead_is_a_gap(self,match_msg,heartbeat_msg):
+        gdax = GdaxClient(['BTC-EUR'],sequence_check=True,gap_threshold=5)
+        gdax.on_sequence_gap = MagicMock()
+        gdax._handle_message(dict(match_msg, product_id='BTC-EUR', trade_id=100))
+        gdax._handle_message(dict(heartbeat_msg, last_trade_id=103))
+        gdax.on_sequence_gap.assert_not_called()
+
+        gdax._handle_message(dict(heartbeat_msg, last_trade_id=110))
+        gdax.on_sequence_gap.assert_called_once_with('BTC-EUR', 7)
+
+
+    def test__sequence_check__ticker_with_the_same_trade_id_is_not_a_duplicate(self,match_msg):
+        gdax = GdaxClient(['LTC-EUR'],['matches','ticker'],sequence_check=True)
+        gdax._ws = MagicMock()
+        gdax.on_message = MagicMock()
+        gdax._handle_message(dict(match_msg, trade_id=10))
+        gdax._handle_message({'type': 'ticker', 'product_id': 'LTC-EUR', 'trade_id': 10})
+        gdax._handle_message({'type': 'ticker', 'product_id': 'LTC-EUR', 'trade_id': 20})
+        gdax._handle_message(dict(match_msg, trade_id=11))
+
+        assert gdax.on_message.call_count == 4
+        assert gdax.stats()['sequence_duplicates'] == 0
+        assert gdax.stats()['resubscriptions'] == 0
+
+
+    def test__sequence_check__full_channel_tracks_the_sequence(self,match_msg):
+        gdax = GdaxClient(['LTC-EUR'],['full'],sequence_check=True)
+        gdax.on_sequence_gap = MagicMock()
+        gdax._handle_message({'type': 'received', 'product_id': 'LTC-EUR', 'sequence': 1})
+        gdax._handle_message({'type': 'open', 'product_id': 'LTC-EUR', 'sequence': 2})
+        gdax._handle_message({'type': 'done', 'product_id': 'LTC-EUR', 'sequence': 4})
+        gdax.on_sequence_gap.assert_called_once_with('LTC-EUR', 1)
+
+
+    def test__reconnect__connection_error_reconnects_and_resubscribes(self,gdax_matches):
+        gdax = GdaxClient(['LTC-EUR'],reconnect=True,backoff_base=0)
+        old_ws = MagicMock()
+        old_ws.recv.side_effect = WebSocketConnectionClosedException
+        new_ws = MagicMock()
+        gdax._ws = old_ws
+        gdax._create_connection = MagicMock(return_value=new_ws)
+        gdax.on_connection_error = MagicMock()
+        gdax.on_disconnected = MagicMock()
+
+        gdax._mainloop_recv_msg()
+
+        old_ws.close.assert_called_once()
+        new_ws.send.assert_called_once_with(gdax._subscription_message())
+        assert gdax._ws is new_ws
+        gdax.on_connection_error.assert_not_called()
+        gdax.on_disconnected.assert_not_called()
+        assert gdax.stats()['reconnects'] == 1
+
+
+    def test__reconnect__drops_the_stale_order_books(self):
+        gdax = GdaxClient(['BTC-USD'],['level2'],orderbook=True,reconnect=True,backoff_base=0)
+        gdax._handle_message({'type': 'snapshot', 'product_id': 'BTC-USD', 'bids': [['100', '1']], 'asks': []})
+        gdax._ws = MagicMock()
+        gdax._ws.recv.side_effect = WebSocketConnectionClosedException
+        gdax._create_connection = MagicMock()
+
+        gdax._mainloop_recv_msg()
+
+        assert 'BTC-USD' not in gdax.orderbooks
+
+
+    def test__reconnect__on_connection_error_is_called_when_retries_are_exhausted(self):
+        gdax = GdaxClient(['LTC-EUR'],reconnect=True,max_retries=3,backoff_base=0)
+        gdax._ws = MagicMock()
+        gdax._ws.recv.side_effect = WebSocketConnectionClosedException
+        gdax._create_connection = MagicMock(side_effect=WebSocketAddressException)
+        gdax.on_connection_error = MagicMock()
+
+        gdax._mainloop_recv_msg()
+
+        assert gdax._create_connection.call_count == 3
+        gdax.on_connection_error.assert_called_once()
+        assert gdax.stats()['reconnects'] == 0
+
+
+    def test__reconnect__on_connection_error_returning_true_reconnects(self):
+        gdax = GdaxClient(['LTC-EUR'],backoff_base=0)
+        gdax._ws = MagicMock()
+        gdax._ws.recv.side_effect = WebSocketTimeoutException
+        gdax._create_connection = MagicMock()
+        gdax.on_connection_error = MagicMock(return_value=True)
+
+        gdax._mainloop_recv_msg()
+
+        gdax._create_connection.assert_called_once()
+        assert gdax.stats()['reconnects'] == 1
+
+
+    def test__backoff_delay_is_exponential_with_cap(self):
+        from cryptostreamer.backoff import backoff_delay
+        assert [backoff_delay(a, 0.5, 3, rnd=lambda: 1.0) for a in range(5)] == [0.5, 1, 2, 3, 3]
+        assert backoff_delay(2, 0.5, 3, rnd=lambda: 0.5) == 1
+
+
+    def test__orderbook__level2_messages_are_applied_and_dispatched(self):
+        gdax = GdaxClient(['BTC-USD'],['level2'],orderbook=True)
+        gdax.on_snapshot = MagicMock()
+        gdax.on_l2update = MagicMock()
+        gdax.on_orderbook = MagicMock()
+
+        gdax._handle_message({'type': 'snapshot', 'product_id': 'BTC-USD',
+                              'bids': [['100.0', '1']], 'asks': [['101.0', '2']]})
+        gdax._handle_message({'type': 'l2update', 'product_id': 'BTC-USD',
+                              'changes': [['buy', '100.5', '3']]})
+
+        gdax.on_snapshot.assert_called_once()
+        gdax.on_l2update.assert_called_once()
+        assert gdax.on_orderbook.call_count == 2
+        assert gdax.orderbooks['BTC-USD'].best_bid() == (100.5, 3.0)
+
+
+    def test__typed_messages__callbacks_get_records(self,match_msg):
+        from cryptostreamer.gdax.messages import Match
+        gdax = GdaxClient(['LTC-EUR'],typed_messages=True)
+        gdax.on_match = MagicMock()
+        gdax.on_message = MagicMock()
+        gdax._handle_message(match_msg)
+
+        gdax.on_message.assert_called_once_with(match_msg)
+        record = gdax.on_match.call_args[0][0]
+        assert isinstance(record, Match)
+        assert record.price == 183.8
+
+
+    def test__register_handler__dispatches_new_message_types(self):
+        class TickerClient(GdaxClient): pass
+        TickerClient.register_handler('ticker','on_ticker')
+        gdax = TickerClient(['LTC-EUR'],['ticker'])
+        gdax.on_ticker = MagicMock()
+        gdax._handle_message({'type': 'ticker', 'product_id': 'LTC-EUR'})
+
+        gdax.on_ticker.assert_called_once()
+        assert 'ticker' not in GdaxClient.MESSAGE_HANDLERS
+
+
+    def test__capture__matches_are_written_on_stop(self,match_msg,tmpdir):
+        from cryptostreamer.gdax.capture import CaptureReader
+        gdax = GdaxClient(['LTC-EUR'],capture_dir=str(tmpdir))
+        gdax._handle_message(match_msg)
+        gdax.stop()
+
+        columns = CaptureReader(str(tmpdir)).load('LTC-EUR')
+        assert list(columns['price']) == [183.8]
+        assert list(columns['trade_id']) == [match_msg['trade_id']]
+        assert gdax.stats()['capture_rows'] == 1
@@ -0,0 +1,61 @@
+from cryptostreamer.gdax.conflation import Conflator
+
+
+def collect(emitted):
+	return lambda msg, context: emitted.append(msg)
+
+
+def ticker(product_id, price):
+	return {'type': 'ticker', 'product_id': product_id, 'price': price}
+
+
+class TestConflator:
+
+	def test_only_the_latest_message_per_product_and_type_is_emitted(self):
+		emitted = []
+		conflator = Conflator(1.0, collect(emitted))
+		for price in ('1', '2', '3'): conflator.add(ticker('BTC-USD', price))
+		conflator.add(ticker('ETH-USD', '10'))
+		conflator.flush()
+		assert emitted == [ticker('BTC-USD', '3'), ticker('ETH-USD', '10')]
+		assert conflator.stats() == {'conflation_received': 4, 'conflation_conflated': 2,
+									 'conflation_emitted': 2, 'conflation_pending': 0}
+
+
+	def test_l2update_changes_are_merged(self):
+		emitted = []
+		conflator = Conflator(1.0, collect(emitted))
+		conflator.add({'type': 'l2update', 'product_id': 'BTC-USD', 'time': 't1',
+					   'changes': [['buy', '100', '1'], ['sell', '101', '2']]})
+		conflator.add({'type': 'l2update', 'product_id': 'BTC-USD', 'time': 't2',
+					   'changes': [['buy', '100', '0'], ['buy', '99', '3']]})
+		conflator.flush()
+		assert emitted == [{'type': 'l2update', 'product_id': 'BTC-USD', 'time': 't2',
+							'changes': [['sell', '101', '2'], ['buy', '100', '0'], ['buy', '99', '3']]}]
+
+
+	def test_flush_with_nothing_pending_emits_nothing(self):
+		emitted = []
+		conflator = Conflator(0.5, collect(emitted))
+		conflator.flush()
+		conflator.add(ticker('BTC-USD', '1'))
+		conflator.flush()
+		conflator.flush()
+		assert emitted == [ticker('BTC-USD', '1')]
+
+
+	def test_not_conflated_types_are_emitted_immediately(self):
+		emitted = []
+		conflator = Conflator(1.0, collect(emitted), types=['ticker'])
+		conflator.add({'type': 'match', 'product_id': 'BTC-USD'})
+		conflator.add(ticker('BTC-USD', '1'))
+		assert emitted == [{'type': 'match', 'product_id': 'BTC-USD'}]
+
+
+	def test_the_context_of_the_latest_message_is_emitted(self):
+		emitted = []
+		conflator = Conflator(1.0, lambda msg, context: emitted.append((msg['price'], context)))
+		conflator.add(ticker('BTC-USD', '1'), 10.0)
+		conflator.add(ticker('BTC-USD', '2'), 11.0)
+		conflator.flush()
+		assert emitted == [('2', 11.0)]
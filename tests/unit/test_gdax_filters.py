@@ -0,0 +1,64 @@
+import json
+import pytest
+
+from cryptostreamer.gdax.filters import create_filter, load_filter_config, InvalidFilterError
+
+
+MATCH = {'type': 'match', 'product_id': 'BTC-USD', 'price': '100.0', 'size': '0.5',
+		 'maker_order_id': 'a', 'taker_order_id': 'b', 'side': 'buy'}
+
+
+class TestMessageFilter:
+
+	def test_default_filter_drops_heartbeats_subscriptions_and_order_ids(self):
+		f = create_filter()
+		assert not f.accepts({'type': 'heartbeat'})
+		assert not f.accepts({'type': 'subscriptions'})
+		assert f.accepts(MATCH)
+		assert f.project(MATCH) == {'type': 'match', 'product_id': 'BTC-USD', 'price': '100.0',
+									'size': '0.5', 'side': 'buy'}
+		assert 'maker_order_id' in MATCH
+
+
+	def test_matches_only_is_the_default_types(self):
+		assert not create_filter(matches_only=True).accepts({'type': 'ticker'})
+		assert create_filter({'types': ['ticker']}, matches_only=True).accepts({'type': 'ticker'})
+
+
+	def test_types_products_and_thresholds(self):
+		f = create_filter({'types': ['match', 'ticker'], 'products': ['BTC-USD'],
+						   'min_size': 0.1, 'min_notional': 40})
+		assert f.accepts(MATCH)
+		assert not f.accepts(dict(MATCH, product_id='ETH-USD'))
+		assert not f.accepts(dict(MATCH, size='0.05'))
+		assert not f.accepts(dict(MATCH, price='100.0', size='0.2'))
+		assert f.accepts({'type': 'ticker', 'product_id': 'BTC-USD'})
+		assert f.needs_decoding
+
+
+	def test_fields_whitelist(self):
+		f = create_filter({'fields': ['type', 'price', 'time']})
+		assert f.project(MATCH) == {'type': 'match', 'price': '100.0'}
+
+
+	def test_accepts_type_checks_only_type_and_product(self):
+		f = create_filter({'products': ['BTC-USD']})
+		assert f.accepts_type('match', 'BTC-USD')
+		assert not f.accepts_type('match', 'ETH-USD')
+		assert not f.accepts_type('heartbeat', 'BTC-USD')
+		assert not f.needs_decoding
+
+
+	def test_unknown_keys_raise(self):
+		with pytest.raises(InvalidFilterError):
+			create_filter({'type': ['match']})
+
+
+	def test_load_config_from_json_or_file(self, tmpdir):
+		assert load_filter_config('{"types": ["match"]}') == {'types': ['match']}
+		path = tmpdir.join('filter.json')
+		path.write(json.dumps({'products': ['BTC-USD']}))
+		assert load_filter_config(str(path)) == {'products': ['BTC-USD']}
+		assert load_filter_config(None) is None
+		with pytest.raises(InvalidFilterError):
+			load_filter_config(str(tmpdir.join('missing.json')))
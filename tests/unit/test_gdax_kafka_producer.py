@@ -143,4 +143,345 @@ class TestKafkaProducer:
 		assert client._timeout == 2
 		assert client._kafka_topic == 'gdax'
 		assert client._kafka_kwargs['bootstrap_servers'] == ['localhost:9092']
-		assert client._matches_only == True
\ No newline at end of file
+		assert client._matches_only == True
+
+	def test_pipelined_send_does_not_wait_for_the_acknowledgement(self):
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{},pipelined=True)
+		gdax_producer._kafka_producer = MagicMock()
+		future_mock = gdax_producer._kafka_producer.send.return_value
+
+		gdax_producer.on_message({'type': 'match', 'product_id': 'BTC-USD'})
+
+		future_mock.get.assert_not_called()
+		future_mock.add_callback.assert_called_once()
+		future_mock.add_errback.assert_called_once()
+		assert gdax_producer._in_flight == 1
+
+		callback = future_mock.add_callback.call_args[0][0]
+		callback(MagicMock())
+		assert gdax_producer._in_flight == 0
+
+
+	def test_pipelined_send_applies_backpressure_when_max_in_flight_is_reached(self):
+		from kafka.errors import KafkaTimeoutError
+		import cryptostreamer.gdax.producer as producer_module
+		producer_module.KAFKA_SEND_TIMEOUT = 0.01
+
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{},pipelined=True,max_in_flight=2)
+		gdax_producer._kafka_producer = MagicMock()
+		gdax_producer.stop = MagicMock()
+		try:
+			gdax_producer.on_message({'type': 'match', 'product_id': 'BTC-USD'})
+			gdax_producer.on_message({'type': 'match', 'product_id': 'BTC-USD'})
+			with pytest.raises(KafkaTimeoutError):
+				gdax_producer.on_message({'type': 'match', 'product_id': 'BTC-USD'})
+		finally:
+			producer_module.KAFKA_SEND_TIMEOUT = 5
+
+		assert gdax_producer._kafka_producer.send.call_count == 2
+		gdax_producer.stop.assert_called_once()
+
+
+	def test_pipelined_send_error_is_reported_to_on_error_in_the_mainloop(self):
+		from kafka.errors import KafkaTimeoutError
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{},pipelined=True)
+		gdax_producer._kafka_producer = MagicMock()
+		gdax_producer.on_error = MagicMock()
+		future_mock = gdax_producer._kafka_producer.send.return_value
+
+		gdax_producer.on_message({'type': 'match', 'product_id': 'BTC-USD'})
+		errback = future_mock.add_errback.call_args[0][0]
+		error = KafkaTimeoutError()
+		errback(error)
+		gdax_producer.on_error.assert_not_called()
+
+		gdax_producer.on_message({'type': 'match', 'product_id': 'BTC-USD'})
+		gdax_producer.on_error.assert_called_once_with(error)
+
+
+	def test_stop_flushes_the_in_flight_records(self):
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{},pipelined=True)
+		kp_mock = MagicMock()
+		gdax_producer._kafka_producer = kp_mock
+		gdax_producer._ws = MagicMock()
+
+		gdax_producer.stop()
+
+		kp_mock.flush.assert_called_once()
+		kp_mock.close.assert_called_once()
+
+
+	def test_passthrough_sends_the_original_frame_without_decoding_it(self):
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{},passthrough=True)
+		gdax_producer._kafka_producer = MagicMock()
+		gdax_producer._codec = MagicMock()
+		frame = '{"type":"match","trade_id":1,"maker_order_id":"a","product_id":"BTC-USD"}'
+
+		gdax_producer._process_frame(frame)
+
+		gdax_producer._codec.loads.assert_not_called()
+		gdax_producer._kafka_producer.send.assert_called_once_with(
+			'gdax',value=frame.encode('utf-8'),key='BTC-USD')
+
+
+	def test_passthrough_decodes_the_frames_that_are_not_published(self):
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{},matches_only=True,passthrough=True)
+		gdax_producer._kafka_producer = MagicMock()
+		gdax_producer.on_heartbeat = MagicMock()
+		gdax_producer.on_last_match = MagicMock()
+
+		gdax_producer._process_frame('{"type":"heartbeat","product_id":"BTC-USD"}')
+		gdax_producer._process_frame('{"type":"last_match","product_id":"BTC-USD"}')
+
+		gdax_producer.on_heartbeat.assert_called_once()
+		gdax_producer.on_last_match.assert_called_once()
+		gdax_producer._kafka_producer.send.assert_not_called()
+
+
+	def test_passthrough_is_not_compatible_with_the_features_that_need_decoded_messages(self):
+		from cryptostreamer.gdax.producer import IncompatibleOptionsError
+		for option in ({'sequence_check': True}, {'orderbook': True}, {'capture_dir': '/tmp'},
+					   {'latency_tracking': True}):
+			gdax_kwargs = dict(option, products=['BTC-USD'])
+			with pytest.raises(IncompatibleOptionsError):
+				GdaxKafkaProducer("gdax",gdax_kwargs,{},passthrough=True)
+		GdaxKafkaProducer("gdax",{'products': ['BTC-USD'],'sequence_check': False},{},passthrough=True)
+
+
+	def test_passthrough_value_serializer_does_not_reencode_bytes(self):
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD'],'codec': 'json'},{},passthrough=True)
+		serializer = gdax_producer._value_serializer()
+		assert serializer(b'{"type":"match"}') == b'{"type":"match"}'
+		assert serializer({'type': 'match'}) == b'{"type": "match"}'
+
+
+	def test_closed_candles_are_published_to_the_candles_topic(self):
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{},matches_only=True,candle_intervals=[1])
+		gdax_producer._kafka_producer = MagicMock()
+		match = {'type': 'match', 'product_id': 'BTC-USD', 'price': '100', 'size': '1',
+				 'time': '2018-02-16T01:25:40.100000Z'}
+		gdax_producer.on_message(match)
+		gdax_producer.on_message({'type': 'heartbeat', 'product_id': 'BTC-USD',
+								  'time': '2018-02-16T01:25:41.100000Z'})
+
+		calls = gdax_producer._kafka_producer.send.call_args_list
+		assert [c[0][0] for c in calls] == ['gdax', 'gdax-candles']
+		candle = calls[1][1]['value']
+		assert candle['close'] == 100.0
+		assert candle['interval'] == 1
+		assert gdax_producer.stats()['candles_emitted'] == 1
+
+
+	def test_with_spool_failed_records_are_spooled_and_replayed_in_order(self,tmpdir):
+		from kafka.errors import KafkaTimeoutError
+		from time import sleep
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD'],'codec': 'json'},{},spool_dir=str(tmpdir))
+		kafka_producer = MagicMock()
+		gdax_producer._get_kafka_producer = MagicMock(return_value=kafka_producer)
+		gdax_producer.on_setup()
+		gdax_producer._spool_drainer.stop()
+		gdax_producer.stop = MagicMock()
+
+		kafka_producer.send.return_value.get.side_effect = KafkaTimeoutError
+		gdax_producer.on_message({'type': 'match', 'product_id': 'BTC-USD', 'trade_id': 1})
+		kafka_producer.send.reset_mock()
+		kafka_producer.send.return_value.get.side_effect = None
+		gdax_producer.on_message({'type': 'match', 'product_id': 'BTC-USD', 'trade_id': 2})
+
+		gdax_producer.stop.assert_not_called()
+		kafka_producer.send.assert_not_called()
+		assert gdax_producer.stats()['spool_records'] == 2
+
+		gdax_producer._spool_drainer.start()
+		for _ in range(100):
+			if len(gdax_producer._spool) == 0: break
+			sleep(0.01)
+		gdax_producer._close_spool()
+
+		values = [c[1]['value'] for c in kafka_producer.send.call_args_list]
+		assert values == [b'{"type": "match", "product_id": "BTC-USD", "trade_id": 1}',
+						  b'{"type": "match", "product_id": "BTC-USD", "trade_id": 2}']
+
+
+	def test_default_send_keys_by_product_without_headers(self):
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{})
+		gdax_producer._kafka_producer = MagicMock()
+		msg = {'type': 'match', 'product_id': 'BTC-USD', 'sequence': 10}
+		gdax_producer.on_message(msg)
+		gdax_producer._kafka_producer.send.assert_called_once_with('gdax',value=msg,key='BTC-USD')
+
+
+	def test_headers_carry_type_product_and_sequence(self):
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{},headers=True)
+		gdax_producer._kafka_producer = MagicMock()
+		gdax_producer.on_message({'type': 'match', 'product_id': 'BTC-USD', 'sequence': 10})
+		headers = gdax_producer._kafka_producer.send.call_args[1]['headers']
+		assert headers == [('type', b'match'), ('product_id', b'BTC-USD'), ('sequence', b'10')]
+
+
+	def test_map_partitioner_sends_to_the_mapped_partition(self):
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD','ETH-USD']},{},
+										  partitioner='map',partition_map={'BTC-USD': 3})
+		gdax_producer._kafka_producer = MagicMock()
+		gdax_producer.on_message({'type': 'match', 'product_id': 'BTC-USD'})
+		gdax_producer.on_message({'type': 'match', 'product_id': 'ETH-USD'})
+		first, second = gdax_producer._kafka_producer.send.call_args_list
+		assert first[1]['partition'] == 3 and first[1]['key'] == 'BTC-USD'
+		assert 'partition' not in second[1]
+
+
+	def test_round_robin_partitioner_puts_the_sequence_in_the_key(self):
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{},
+										  partitioner='round-robin',passthrough=True)
+		gdax_producer._kafka_producer = MagicMock()
+		gdax_producer._kafka_producer.partitions_for.return_value = {0, 1}
+		for seq in (1, 2):
+			gdax_producer._process_frame('{"type": "match", "product_id": "BTC-USD", "sequence": %d}' % seq)
+		calls = gdax_producer._kafka_producer.send.call_args_list
+		assert [c[1]['key'] for c in calls] == ['BTC-USD:1', 'BTC-USD:2']
+		assert sorted(c[1]['partition'] for c in calls) == [0, 1]
+
+
+	def test_binary_wire_format_encodes_matches_and_keeps_json_for_the_others(self):
+		from cryptostreamer.gdax import wire
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD'],'codec': 'json'},{},wire_format='binary')
+		gdax_producer._kafka_producer = MagicMock()
+		match = {'type': 'match', 'product_id': 'BTC-USD', 'time': '2014-11-07T08:19:27.028459Z',
+				 'trade_id': 1, 'sequence': 2, 'price': '400.23', 'size': '1', 'side': 'buy',
+				 'maker_order_id': 'a'}
+		gdax_producer.on_message(match)
+		gdax_producer.on_message({'type': 'ticker', 'product_id': 'BTC-USD', 'maker_order_id': 'a'})
+		first, second = [c[1]['value'] for c in gdax_producer._kafka_producer.send.call_args_list]
+		assert wire.decode(first)['price'] == 400.23
+		assert second == {'type': 'ticker', 'product_id': 'BTC-USD'}
+		assert gdax_producer._value_serializer()(first) == first
+
+
+	def test_binary_wire_format_is_not_compatible_with_passthrough(self):
+		from cryptostreamer.gdax.wire import UnsupportedWireFormatError
+		with pytest.raises(UnsupportedWireFormatError):
+			GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{},wire_format='binary',passthrough=True)
+
+
+	def test_conflation_publishes_the_latest_message_at_the_interval(self):
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{},conflate_interval=60)
+		kafka_producer = gdax_producer._kafka_producer = MagicMock()
+		for price in ('1', '2'):
+			gdax_producer.on_message({'type': 'ticker', 'product_id': 'BTC-USD', 'price': price})
+		kafka_producer.send.assert_not_called()
+
+		gdax_producer.stop()
+
+		kafka_producer.send.assert_called_once_with(
+			'gdax',value={'type': 'ticker', 'product_id': 'BTC-USD', 'price': '2'},key='BTC-USD')
+		assert gdax_producer.stats()['conflation_conflated'] == 1
+
+
+	def test_filter_config_is_applied_before_sending(self):
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD','ETH-USD']},{},
+										  filter_config={'products': ['BTC-USD'], 'fields': ['type','product_id','price']})
+		gdax_producer._kafka_producer = MagicMock()
+		gdax_producer.on_message({'type': 'match', 'product_id': 'ETH-USD', 'price': '1'})
+		gdax_producer.on_message({'type': 'match', 'product_id': 'BTC-USD', 'price': '2', 'size': '1'})
+		gdax_producer._kafka_producer.send.assert_called_once_with(
+			'gdax',value={'type': 'match', 'product_id': 'BTC-USD', 'price': '2'},key='BTC-USD')
+
+
+	def test_passthrough_skips_the_filtered_products_without_decoding(self):
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD','ETH-USD']},{},
+										  passthrough=True,filter_config={'products': ['BTC-USD']})
+		gdax_producer._kafka_producer = MagicMock()
+		gdax_producer._process_frame('{"type":"match","product_id":"ETH-USD"}')
+		gdax_producer._process_frame('{"type":"match","product_id":"BTC-USD"}')
+		gdax_producer._kafka_producer.send.assert_called_once_with(
+			'gdax',value=b'{"type":"match","product_id":"BTC-USD"}',key='BTC-USD')
+
+
+	def test_conflated_messages_are_flushed_by_the_timer(self):
+		from time import monotonic
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{},conflate_interval=0.5)
+		gdax_producer._kafka_producer = MagicMock()
+		gdax_producer._schedule_timers()
+		gdax_producer.on_message({'type': 'ticker', 'product_id': 'BTC-USD', 'price': '1'})
+		gdax_producer._timers.run_pending(monotonic() + 0.4)
+		gdax_producer._kafka_producer.send.assert_not_called()
+
+		gdax_producer._timers.run_pending(monotonic() + 0.5)
+		gdax_producer._kafka_producer.send.assert_called_once()
+
+
+	def test_kafka_send_error_in_the_conflation_timer_is_raised_by_start(self):
+		from time import sleep
+		from kafka.errors import KafkaTimeoutError
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{},conflate_interval=0.05)
+		kafka_producer = MagicMock()
+		kafka_producer.send.return_value.get.side_effect = KafkaTimeoutError
+		gdax_producer._get_kafka_producer = MagicMock(return_value=kafka_producer)
+		gdax_producer._subscribe = MagicMock()
+
+		def recv():
+			sleep(0.01)
+			return '{"type":"ticker","product_id":"BTC-USD","price":"1"}'
+		def connect():
+			gdax_producer._ws = MagicMock()
+			gdax_producer._ws.recv.side_effect = recv
+		gdax_producer._connect = connect
+
+		with pytest.raises(KafkaTimeoutError):
+			gdax_producer.start()
+		assert gdax_producer._stopping
+
+
+	def test_pipelined_send_error_in_the_conflation_timer_is_kept_for_the_mainloop(self):
+		from kafka.errors import KafkaTimeoutError
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{},conflate_interval=60,pipelined=True)
+		gdax_producer._kafka_producer = MagicMock()
+		gdax_producer.on_message({'type': 'ticker', 'product_id': 'BTC-USD', 'price': '1'})
+		error = KafkaTimeoutError()
+		gdax_producer._send_error = error
+
+		with pytest.raises(KafkaTimeoutError):
+			gdax_producer._flush_conflated()
+		assert gdax_producer._timer_error is error
+
+
+	def test_spooled_records_are_replayed_with_their_partition_and_headers(self,tmpdir):
+		from kafka.errors import KafkaTimeoutError
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD'],'codec': 'json'},{},spool_dir=str(tmpdir),
+										  headers=True,partitioner='map',partition_map={'BTC-USD': 2})
+		kafka_producer = MagicMock()
+		gdax_producer._get_kafka_producer = MagicMock(return_value=kafka_producer)
+		gdax_producer.on_setup()
+		gdax_producer._spool_drainer.stop()
+
+		kafka_producer.send.return_value.get.side_effect = KafkaTimeoutError
+		gdax_producer.on_message({'type': 'match', 'product_id': 'BTC-USD', 'sequence': 5})
+		kafka_producer.send.reset_mock()
+		kafka_producer.send.return_value.get.side_effect = None
+		gdax_producer._send_spooled(gdax_producer._spool.peek())
+		gdax_producer._close_spool()
+
+		kwargs = kafka_producer.send.call_args[1]
+		assert kwargs['key'] == 'BTC-USD' and kwargs['partition'] == 2
+		assert kwargs['headers'] == [('type', b'match'), ('product_id', b'BTC-USD'), ('sequence', b'5')]
+
+
+	def test_conflated_records_carry_their_own_receive_time(self):
+		gdax_producer = GdaxKafkaProducer("gdax",{'products': ['BTC-USD']},{},conflate_interval=60,recv_ts_header=True)
+		gdax_producer._kafka_producer = MagicMock()
+		gdax_producer._received_at = 100.0
+		gdax_producer.on_message({'type': 'ticker', 'product_id': 'BTC-USD', 'price': '1'})
+		gdax_producer._received_at = 200.0
+		gdax_producer._conflator.flush()
+
+		headers = dict(gdax_producer._kafka_producer.send.call_args[1]['headers'])
+		assert int(headers['recv_ts']) == int((100.0 + gdax_producer._wall_offset) * 1e9)
+
+
+	def test_each_shard_spools_in_its_own_directory(self,tmpdir,monkeypatch):
+		monkeypatch.setenv('CRYPTO_STREAMER_GDAX_PRODUCTS','BTC-USD')
+		monkeypatch.setenv('CRYPTO_STREAMER_KAFKA_GDAX_SPOOL_DIR',str(tmpdir))
+		assert GdaxKafkaProducer.create_with_environment()._spool_dir == str(tmpdir)
+		client = GdaxKafkaProducer.create_with_environment(shard_id=1,products=['ETH-USD'])
+		assert client._spool_dir == os.path.join(str(tmpdir),'shard-1')
+		assert client._products == ['ETH-USD']
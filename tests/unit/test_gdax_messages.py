@@ -0,0 +1,32 @@
+from cryptostreamer.gdax.messages import Match, Heartbeat, L2Update, parse_time_ns
+
+
+class TestMessages:
+
+	def test_match_from_dict_parses_prices_and_sizes(self):
+		m = Match.from_dict({
+			"type": "match", "trade_id": 10, "maker_order_id": "a", "taker_order_id": "b",
+			"side": "sell", "size": "3.53526947", "price": "183.80000000",
+			"product_id": "LTC-EUR", "sequence": 50, "time": "2018-02-16T01:25:40.647000Z"
+		})
+		assert m.price == 183.8
+		assert m.size == 3.53526947
+		assert m.to_dict()['trade_id'] == 10
+		assert not hasattr(m, '__dict__')
+
+
+	def test_heartbeat_from_dict(self):
+		h = Heartbeat.from_dict({'type': 'heartbeat', 'last_trade_id': 1, 'product_id': 'BTC-EUR',
+								 'sequence': 2, 'time': '2018-02-17T21:09:45.371000Z'})
+		assert h == Heartbeat('BTC-EUR', 2, 1, '2018-02-17T21:09:45.371000Z')
+
+
+	def test_l2update_from_dict(self):
+		u = L2Update.from_dict({'type': 'l2update', 'product_id': 'BTC-USD',
+								'changes': [['buy', '100.5', '0.1']]})
+		assert u.changes == (('buy', 100.5, 0.1),)
+
+
+	def test_parse_time_ns(self):
+		assert parse_time_ns('1970-01-01T00:00:01.000001Z') == 1000001000
+		assert parse_time_ns('2018-02-16T01:25:40.647000Z') == 1518744340647000000
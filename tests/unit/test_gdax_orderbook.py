@@ -0,0 +1,84 @@
+from cryptostreamer.gdax.orderbook import OrderBook, OrderBooks
+
+
+SNAPSHOT = {
+	'type': 'snapshot', 'product_id': 'BTC-USD',
+	'bids': [['10000.00', '1.5'], ['9999.00', '2'], ['9998.50', '0.1']],
+	'asks': [['10001.00', '0.5'], ['10003.00', '3']]
+}
+
+
+class TestOrderBook:
+
+	def test_snapshot(self):
+		book = OrderBook('BTC-USD')
+		book.apply_snapshot(SNAPSHOT)
+		assert book.best_bid() == (10000.0, 1.5)
+		assert book.best_ask() == (10001.0, 0.5)
+		assert book.spread() == 1.0
+		assert book.depth(2) == {
+			'product_id': 'BTC-USD',
+			'bids': [(10000.0, 1.5), (9999.0, 2.0)],
+			'asks': [(10001.0, 0.5), (10003.0, 3.0)]
+		}
+
+
+	def test_l2update_sets_and_removes_levels(self):
+		book = OrderBook('BTC-USD')
+		book.apply_snapshot(SNAPSHOT)
+		book.apply_l2update({'type': 'l2update', 'product_id': 'BTC-USD', 'changes': [
+			['buy', '10000.50', '0.3'],
+			['sell', '10001.00', '0'],
+			['sell', '10002.00', '1'],
+			['buy', '9999.00', '4']
+		]})
+		assert book.best_bid() == (10000.5, 0.3)
+		assert book.best_ask() == (10002.0, 1.0)
+		assert book.bids.size_at(9999.0) == 4.0
+		assert len(book.asks) == 2
+
+
+	def test_depth_larger_than_the_book(self):
+		book = OrderBook('BTC-USD')
+		book.apply_snapshot(SNAPSHOT)
+		assert len(book.depth(10)['asks']) == 2
+		assert OrderBook('ETH-USD').top() == {'product_id': 'ETH-USD', 'bid': None, 'ask': None}
+
+
+	def test_full_channel(self):
+		book = OrderBook('BTC-USD')
+		book.apply_full({'type': 'open', 'order_id': 'a', 'side': 'buy', 'price': '100', 'remaining_size': '2', 'sequence': 1})
+		book.apply_full({'type': 'open', 'order_id': 'b', 'side': 'buy', 'price': '100', 'remaining_size': '1', 'sequence': 2})
+		book.apply_full({'type': 'open', 'order_id': 'c', 'side': 'sell', 'price': '101', 'remaining_size': '1', 'sequence': 3})
+		assert book.best_bid() == (100.0, 3.0)
+
+		book.apply_full({'type': 'match', 'maker_order_id': 'a', 'size': '0.5', 'sequence': 4})
+		assert book.best_bid() == (100.0, 2.5)
+
+		book.apply_full({'type': 'change', 'order_id': 'b', 'new_size': '0.5', 'sequence': 5})
+		assert book.best_bid() == (100.0, 2.0)
+
+		book.apply_full({'type': 'done', 'order_id': 'a', 'sequence': 6})
+		book.apply_full({'type': 'done', 'order_id': 'b', 'sequence': 7})
+		assert book.best_bid() is None
+		assert book.best_ask() == (101.0, 1.0)
+		assert book.sequence == 7
+
+
+
+class TestOrderBooks:
+
+	def test_level2_messages_update_the_product_book(self):
+		books = OrderBooks()
+		assert books.handle('snapshot', SNAPSHOT) is books['BTC-USD']
+		assert books.handle('match', {'product_id': 'BTC-USD'}) is None
+		assert 'ETH-USD' not in books
+
+
+	def test_reset_drops_the_books(self):
+		books = OrderBooks()
+		books.handle('snapshot', SNAPSHOT)
+		books.reset('ETH-USD')
+		assert 'BTC-USD' in books
+		books.reset('BTC-USD')
+		assert 'BTC-USD' not in books
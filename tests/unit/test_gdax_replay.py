@@ -0,0 +1,79 @@
+import json
+import pytest
+from time import monotonic
+from mock import MagicMock
+
+from cryptostreamer.gdax.client import GdaxClient
+from cryptostreamer.gdax.replay import FrameRecorder, ReplayTransport, ReplayFinishedError, \
+	read_frames, replay
+
+
+MATCH = {'type': 'match', 'trade_id': 1, 'side': 'buy', 'size': '1.0', 'price': '100.0',
+		 'product_id': 'BTC-USD', 'sequence': 1, 'time': '2018-02-16T01:25:40.647000Z'}
+
+
+def record(path, frames):
+	recorder = FrameRecorder(path)
+	for recv_ns, data in frames: recorder.record(data, recv_ns)
+	recorder.close()
+
+
+class TestReplay:
+
+	def test_recorder_wraps_the_connection(self, tmpdir):
+		path = str(tmpdir.join('frames.rec'))
+		ws = MagicMock()
+		ws.recv.side_effect = ['{"type":"subscriptions"}', b'\x00\x01']
+		recorder = FrameRecorder(path)
+		conn = recorder.wrap(MagicMock(return_value=ws))('wss://example', timeout=1)
+		conn.recv()
+		conn.recv()
+		conn.send('subscribe')
+		recorder.close()
+
+		ws.send.assert_called_once_with('subscribe')
+		assert [data for _, data in read_frames(path)] == ['{"type":"subscriptions"}', b'\x00\x01']
+
+
+	def test_recorder_records_the_frames_read_with_recv_data_when_metrics_are_on(self, tmpdir):
+		from websocket import ABNF
+		from cryptostreamer.metrics import Metrics
+		path = str(tmpdir.join('frames.rec'))
+		ws = MagicMock()
+		ws.recv_data.side_effect = [(ABNF.OPCODE_PONG, b'keepalive'), (ABNF.OPCODE_TEXT, b'{"type":"heartbeat"}')]
+		recorder = FrameRecorder(path)
+		gdax = GdaxClient(['BTC-USD'], metrics=Metrics())
+		gdax._create_connection = recorder.wrap(MagicMock(return_value=ws))
+		gdax._connect()
+		gdax._mainloop_recv_msg()
+		recorder.close()
+
+		assert [data for _, data in read_frames(path)] == ['{"type":"heartbeat"}']
+
+
+	def test_replay_dispatches_the_frames_to_the_client(self, tmpdir):
+		path = str(tmpdir.join('frames.rec'))
+		record(path, [(i, json.dumps(dict(MATCH, trade_id=i))) for i in range(1, 4)])
+		gdax = GdaxClient(['BTC-USD'])
+		gdax.on_match = MagicMock()
+
+		transport = replay(gdax, path)
+
+		assert [c[0][0]['trade_id'] for c in gdax.on_match.call_args_list] == [1, 2, 3]
+		assert transport.stats()['replay_frames'] == 3
+		assert transport.finished
+
+
+	def test_replay_speed(self, tmpdir):
+		path = str(tmpdir.join('frames.rec'))
+		record(path, [(0, 'a'), (100000000, 'b')])
+		transport = ReplayTransport(path, speed=10)
+		conn = transport('wss://example')
+		started = monotonic()
+		assert conn.recv() == 'a'
+		assert conn.recv() == 'b'
+		assert 0.009 < monotonic() - started < 0.09
+		with pytest.raises(ReplayFinishedError):
+			conn.recv()
+		with pytest.raises(ReplayFinishedError):
+			transport('wss://example')
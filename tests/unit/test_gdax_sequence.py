@@ -0,0 +1,51 @@
+from cryptostreamer.gdax.sequence import SequenceTracker, DUPLICATE, OUT_OF_ORDER
+
+
+class TestSequenceTracker:
+
+	def test_contiguous_sequence(self):
+		t = SequenceTracker()
+		assert [t.observe('BTC-USD', s) for s in (10, 11, 12)] == [0, 0, 0]
+		assert t.stats()['sequence_gaps'] == 0
+
+
+	def test_products_are_tracked_independently(self):
+		t = SequenceTracker()
+		t.observe('BTC-USD', 10)
+		assert t.observe('ETH-USD', 500) == 0
+		assert t.observe('BTC-USD', 11) == 0
+
+
+	def test_gap(self):
+		t = SequenceTracker()
+		t.observe('BTC-USD', 10)
+		assert t.observe('BTC-USD', 14) == 3
+		assert t.observe('BTC-USD', 15) == 0
+		assert t.gaps == 1
+		assert t.missing == 3
+
+
+	def test_duplicate_and_out_of_order(self):
+		t = SequenceTracker()
+		t.observe('BTC-USD', 10)
+		t.observe('BTC-USD', 11)
+		assert t.observe('BTC-USD', 11) == DUPLICATE
+		assert t.observe('BTC-USD', 9) == OUT_OF_ORDER
+		assert t.observe('BTC-USD', 12) == 0
+		assert (t.duplicates, t.out_of_order) == (1, 1)
+
+
+	def test_check_last_seen(self):
+		t = SequenceTracker()
+		assert t.check('BTC-USD', 10) == 0
+		t.observe('BTC-USD', 10)
+		assert t.check('BTC-USD', 10) == 0
+		assert t.check('BTC-USD', 12) == 2
+		assert t.observe('BTC-USD', 13) == 0
+
+
+	def test_reset(self):
+		t = SequenceTracker()
+		t.observe('BTC-USD', 10)
+		t.reset('BTC-USD')
+		assert t.observe('BTC-USD', 100) == 0
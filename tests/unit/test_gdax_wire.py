@@ -0,0 +1,59 @@
+import json
+import pytest
+
+from cryptostreamer.gdax import wire
+
+
+MATCH = {
+	"type": "match", "trade_id": 10, "sequence": 50,
+	"maker_order_id": "ac928c66-ca53-498f-9c13-a110027a60e8",
+	"taker_order_id": "132fb6ae-456b-4654-b4e0-d681ac05cea1",
+	"time": "2014-11-07T08:19:27.028459Z", "product_id": "BTC-USD",
+	"size": "5.23512", "price": "400.23", "side": "sell"
+}
+
+
+class TestWire:
+
+	def test_match_roundtrip(self):
+		decoded = wire.decode(wire.encode(MATCH))
+		assert decoded == {
+			'type': 'match', 'product_id': 'BTC-USD', 'time_ns': 1415348367028459000,
+			'trade_id': 10, 'sequence': 50, 'price': 400.23, 'size': 5.23512, 'side': 'sell'
+		}
+
+
+	def test_last_match_roundtrip(self):
+		decoded = wire.decode(wire.encode(dict(MATCH, type='last_match')))
+		assert decoded['type'] == 'last_match'
+		assert decoded['trade_id'] == 10
+
+
+	def test_l2update_roundtrip(self):
+		msg = {"type": "l2update", "product_id": "ETH-EUR", "time": "2019-08-14T20:42:27.265Z",
+			   "changes": [["buy", "10101.80", "0.162567"], ["sell", "10102.55", "0"]]}
+		decoded = wire.decode(wire.encode(msg))
+		assert decoded['product_id'] == 'ETH-EUR'
+		assert decoded['changes'] == [('buy', 10101.8, 0.162567), ('sell', 10102.55, 0.0)]
+
+
+	def test_decimal_strings_are_scaled_exactly(self):
+		assert wire.to_scaled('0.00000001') == 1
+		assert wire.to_scaled('4000.1') == 400010000000
+		assert wire.to_scaled('-1.5') == -150000000
+		assert wire.to_scaled('.25') == 25000000
+
+
+	def test_encoded_match_is_smaller_than_json(self):
+		assert len(wire.encode(MATCH)) < len(json.dumps(MATCH)) / 4
+
+
+	def test_unsupported_types_are_not_encoded(self):
+		assert wire.encode({'type': 'ticker', 'product_id': 'BTC-USD'}) is None
+
+
+	def test_unknown_version_raises(self):
+		data = bytearray(wire.encode(MATCH))
+		data[0] = wire.VERSION + 1
+		with pytest.raises(wire.UnsupportedWireFormatError):
+			wire.decode(bytes(data))
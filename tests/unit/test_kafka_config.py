@@ -0,0 +1,68 @@
+import pytest
+
+from cryptostreamer.kafka_config import producer_config, aiokafka_config, parse_acks, \
+	InvalidKafkaConfigError, COMPRESSION_CODECS
+
+
+class TestKafkaConfig:
+
+	def test_default_preset_keeps_gzip(self):
+		config = producer_config({'bootstrap_servers': ['localhost:9092']})
+		assert config == {'bootstrap_servers': ['localhost:9092'], 'compression_type': 'gzip'}
+
+
+	def test_preset_is_applied_and_not_passed_to_kafka(self):
+		config = producer_config({'preset': 'low-latency'})
+		assert 'preset' not in config
+		assert config['linger_ms'] == 0
+		assert config['compression_type'] is None
+
+
+	def test_explicit_settings_override_the_preset(self):
+		config = producer_config({'preset': 'low-latency', 'linger_ms': 5, 'compression_type': 'gzip'})
+		assert config['linger_ms'] == 5
+		assert config['compression_type'] == 'gzip'
+
+
+	def test_high_throughput_falls_back_to_an_installed_codec(self):
+		config = producer_config({'preset': 'high-throughput'})
+		assert COMPRESSION_CODECS[config['compression_type']]()
+
+
+	def test_none_compression(self):
+		assert producer_config({'compression_type': 'none'})['compression_type'] is None
+
+
+	@pytest.mark.parametrize('kwargs', [
+		{'preset': 'fastest'},
+		{'compression_type': 'brotli'},
+		{'acks': 2},
+		{'linger_ms': -1},
+		{'batch_size': 0},
+		{'batch_size': 1024, 'buffer_memory': 512},
+		{'max_in_flight_requests_per_connection': '5'}
+	])
+	def test_invalid_settings(self, kwargs):
+		with pytest.raises(InvalidKafkaConfigError):
+			producer_config(kwargs)
+
+
+	def test_aiokafka_config_maps_the_settings(self):
+		config = aiokafka_config({'preset': 'high-throughput', 'acks': -1})
+		assert config['max_batch_size'] == 262144
+		assert config['linger_ms'] == 20
+		assert config['acks'] == 'all'
+		assert 'batch_size' not in config
+		assert 'buffer_memory' not in config
+		assert 'max_in_flight_requests_per_connection' not in config
+		assert aiokafka_config({})['compression_type'] == 'gzip'
+		assert aiokafka_config({'preset': 'low-latency'})['compression_type'] is None
+
+
+	def test_parse_acks(self):
+		assert parse_acks('all') == 'all'
+		assert parse_acks(' 1 ') == 1
+		assert parse_acks('-1') == -1
+		assert parse_acks(None) is None
+		with pytest.raises(InvalidKafkaConfigError):
+			parse_acks('leader')
@@ -0,0 +1,72 @@
+from time import time
+from datetime import datetime, timezone
+from mock import MagicMock
+
+from cryptostreamer.latency import RollingWindow, LatencyTracker, percentiles, \
+	EXCHANGE_RECV, RECV_DISPATCH, DISPATCH_ACK
+from cryptostreamer.gdax.client import GdaxClient
+from cryptostreamer.gdax import GdaxKafkaProducer
+
+
+def now_iso():
+	return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class TestLatencyTracker:
+
+	def test_rolling_window_keeps_the_last_samples(self):
+		w = RollingWindow(3)
+		for v in range(5): w.add(float(v))
+		assert sorted(w.samples()) == [2.0, 3.0, 4.0]
+		assert w.count == 5
+
+
+	def test_percentiles(self):
+		assert percentiles(range(100)) == {'p50': 50, 'p99': 99}
+		assert percentiles([]) == {'p50': None, 'p99': None}
+
+
+	def test_percentiles_per_product_and_overall(self):
+		tracker = LatencyTracker()
+		for v in range(10): tracker.observe('BTC-USD', RECV_DISPATCH, v / 1000.0)
+		tracker.observe('ETH-USD', RECV_DISPATCH, 1.0)
+		assert tracker.percentiles('BTC-USD')[RECV_DISPATCH]['p99'] == 0.009
+		assert tracker.percentiles()[RECV_DISPATCH]['p99'] == 1.0
+		assert tracker.products() == ['BTC-USD', 'ETH-USD']
+		assert tracker.stats()['latency_recv_dispatch_p99'] == 1.0
+
+
+	def test_client_tracks_exchange_recv_and_recv_dispatch(self):
+		gdax = GdaxClient(['BTC-USD'], latency_tracking=True)
+		gdax._ws = MagicMock()
+		gdax._ws.recv.return_value = '{"type": "match", "product_id": "BTC-USD", "time": "%s"}' % now_iso()
+		gdax._mainloop_recv_msg()
+
+		p = gdax.latency.percentiles('BTC-USD')
+		assert 0 <= p[RECV_DISPATCH]['p50'] < 1
+		assert -1 < p[EXCHANGE_RECV]['p50'] < 1
+
+
+	def test_buffered_frames_carry_the_receive_time(self):
+		gdax = GdaxClient(['BTC-USD'], buffer_size=4, latency_tracking=True)
+		gdax._buffer = MagicMock()
+		gdax._ws = MagicMock()
+		gdax._ws.recv.return_value = '{"type": "heartbeat"}'
+		gdax._mainloop_recv_msg()
+
+		received_at, frame = gdax._buffer.put.call_args[0][0]
+		assert frame == '{"type": "heartbeat"}'
+		assert isinstance(received_at, float)
+
+
+	def test_producer_tracks_dispatch_ack_and_sends_the_recv_ts_header(self):
+		producer = GdaxKafkaProducer('gdax', {'products': ['BTC-USD'], 'latency_tracking': True}, {},
+									 recv_ts_header=True)
+		producer._kafka_producer = MagicMock()
+		producer._ws = MagicMock()
+		producer._ws.recv.return_value = '{"type": "match", "product_id": "BTC-USD", "time": "%s"}' % now_iso()
+		producer._mainloop_recv_msg()
+
+		headers = dict(producer._kafka_producer.send.call_args[1]['headers'])
+		assert abs(int(headers['recv_ts']) / 1e9 - time()) < 1
+		assert DISPATCH_ACK in producer.latency.percentiles('BTC-USD')
@@ -0,0 +1,80 @@
+from urllib.request import urlopen
+from urllib.error import HTTPError
+from mock import MagicMock
+from websocket import ABNF
+import pytest
+
+from cryptostreamer.metrics import Metrics, MetricsServer, Histogram
+from cryptostreamer.gdax.client import GdaxClient
+from cryptostreamer.gdax import GdaxKafkaProducer
+
+
+class TestMetrics:
+
+	def test_histogram_buckets(self):
+		h = Histogram((0.1, 1.0))
+		for v in (0.05, 0.1, 0.5, 2.0): h.observe(v)
+		assert h.counts == [2, 1, 1]
+		assert h.count == 4
+
+
+	def test_render_prometheus_text(self):
+		metrics = Metrics()
+		metrics.count_message('match', 'BTC-USD')
+		metrics.count_message('match', 'BTC-USD')
+		metrics.inc('errors_total')
+		metrics.histogram('latency_seconds', (0.1, 1.0)).observe(0.5)
+		metrics.add_collector(lambda: {'reconnects': 2, 'name': 'ignored', 'flag': True})
+
+		text = metrics.render()
+		assert 'cryptostreamer_messages_total{type="match",product_id="BTC-USD"} 2' in text
+		assert 'cryptostreamer_errors_total 1' in text
+		assert 'cryptostreamer_latency_seconds_bucket{le="0.1"} 0' in text
+		assert 'cryptostreamer_latency_seconds_bucket{le="1.0"} 1' in text
+		assert 'cryptostreamer_latency_seconds_bucket{le="+Inf"} 1' in text
+		assert 'cryptostreamer_reconnects 2' in text
+		assert 'ignored' not in text and 'flag' not in text
+
+
+	def test_server_exposes_metrics(self):
+		metrics = Metrics()
+		metrics.count_message('heartbeat', 'ETH-USD')
+		server = MetricsServer(metrics, port=0, host='127.0.0.1')
+		server.start()
+		try:
+			body = urlopen('http://127.0.0.1:%d/metrics' % server.port, timeout=2).read().decode()
+			assert 'type="heartbeat",product_id="ETH-USD"' in body
+			with pytest.raises(HTTPError):
+				urlopen('http://127.0.0.1:%d/other' % server.port, timeout=2)
+		finally:
+			server.stop()
+
+
+	def test_client_counts_the_messages(self):
+		metrics = Metrics()
+		gdax = GdaxClient(['BTC-USD'], metrics=metrics)
+		gdax._handle_message({'type': 'match', 'product_id': 'BTC-USD'})
+		assert metrics.messages == {('match', 'BTC-USD'): 1}
+
+
+	def test_client_measures_the_ping_round_trip(self):
+		metrics = Metrics()
+		gdax = GdaxClient(['BTC-USD'], metrics=metrics)
+		gdax._ws = MagicMock()
+		gdax._ws.recv_data.side_effect = [(ABNF.OPCODE_PONG, b'keepalive'), (ABNF.OPCODE_TEXT, b'{"type":"heartbeat"}')]
+		gdax.on_heartbeat = MagicMock()
+		gdax._ping()
+		gdax._mainloop_recv_msg()
+
+		gdax.on_heartbeat.assert_called_once()
+		assert metrics.histogram('ping_rtt_seconds').count == 1
+
+
+	def test_producer_measures_the_ack_latency(self):
+		metrics = Metrics()
+		producer = GdaxKafkaProducer('gdax', {'products': ['BTC-USD'], 'metrics': metrics}, {})
+		producer._kafka_producer = MagicMock()
+		producer._process_frame('{"type": "match", "product_id": "BTC-USD"}')
+
+		assert metrics.histogram('recv_to_ack_seconds').count == 1
+		assert producer.stats()['kafka_send_errors'] == 0
@@ -0,0 +1,33 @@
+import pytest
+
+from cryptostreamer.partitioning import create_partitioner, parse_partition_map, message_headers, \
+	InvalidPartitionerError, RoundRobinPartitioner
+
+
+class TestPartitioning:
+
+	def test_product_is_the_default_strategy(self):
+		assert create_partitioner() is None
+		assert create_partitioner('product') is None
+
+
+	def test_unknown_or_incomplete_strategies_raise(self):
+		with pytest.raises(InvalidPartitionerError):
+			create_partitioner('random')
+		with pytest.raises(InvalidPartitionerError):
+			create_partitioner('map')
+
+
+	def test_round_robin_without_partitions_uses_the_kafka_partitioner(self):
+		assert RoundRobinPartitioner().route('BTC-USD', 7, []) == ('BTC-USD:7', None)
+
+
+	def test_parse_partition_map(self):
+		assert parse_partition_map(['BTC-USD:0', 'ETH-USD: 2']) == {'BTC-USD': 0, 'ETH-USD': 2}
+		assert parse_partition_map(None) is None
+		with pytest.raises(InvalidPartitionerError):
+			parse_partition_map(['BTC-USD'])
+
+
+	def test_message_headers_without_sequence(self):
+		assert message_headers('l2update', 'BTC-USD', None) == [('type', b'l2update'), ('product_id', b'BTC-USD')]
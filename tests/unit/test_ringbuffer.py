@@ -0,0 +1,75 @@
+import pytest
+from threading import Thread
+
+from cryptostreamer.ringbuffer import RingBuffer, RingBufferOverflowError, \
+	InvalidOverflowPolicyError
+
+
+class TestRingBuffer:
+
+	def test_items_are_returned_in_fifo_order(self):
+		buffer = RingBuffer(3)
+		for i in range(3): buffer.put(i)
+		assert [buffer.get(), buffer.get(), buffer.get()] == [0, 1, 2]
+		assert len(buffer) == 0
+
+
+	def test_indexes_wrap_around(self):
+		buffer = RingBuffer(2)
+		out = []
+		for i in range(5):
+			buffer.put(i)
+			out.append(buffer.get())
+		assert out == [0, 1, 2, 3, 4]
+
+
+	def test_get_returns_none_on_timeout(self):
+		assert RingBuffer(2).get(timeout=0.01) is None
+
+
+	def test_drop_oldest_overwrites_and_counts_dropped(self):
+		buffer = RingBuffer(2,'drop-oldest')
+		for i in range(4): buffer.put(i)
+		assert buffer.dropped == 2
+		assert [buffer.get(), buffer.get()] == [2, 3]
+
+
+	def test_disconnect_policy_raises_when_full(self):
+		buffer = RingBuffer(1,'disconnect')
+		buffer.put(1)
+		with pytest.raises(RingBufferOverflowError):
+			buffer.put(2)
+		assert buffer.dropped == 1
+
+
+	def test_block_policy_waits_for_consumer(self):
+		buffer = RingBuffer(1,'block')
+		buffer.put(1)
+		producer = Thread(target=buffer.put, args=(2,))
+		producer.start()
+		assert buffer.get() == 1
+		producer.join(1)
+		assert buffer.get(timeout=1) == 2
+
+
+	def test_closed_buffer_is_drained_then_returns_none(self):
+		buffer = RingBuffer(2)
+		buffer.put(1)
+		buffer.close()
+		assert buffer.put(2) is False
+		assert buffer.get() == 1
+		assert buffer.get() is None
+
+
+	def test_stats(self):
+		buffer = RingBuffer(4)
+		buffer.put(1); buffer.put(2); buffer.get()
+		stats = buffer.stats()
+		assert stats['buffer_depth'] == 1
+		assert stats['buffer_high_watermark'] == 2
+		assert stats['buffer_dropped'] == 0
+
+
+	def test_invalid_policy(self):
+		with pytest.raises(InvalidOverflowPolicyError):
+			RingBuffer(1,'whatever')
@@ -0,0 +1,200 @@
+import asyncio
+import io
+import os
+import json
+import socket
+import mock
+
+from cryptostreamer.provider import ProviderClient
+from cryptostreamer.sinks import Sink, StdoutSink, FileSink, UdpSink, KafkaSink, SinkRouter
+from cryptostreamer.exchanges import ExchangeClient, BitstampAdapter
+
+
+class ListSink(Sink):
+
+	def __init__(self):
+		self.batches = []
+		self.closed = False
+
+	def write_many(self, records):
+		self.batches.append(records)
+
+	def close(self):
+		self.closed = True
+
+
+MATCH = {'type': 'match', 'product_id': 'BTC-USD', 'price': '100.0', 'size': '0.1'}
+
+
+class TestSinks:
+
+	def test_stdout_sink_writes_newline_delimited_values(self):
+		stream = io.BytesIO()
+		sink = StdoutSink(stream)
+		sink.write_many([('BTC-USD', b'{"a":1}'), ('ETH-USD', b'{"a":2}')])
+		sink.write('BTC-USD', b'{"a":3}')
+		assert stream.getvalue() == b'{"a":1}\n{"a":2}\n{"a":3}\n'
+
+
+	def test_file_sink_rotates_files(self, tmpdir):
+		sink = FileSink(str(tmpdir), max_bytes=20)
+		sink.write_many([('k', b'0123456789'), ('k', b'0123456789')])
+		sink.write('k', b'abc')
+		sink.close()
+		files = sorted(os.listdir(str(tmpdir)))
+		assert files == ['gdax-000001.ndjson', 'gdax-000002.ndjson']
+		with open(os.path.join(str(tmpdir), files[1]), 'rb') as f:
+			assert f.read() == b'abc\n'
+
+
+	def test_file_sink_continues_after_the_last_file(self, tmpdir):
+		FileSink(str(tmpdir), max_bytes=1).close()
+		sink = FileSink(str(tmpdir), max_bytes=1)
+		assert sink.path.endswith('gdax-000002.ndjson')
+		sink.close()
+
+
+	def test_udp_sink_sends_a_datagram_per_value(self):
+		server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		server.bind(('127.0.0.1', 0))
+		server.settimeout(1)
+		sink = UdpSink('127.0.0.1', server.getsockname()[1])
+		sink.write_many([('k', b'one'), ('k', b'two')])
+		assert server.recv(64) == b'one'
+		assert server.recv(64) == b'two'
+		sink.close()
+		server.close()
+
+
+	def test_kafka_sink_sends_to_the_topic(self):
+		producer = mock.Mock()
+		sink = KafkaSink('gdax', kafka_producer=producer)
+		sink.write_many([('BTC-USD', b'1')])
+		sink.flush()
+		producer.send.assert_called_once_with('gdax', key='BTC-USD', value=b'1')
+		producer.flush.assert_called_once_with()
+
+
+
+class TestSinkRouter:
+
+	def test_fan_out_shares_the_encoded_batch(self):
+		a, b = ListSink(), ListSink()
+		router = SinkRouter([a, b], batch_size=2, codec='json')
+		router.add(MATCH)
+		assert a.batches == []
+		router.add(MATCH)
+		assert len(a.batches) == 1 and a.batches[0] is b.batches[0]
+		key, value = a.batches[0][0]
+		assert key == 'BTC-USD' and json.loads(value.decode()) == MATCH
+		assert router.stats()['sink_written'] == 2
+
+
+	def test_full_batches_are_written_without_flushing_the_sinks(self):
+		sink = ListSink()
+		sink.flush = mock.Mock()
+		router = SinkRouter([sink], batch_size=1, codec='json')
+		router.add(MATCH)
+		assert len(sink.batches) == 1
+		sink.flush.assert_not_called()
+		router.flush()
+		sink.flush.assert_called_once_with()
+
+
+	def test_batches_are_written_while_the_sinks_are_flushed(self):
+		from threading import Event, Thread
+		flushing, release = Event(), Event()
+		sink = ListSink()
+		def flush():
+			flushing.set()
+			release.wait(5)
+		sink.flush = flush
+		router = SinkRouter([sink], batch_size=1, codec='json')
+		thread = Thread(target=router.flush)
+		thread.start()
+		try:
+			assert flushing.wait(5)
+			adding = Thread(target=router.add, args=(MATCH,))
+			adding.start()
+			adding.join(1)
+			assert not adding.is_alive()
+			assert len(sink.batches) == 1
+		finally:
+			release.set()
+			thread.join()
+
+
+	def test_a_failing_sink_does_not_stop_the_others(self):
+		failing, sink = ListSink(), ListSink()
+		failing.write_many = mock.Mock(side_effect=IOError('disk full'))
+		router = SinkRouter([failing, sink], batch_size=1, codec='json')
+		router.add(MATCH)
+		assert len(sink.batches) == 1
+		assert router.stats()['sink_errors'] == 1
+
+
+	def test_skipped_types_are_not_written(self):
+		sink = ListSink()
+		router = SinkRouter([sink], batch_size=1, codec='json')
+		router.add({'type': 'heartbeat', 'product_id': 'BTC-USD'})
+		router.add({'type': 'subscriptions'})
+		assert sink.batches == []
+
+
+	def test_attach_wraps_the_client_callbacks(self):
+		sink = ListSink()
+		client = ProviderClient()
+		client.stop = mock.Mock()
+		on_message = client.on_message = mock.Mock()
+		SinkRouter([sink], codec='json').attach(client)
+
+		client.on_message(MATCH)
+		on_message.assert_called_once_with(MATCH)
+		assert sink.batches == []
+
+		client.stop()
+		assert len(sink.batches) == 1
+		assert sink.closed
+
+
+	def test_attach_awaits_the_callbacks_of_asyncio_clients(self):
+		from cryptostreamer.gdax.aio import AsyncGdaxClient
+		received = []
+		class Client(AsyncGdaxClient):
+			async def on_message(self, msg): received.append(msg)
+
+		sink = ListSink()
+		client = Client(['BTC-USD'])
+		client.add_timer = mock.Mock()
+		SinkRouter([sink], codec='json').attach(client)
+
+		async def run():
+			await client.on_message(MATCH)
+			await client.stop()
+		asyncio.run(run())
+
+		assert received == [MATCH]
+		assert len(sink.batches) == 1
+		assert sink.closed
+		client.add_timer.assert_not_called()
+
+
+	def test_attach_flushes_on_the_client_timers(self):
+		client = ProviderClient()
+		client.add_timer = mock.Mock()
+		SinkRouter([ListSink()], max_delay=2.0).attach(client)
+		client.add_timer.assert_called_once_with(2.0, mock.ANY)
+
+
+	def test_a_single_trade_is_written_by_the_flush_timer(self):
+		from time import monotonic
+		sink = ListSink()
+		router = SinkRouter([sink], max_delay=0.5, codec='json')
+		client = ExchangeClient(BitstampAdapter(), ['BTC-USD'])
+		router.schedule_flush(client)
+
+		router.add(MATCH)
+		client._timers.run_pending(monotonic() + 0.4)
+		assert sink.batches == []
+		client._timers.run_pending(monotonic() + 0.5)
+		assert len(sink.batches) == 1
@@ -0,0 +1,156 @@
+import os
+import pytest
+from time import sleep
+
+from cryptostreamer.spool import Spool, SpoolDrainer, pack_record, unpack_record, \
+	RecordTooLargeError, InvalidSpoolSizeError, HEADER
+
+
+def drain(spool):
+	out = []
+	while True:
+		payload = spool.peek()
+		if payload is None: return out
+		out.append(payload)
+		spool.advance()
+
+
+class TestSpool:
+
+	def test_records_are_read_in_order(self, tmpdir):
+		spool = Spool(str(tmpdir), segment_size=1024)
+		for i in range(5): spool.append(b'record-%d' % i)
+		assert len(spool) == 5
+		assert drain(spool) == [b'record-%d' % i for i in range(5)]
+		assert len(spool) == 0
+		spool.close()
+
+
+	def test_segments_are_rotated_and_removed_when_read(self, tmpdir):
+		spool = Spool(str(tmpdir), segment_size=64)
+		payloads = [bytes([i]) * 20 for i in range(10)]
+		for p in payloads: spool.append(p)
+		assert len([f for f in os.listdir(str(tmpdir)) if f.endswith('.seg')]) == 5
+		assert drain(spool) == payloads
+		assert len([f for f in os.listdir(str(tmpdir)) if f.endswith('.seg')]) == 1
+		spool.close()
+
+
+	def test_committed_offset_survives_a_restart(self, tmpdir):
+		spool = Spool(str(tmpdir), segment_size=64)
+		for i in range(6): spool.append(b'r%d' % i)
+		spool.peek(); spool.advance()
+		spool.commit()
+		spool.peek(); spool.advance()
+		spool.close()
+
+		spool = Spool(str(tmpdir), segment_size=64)
+		assert len(spool) == 4
+		spool.append(b'r6')
+		assert drain(spool) == [b'r2', b'r3', b'r4', b'r5', b'r6']
+		spool.close()
+
+
+	def test_uncommitted_reads_are_replayed_after_a_crash(self, tmpdir):
+		spool = Spool(str(tmpdir), segment_size=1024)
+		spool.append(b'a'); spool.append(b'b')
+		spool.peek(); spool.advance()
+		spool._segment(spool._write_id).mm.flush()
+
+		recovered = Spool(str(tmpdir), segment_size=1024)
+		assert drain(recovered) == [b'a', b'b']
+
+
+	def test_torn_write_is_ignored(self, tmpdir):
+		spool = Spool(str(tmpdir), segment_size=1024)
+		spool.append(b'good')
+		segment = spool._segment(spool._write_id)
+		HEADER.pack_into(segment.mm, spool._write_pos, 5, 1234)
+		segment.mm.flush()
+
+		recovered = Spool(str(tmpdir), segment_size=1024)
+		assert drain(recovered) == [b'good']
+
+
+	def test_disk_usage_is_bounded(self, tmpdir):
+		spool = Spool(str(tmpdir), segment_size=64, max_bytes=128)
+		for i in range(10): spool.append(bytes([i]) * 20)
+		assert spool.stats()['spool_dropped_segments'] == 3
+		assert len(spool) == 4
+		assert drain(spool) == [bytes([i]) * 20 for i in range(6, 10)]
+
+
+	def test_a_record_dropped_while_being_drained_does_not_skip_the_next(self, tmpdir):
+		spool = Spool(str(tmpdir), segment_size=64, max_bytes=128)
+		spool.append(b'a' * 20)
+		assert spool.peek() == b'a' * 20
+		for i in range(4): spool.append(bytes([i]) * 20)
+		assert spool.stats()['spool_dropped_segments'] == 1
+		spool.advance()
+		assert drain(spool) == [bytes([i]) * 20 for i in range(1, 4)]
+
+
+	def test_offset_past_the_last_segment_resets_to_the_first(self, tmpdir):
+		spool = Spool(str(tmpdir), segment_size=64)
+		for i in range(6): spool.append(bytes([i]) * 20)
+		drain(spool)
+		spool.close()
+		for f in os.listdir(str(tmpdir)):
+			if f.endswith('.seg'): os.remove(str(tmpdir.join(f)))
+
+		recovered = Spool(str(tmpdir), segment_size=64)
+		assert len(recovered) == 0
+		recovered.append(b'x')
+		assert drain(recovered) == [b'x']
+
+
+	def test_max_bytes_must_hold_two_segments(self, tmpdir):
+		with pytest.raises(InvalidSpoolSizeError):
+			Spool(str(tmpdir), segment_size=64, max_bytes=100)
+
+
+	def test_record_too_large(self, tmpdir):
+		spool = Spool(str(tmpdir), segment_size=64)
+		with pytest.raises(RecordTooLargeError):
+			spool.append(b'x' * 64)
+
+
+	def test_append_if_pending(self, tmpdir):
+		spool = Spool(str(tmpdir), segment_size=1024)
+		assert not spool.append_if_pending(b'a')
+		spool.append(b'a')
+		assert spool.append_if_pending(b'b')
+		assert drain(spool) == [b'a', b'b']
+
+
+	def test_pack_record(self):
+		assert unpack_record(pack_record('gdax', 'BTC-USD', b'{}')) == ('gdax', 'BTC-USD', b'{}', None, None)
+		headers = [('type', b'match'), ('recv_ts', b'1')]
+		assert unpack_record(pack_record('gdax', 'BTC-USD:1', b'{}', 3, headers)) == \
+			('gdax', 'BTC-USD:1', b'{}', 3, headers)
+		assert unpack_record(pack_record('gdax', 'BTC-USD', b'{}', None, headers))[3] is None
+
+
+
+class TestSpoolDrainer:
+
+	def test_records_are_retried_until_sent(self, tmpdir):
+		spool = Spool(str(tmpdir), segment_size=1024)
+		for i in range(3): spool.append(b'%d' % i)
+		sent = []
+		attempts = []
+		def send(payload):
+			attempts.append(payload)
+			if len(attempts) == 1: raise IOError('broker down')
+			sent.append(payload)
+
+		drainer = SpoolDrainer(spool, send, retry_interval=0.01)
+		drainer.start()
+		for _ in range(100):
+			if len(sent) == 3: break
+			sleep(0.01)
+		drainer.stop()
+
+		assert sent == [b'0', b'1', b'2']
+		assert drainer.failures == 1
+		assert len(spool) == 0
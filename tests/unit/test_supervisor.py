@@ -0,0 +1,70 @@
+import pytest
+from threading import Thread
+from time import sleep
+from mock import MagicMock
+
+from cryptostreamer.supervisor import ShardSupervisor, partition_products, NoShardsError, _run_shard
+
+
+class FakeShardClient(object):
+	def __init__(self, products):
+		self._products = products
+
+	def stats(self):
+		return {'messages': len(self._products), 'connected': True}
+
+	def start(self):
+		sleep(0.2)
+
+
+def create_fake_client(products):
+	return FakeShardClient(products)
+
+
+class TestShardSupervisor:
+
+	def test_products_are_partitioned_round_robin(self):
+		products = ['BTC-USD','ETH-USD','LTC-USD','BCH-USD','BTC-EUR']
+		partitions = partition_products(products, 2)
+		assert len(partitions) == 2
+		assert sorted(partitions[0] + partitions[1]) == sorted(products)
+		assert abs(len(partitions[0]) - len(partitions[1])) <= 1
+
+
+	def test_empty_shards_are_removed(self):
+		assert partition_products(['BTC-USD','BTC-USD'], 4) == [['BTC-USD']]
+
+
+	def test_at_least_one_shard(self):
+		with pytest.raises(NoShardsError):
+			partition_products(['BTC-USD'], 0)
+
+
+	def test_dead_shards_are_restarted_and_stats_aggregated(self):
+		supervisor = ShardSupervisor(create_fake_client, ['BTC-USD','ETH-USD','LTC-USD'], 2,
+									 report_interval=0.05, restart_delay=0)
+		thread = Thread(target=supervisor.start)
+		thread.start()
+		try:
+			sleep(1)
+			stats = supervisor.stats()
+		finally:
+			supervisor.stop()
+			thread.join()
+
+		assert len(stats['shards']) == 2
+		assert stats['restarts'] >= 2
+		assert stats['totals']['messages'] == 3
+		assert 'connected' not in stats['totals']
+
+
+	def test_the_shard_id_is_passed_to_the_factory(self):
+		created = []
+		class Client(FakeShardClient):
+			def start(self): pass
+		def factory(products, shard_id):
+			created.append((products, shard_id))
+			return Client(products)
+
+		_run_shard(factory, ['BTC-USD'], 3, MagicMock(), 60, shard_id_arg='shard_id')
+		assert created == [(['BTC-USD'], 3)]
@@ -0,0 +1,63 @@
+from threading import Event
+
+from cryptostreamer.timers import TimerScheduler
+
+
+class FakeClock(object):
+
+	def __init__(self):
+		self.now = 100.0
+
+	def __call__(self):
+		return self.now
+
+
+class TestTimerScheduler:
+
+	def test_timers_run_at_their_intervals(self):
+		clock, calls = FakeClock(), []
+		timers = TimerScheduler(clock=clock)
+		timers.schedule(1.0, lambda: calls.append('a'))
+		timers.schedule(2.5, lambda: calls.append('b'))
+
+		assert timers.run_pending() == 1.0
+		assert calls == []
+		clock.now = 101.0
+		timers.run_pending()
+		clock.now = 102.0
+		timers.run_pending()
+		clock.now = 102.5
+		assert timers.run_pending() == 0.5
+		assert calls == ['a', 'a', 'b']
+
+
+	def test_missed_runs_are_skipped(self):
+		clock, calls = FakeClock(), []
+		timers = TimerScheduler(clock=clock)
+		timers.schedule(1.0, lambda: calls.append(clock.now))
+		clock.now = 110.5
+		assert timers.run_pending() == 1.0
+		assert calls == [110.5]
+
+
+	def test_cancelled_timers_and_failing_callbacks(self):
+		clock, calls = FakeClock(), []
+		timers = TimerScheduler(clock=clock)
+		timers.schedule(1.0, lambda: calls.append('a')).cancel()
+		timers.schedule(1.0, lambda: 1 / 0)
+		clock.now = 101.0
+		timers.run_pending()
+		assert calls == []
+		assert timers.stats() == {'timer_runs': 1, 'timer_errors': 1}
+
+
+	def test_thread_runs_the_timers_until_stopped(self):
+		ran = Event()
+		timers = TimerScheduler()
+		timers.schedule(0.01, ran.set)
+		timers.start()
+		try:
+			assert ran.wait(2)
+		finally:
+			timers.stop()
+		assert not timers.running